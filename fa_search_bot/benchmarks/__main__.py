@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import pathlib
+import sys
+from typing import Optional, TextIO, Tuple
+
+import click
+
+from fa_search_bot.benchmarks.corpus import (
+    CORPUS_FILE,
+    SOURCE_GENERATED,
+    SOURCE_RECORDED,
+    generate_corpus,
+    load_corpus,
+    record_corpus,
+    save_corpus,
+)
+from fa_search_bot.benchmarks.memory import run_memory_benchmark, save_memory_results
+from fa_search_bot.benchmarks.runner import (
+    MODE_BATCH,
+    MODE_MATCH,
+    MODES,
+    compare_results,
+    generate_subscription_set,
+    load_subscription_set,
+    run_benchmark,
+    save_results,
+)
+from fa_search_bot.sites.furaffinity.fa_export_api import FAExportAPI
+from fa_search_bot.subscriptions.data_fetcher import DataFetcher
+
+
+@click.group()
+@click.option("--log-level", type=str, help="Log level for the logger", default="WARNING")
+def cli(log_level: str) -> None:
+    logging.basicConfig(stream=sys.stderr, level=log_level.upper())
+
+
+@cli.command()
+@click.option("--size", "sizes", type=int, multiple=True, default=[1_000, 10_000], help="Number of synthetic subscriptions to benchmark, can be given multiple times, e.g. --size 100000")
+@click.option("--subscriptions-file", type=str, default=None, help="Benchmark a saved subscriptions.json file, rather than synthetic subscriptions")
+@click.option("--mode", "modes", type=click.Choice(MODES), multiple=True, default=[MODE_MATCH, MODE_BATCH], help="Matching modes to benchmark, can be given multiple times")
+@click.option("--corpus", type=click.Path(exists=True, path_type=pathlib.Path), default=CORPUS_FILE, help="Corpus of submissions to match")
+@click.option("--seed", type=int, default=0, help="Seed for generating synthetic subscriptions")
+@click.option("--batch-size", type=int, default=DataFetcher.MATCH_BATCH_SIZE, help="Number of submissions per batch, in batch mode")
+@click.option("--repeat", type=int, default=3, help="Number of times to match the corpus in each mode")
+@click.option("--memory/--no-memory", default=True, help="Whether to measure memory usage, which means building the matcher again")
+@click.option("--output", type=str, default=None, help="File to save the results to as json, for comparing against later")
+def run(
+    sizes: Tuple[int, ...],
+    subscriptions_file: Optional[str],
+    modes: Tuple[str, ...],
+    corpus: pathlib.Path,
+    seed: int,
+    batch_size: int,
+    repeat: int,
+    memory: bool,
+    output: Optional[str],
+) -> None:
+    """
+    Benchmarks subscription matching against a corpus of submissions, without needing any network access
+    """
+    targets = load_corpus(corpus)
+    click.echo(f"Loaded {len(targets)} submissions from {corpus}")
+    if subscriptions_file is not None:
+        subscription_sets = [(subscriptions_file, load_subscription_set(subscriptions_file))]
+    else:
+        subscription_sets = [(f"synthetic-{size}", generate_subscription_set(size, seed)) for size in sizes]
+    results = []
+    for name, subscription_set in subscription_sets:
+        result = run_benchmark(name, subscription_set, targets, modes, batch_size, repeat, memory)
+        click.echo(result.describe())
+        results.append(result)
+    if output is not None:
+        save_results(results, output)
+
+
+@cli.command()
+@click.option("--size", type=int, default=10_000, help="Number of synthetic subscriptions to match against")
+@click.option("--subscriptions-file", type=str, default=None, help="Match against a saved subscriptions.json file, rather than synthetic subscriptions")
+@click.option("--submissions", type=int, default=20_000, help="Number of freshly generated submissions to check")
+@click.option("--interval", type=int, default=2_000, help="Number of submissions between memory samples")
+@click.option("--seed", type=int, default=0, help="Seed for generating synthetic subscriptions and submissions")
+@click.option("--batch-size", type=int, default=DataFetcher.MATCH_BATCH_SIZE, help="Number of submissions per batch")
+@click.option("--trace/--no-trace", default=True, help="Whether to trace python allocations, which slows matching")
+@click.option("--output", type=str, default=None, help="File to save the results to as json")
+def memory(
+    size: int,
+    subscriptions_file: Optional[str],
+    submissions: int,
+    interval: int,
+    seed: int,
+    batch_size: int,
+    trace: bool,
+    output: Optional[str],
+) -> None:
+    """
+    Checks thousands of submissions, sampling resident memory, to show whether checked submissions are freed
+    """
+    if subscriptions_file is not None:
+        name, subscription_set = subscriptions_file, load_subscription_set(subscriptions_file)
+    else:
+        name, subscription_set = f"synthetic-{size}", generate_subscription_set(size, seed)
+    result = run_memory_benchmark(name, subscription_set, submissions, interval, batch_size, seed, trace)
+    click.echo(result.describe())
+    if output is not None:
+        save_memory_results([result], output)
+
+
+@cli.command()
+@click.argument("baseline", type=click.File("r"))
+@click.argument("current", type=click.File("r"))
+def compare(baseline: TextIO, current: TextIO) -> None:
+    """
+    Compares two results files saved by the run command
+    """
+    for line in compare_results(json.load(baseline), json.load(current)):
+        click.echo(line)
+
+
+@cli.command()
+@click.option("--api-url", type=str, default="https://faexport.spangle.org.uk", help="URL of the FAExport API")
+@click.option("--pages", type=int, default=5, help="Number of browse pages of submissions to record")
+@click.option("--output", type=click.Path(path_type=pathlib.Path), default=CORPUS_FILE, help="File to save the corpus to")
+def record(api_url: str, pages: int, output: pathlib.Path) -> None:
+    """
+    Records a corpus of the latest submissions from FA, to benchmark against
+    """
+
+    async def _record() -> None:
+        fa_api = FAExportAPI(api_url)
+        try:
+            targets = await record_corpus(fa_api, pages)
+        finally:
+            await fa_api.close()
+        save_corpus(targets, SOURCE_RECORDED, output)
+        click.echo(f"Recorded {len(targets)} submissions to {output}")
+
+    asyncio.run(_record())
+
+
+@cli.command()
+@click.option("--count", type=int, default=300, help="Number of submissions to generate")
+@click.option("--seed", type=int, default=0, help="Seed for generating the submissions")
+@click.option("--output", type=click.Path(path_type=pathlib.Path), default=CORPUS_FILE, help="File to save the corpus to")
+def generate(count: int, seed: int, output: pathlib.Path) -> None:
+    """
+    Generates a synthetic corpus of submissions, for when FA cannot be reached
+    """
+    save_corpus(generate_corpus(count, seed), SOURCE_GENERATED, output)
+    click.echo(f"Generated {count} submissions to {output}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import json
+import logging
+import pathlib
+from typing import TYPE_CHECKING
+
+from fa_search_bot.benchmarks.generator import SubmissionGenerator
+from fa_search_bot.subscriptions.query_target import QueryTarget
+
+if TYPE_CHECKING:
+    from typing import List
+
+    from fa_search_bot.sites.furaffinity.fa_export_api import FAExportAPI
+
+logger = logging.getLogger(__name__)
+
+CORPUS_FILE = pathlib.Path(__file__).parent / "corpus.json"
+SOURCE_GENERATED = "generated"
+SOURCE_RECORDED = "recorded"
+
+
+def load_corpus(path: pathlib.Path = CORPUS_FILE) -> List[QueryTarget]:
+    with open(path, "r") as f:
+        data = json.load(f)
+    return [QueryTarget.from_json(sub) for sub in data["submissions"]]
+
+
+def save_corpus(targets: List[QueryTarget], source: str, path: pathlib.Path = CORPUS_FILE) -> None:
+    with open(path, "w") as f:
+        json.dump({"source": source, "submissions": [target.to_json() for target in targets]}, f, indent=1)
+        f.write("\n")
+
+
+def generate_corpus(count: int, seed: int = 0) -> List[QueryTarget]:
+    return SubmissionGenerator(seed).generate(count)
+
+
+async def record_corpus(fa_api: FAExportAPI, pages: int) -> List[QueryTarget]:
+    """
+    Records the most recent submissions on FA, by fetching the full submission for everything on the browse pages
+    """
+    targets = []
+    for page in range(1, pages + 1):
+        browse_page = await fa_api.get_browse_page(page)
+        for sub_short in browse_page:
+            # noinspection PyBroadException
+            try:
+                sub = await fa_api.get_full_submission(sub_short.submission_id)
+            except Exception as e:
+                logger.warning("Could not fetch submission %s for the corpus", sub_short.submission_id, exc_info=e)
+                continue
+            targets.append(sub.to_query_target())
+        logger.info("Recorded %s submissions from %s browse pages", len(targets), page)
+    return targets
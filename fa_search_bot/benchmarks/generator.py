@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import itertools
+import random
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from fa_search_bot.benchmarks.vocabulary import COLOURS, FILLER, SPECIES, SYLLABLES, THEMES
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Sequence
+
+TAGS = SPECIES + THEMES
+# Single words, which can be used without quotes or as wildcard stems
+TAG_WORDS = [tag for tag in TAGS if " " not in tag and "-" not in tag]
+PHRASES = [tag for tag in TAGS if " " in tag] + [f"{colour} {species}" for colour in COLOURS for species in SPECIES[:10]]
+BLOCK_QUERIES = [
+    "rating:adult",
+    "-rating:general",
+    "vore",
+    "inflation",
+    "tf or transformation",
+    "ych",
+    "adoptable or raffle",
+    "macro or micro",
+    "rating:adult (latex or goo)",
+    "keywords:gif",
+]
+
+
+class WeightedChooser:
+    """
+    Picks items with a Zipf-like distribution, so that the first items in a list are much more common than the last
+    """
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        self._cum_weights: Dict[int, List[float]] = {}
+
+    def choice(self, items: Sequence[str]) -> str:
+        cum_weights = self._cum_weights.get(len(items))
+        if cum_weights is None:
+            cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(items))))
+            self._cum_weights[len(items)] = cum_weights
+        return self.rng.choices(items, cum_weights=cum_weights)[0]
+
+
+def artist_names(count: int = 500, seed: int = 0) -> List[str]:
+    """
+    Generates a stable pool of artist names, shared by generated subscriptions and submissions, so that artist queries
+    find matches
+    """
+    rng = random.Random(f"artists-{seed}")
+    names: List[str] = []
+    seen = set()
+    while len(names) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.2:
+            name += str(rng.randint(1, 99))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+@dataclass
+class SubscriptionSet:
+    subscriptions: List[Subscription]
+    blocklists: Dict[int, DestinationBlocklist]
+
+    def count_blocks(self) -> int:
+        return sum(blocklist.count_blocks() for blocklist in self.blocklists.values())
+
+
+class SubscriptionGenerator:
+    """
+    Generates a synthetic set of subscription queries, with a mix of the query features which real users write: mostly
+    single tags and artists, along with phrases, wildcards, field restrictions, negations, ratings, and exceptions.
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        self.rng = random.Random(f"subscriptions-{seed}")
+        self.chooser = WeightedChooser(self.rng)
+        self.artists = artist_names(seed=seed)
+        self.query_types: List[Callable[[], str]] = [
+            self.word_query,
+            self.artist_query,
+            self.and_query,
+            self.or_query,
+            self.phrase_query,
+            self.affix_query,
+            self.wildcard_query,
+            self.field_query,
+            self.negation_query,
+            self.rating_query,
+            self.exception_query,
+            self.complex_query,
+        ]
+        self.query_weights = [35, 15, 10, 8, 7, 6, 2, 7, 6, 8, 2, 4]
+
+    def word(self) -> str:
+        return self.chooser.choice(TAG_WORDS)
+
+    def artist(self) -> str:
+        return self.chooser.choice(self.artists)
+
+    def word_query(self) -> str:
+        return self.word()
+
+    def artist_query(self) -> str:
+        if self.rng.random() < 0.8:
+            return f"artist:{self.artist()}"
+        return " or ".join(f"artist:{self.artist()}" for _ in range(self.rng.randint(2, 4)))
+
+    def and_query(self) -> str:
+        return " ".join(self.word() for _ in range(self.rng.randint(2, 3)))
+
+    def or_query(self) -> str:
+        return " or ".join(self.word() for _ in range(self.rng.randint(2, 4)))
+
+    def phrase_query(self) -> str:
+        return f'"{self.chooser.choice(PHRASES)}"'
+
+    def affix_query(self) -> str:
+        word = self.word()
+        length = max(2, len(word) - self.rng.randint(1, 3))
+        if self.rng.random() < 0.7:
+            return word[:length] + "*"
+        return "*" + word[-length:]
+
+    def wildcard_query(self) -> str:
+        word = self.word()
+        if len(word) < 4:
+            return word + "*"
+        middle = self.rng.randint(1, len(word) - 2)
+        return word[:middle] + "*" + word[middle + 1:]
+
+    def field_query(self) -> str:
+        field = self.rng.choice(["title", "keywords", "description"])
+        return f"{field}:{self.word()}"
+
+    def negation_query(self) -> str:
+        negations = " ".join(f"-{self.word()}" for _ in range(self.rng.randint(1, 3)))
+        return f"{self.word()} {negations}"
+
+    def rating_query(self) -> str:
+        rating = self.rng.choice(["rating:adult", "-rating:general", "rating:general", "rating:mature"])
+        return f"{self.word()} {rating}"
+
+    def exception_query(self) -> str:
+        word = self.word()
+        return f'{word} except "{self.rng.choice(COLOURS)} {word}"'
+
+    def complex_query(self) -> str:
+        options = " or ".join(self.word() for _ in range(2))
+        return f"({options}) {self.phrase_query()} -{self.word()} -rating:general"
+
+    def query(self) -> str:
+        return self.rng.choices(self.query_types, weights=self.query_weights)[0]()
+
+    def generate(self, count: int) -> SubscriptionSet:
+        """
+        Generates the given number of subscriptions, spread across destinations so that most destinations have a
+        handful of subscriptions, with some destinations having blocklists too.
+        """
+        num_destinations = max(1, count // 4)
+        destinations = [str(-100_000_000 - num) for num in range(num_destinations)]
+        subscriptions: Dict[Subscription, None] = {}
+        while len(subscriptions) < count:
+            destination = int(self.chooser.choice(destinations))
+            subscriptions.setdefault(Subscription(self.query(), destination))
+        blocklists: Dict[int, DestinationBlocklist] = {}
+        for destination_str in destinations:
+            if self.rng.random() >= 0.3:
+                continue
+            destination = int(destination_str)
+            blocks = self.rng.sample(BLOCK_QUERIES, self.rng.randint(1, 3))
+            blocklists[destination] = DestinationBlocklist.from_query(destination, blocks[0])
+            for block in blocks[1:]:
+                blocklists[destination].add(block)
+        return SubscriptionSet(list(subscriptions), blocklists)
+
+
+class SubmissionGenerator:
+    """
+    Generates synthetic submissions, with titles, tags, and descriptions drawn from the same vocabulary as the
+    generated subscriptions
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        self.rng = random.Random(f"submissions-{seed}")
+        self.chooser = WeightedChooser(self.rng)
+        self.artists = artist_names(seed=seed)
+
+    def tag(self) -> str:
+        # Submissions are spread across all tags, whereas subscriptions favour the popular ones
+        return self.rng.choice(TAGS)
+
+    def text(self, min_words: int, max_words: int, tag_rate: float) -> str:
+        words = []
+        for _ in range(self.rng.randint(min_words, max_words)):
+            roll = self.rng.random()
+            if roll < tag_rate:
+                words.append(self.tag())
+            elif roll < tag_rate + 0.05:
+                words.append(self.rng.choice(COLOURS))
+            else:
+                words.append(self.chooser.choice(FILLER))
+        text = " ".join(words)
+        return text[:1].upper() + text[1:]
+
+    def submission(self, submission_id: int) -> QueryTarget:
+        artist = self.chooser.choice(self.artists)
+        keywords = list(dict.fromkeys(self.tag().replace(" ", "_") for _ in range(self.rng.randint(3, 15))))
+        description = self.text(5, 150, 0.05)
+        if self.rng.random() < 0.3:
+            description += f"\n\nCommissioned by {self.chooser.choice(self.artists)}. Thanks for looking!"
+        rating = self.rng.choices([Rating.GENERAL, Rating.MATURE, Rating.ADULT], weights=[60, 15, 25])[0]
+        return QueryTarget(
+            SubmissionID("fa", str(submission_id)),
+            [self.text(1, 6, 0.3)],
+            [description],
+            keywords,
+            [artist, artist.title()],
+            rating,
+        )
+
+    def generate(self, count: int, first_id: int = 50_000_000) -> List[QueryTarget]:
+        return [self.submission(first_id + num) for num in range(count)]
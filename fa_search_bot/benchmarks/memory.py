@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import gc
+import json
+import logging
+import os
+import resource
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from fa_search_bot.benchmarks.generator import SubmissionGenerator
+from fa_search_bot.benchmarks.runner import build_matcher
+from fa_search_bot.subscriptions.query_target import QueryTarget
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, List
+
+    from fa_search_bot.benchmarks.generator import SubscriptionSet
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_bytes() -> int:
+    """
+    Current resident set size of this process. Falls back to the peak resident size where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # On linux, ru_maxrss is in kilobytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def count_live_query_targets() -> int:
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, QueryTarget))
+
+
+@dataclass
+class MemorySample:
+    submissions: int
+    rss_bytes: int
+    traced_bytes: int
+    live_targets: int
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "submissions": self.submissions,
+            "rss_bytes": self.rss_bytes,
+            "traced_bytes": self.traced_bytes,
+            "live_targets": self.live_targets,
+        }
+
+
+@dataclass
+class MemoryResult:
+    name: str
+    subscriptions: int
+    samples: List[MemorySample] = field(default_factory=list)
+
+    @property
+    def rss_growth_bytes(self) -> int:
+        """
+        Growth in resident size between the first sample, taken after warming up, and the last
+        """
+        if len(self.samples) < 2:
+            return 0
+        return self.samples[-1].rss_bytes - self.samples[0].rss_bytes
+
+    @property
+    def traced_growth_bytes(self) -> int:
+        if len(self.samples) < 2:
+            return 0
+        return self.samples[-1].traced_bytes - self.samples[0].traced_bytes
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "subscriptions": self.subscriptions,
+            "rss_growth_bytes": self.rss_growth_bytes,
+            "traced_growth_bytes": self.traced_growth_bytes,
+            "samples": [sample.to_json() for sample in self.samples],
+        }
+
+    def describe(self) -> str:
+        lines = [f"{self.name}: {self.subscriptions} subscriptions"]
+        for sample in self.samples:
+            lines.append(
+                f"  after {sample.submissions:>8} submissions: rss {sample.rss_bytes / 1024 / 1024:.1f}MiB, "
+                f"traced {sample.traced_bytes / 1024 / 1024:.1f}MiB, {sample.live_targets} live query targets"
+            )
+        lines.append(
+            f"  growth: rss {self.rss_growth_bytes / 1024 / 1024:+.1f}MiB, "
+            f"traced {self.traced_growth_bytes / 1024 / 1024:+.1f}MiB"
+        )
+        return "\n".join(lines)
+
+
+def run_memory_benchmark(
+    name: str,
+    subscription_set: SubscriptionSet,
+    submissions: int,
+    interval: int = 1_000,
+    batch_size: int = 10,
+    seed: int = 0,
+    trace: bool = True,
+) -> MemoryResult:
+    """
+    Checks a stream of freshly generated submissions against the subscriptions, in batches as the DataFetcher does,
+    dropping each batch once it is matched. Samples resident and traced memory every interval submissions, so that
+    anything which keeps submissions alive after they have been checked shows up as steady growth.
+    """
+    matcher = build_matcher(subscription_set)
+    generator = SubmissionGenerator(seed)
+    result = MemoryResult(name, len(subscription_set.subscriptions))
+    if trace:
+        tracemalloc.start()
+    try:
+        checked = 0
+        next_sample = interval
+        while checked < submissions:
+            count = min(batch_size, submissions - checked)
+            batch = generator.generate(count, first_id=50_000_000 + checked)
+            matcher.match_batch(batch)
+            checked += count
+            del batch
+            if checked >= next_sample or checked == submissions:
+                gc.collect()
+                traced_bytes, _ = tracemalloc.get_traced_memory() if trace else (0, 0)
+                sample = MemorySample(checked, current_rss_bytes(), traced_bytes, count_live_query_targets())
+                logger.info("Memory after %s submissions: %s", checked, sample)
+                result.samples.append(sample)
+                next_sample += interval
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return result
+
+
+def save_memory_results(results: List[MemoryResult], filename: str) -> None:
+    with open(filename, "w") as f:
+        json.dump({"memory_results": [result.to_json() for result in results]}, f, indent=2)
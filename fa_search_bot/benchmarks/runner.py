@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import gc
+import json
+import logging
+import resource
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from fa_search_bot.benchmarks.generator import SubscriptionGenerator, SubscriptionSet
+from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+from fa_search_bot.subscriptions.subscription_matcher import SubscriptionMatcher
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Sequence, Set
+
+    from fa_search_bot.subscriptions.query_target import QueryTarget
+
+logger = logging.getLogger(__name__)
+
+MODE_NAIVE = "naive"
+MODE_MATCH = "match"
+MODE_BATCH = "batch"
+MODES = [MODE_NAIVE, MODE_MATCH, MODE_BATCH]
+
+
+def generate_subscription_set(count: int, seed: int = 0) -> SubscriptionSet:
+    return SubscriptionGenerator(seed).generate(count)
+
+
+def load_subscription_set(filename: str) -> SubscriptionSet:
+    """
+    Loads the subscriptions and blocklists from a saved subscriptions.json file, in the same way as the
+    SubscriptionWatcher does
+    """
+    with open(filename, "r") as f:
+        data = json.load(f)
+    subscriptions = set()
+    blocklists = {}
+    for dest, value in data["destinations"].items():
+        dest_id = int(dest)
+        for subscription in value["subscriptions"]:
+            subscriptions.add(Subscription.from_json_new_format(subscription, dest_id))
+        if value["blocks"]:
+            blocklists[dest_id] = DestinationBlocklist.from_json(dest_id, value["blocks"])
+    return SubscriptionSet(list(subscriptions), blocklists)
+
+
+def build_matcher(subscription_set: SubscriptionSet) -> SubscriptionMatcher:
+    matcher = SubscriptionMatcher(subscription_set.blocklists)
+    matcher.rebuild(subscription_set.subscriptions)
+    return matcher
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[index]
+
+
+@dataclass
+class ModeResult:
+    mode: str
+    latencies_ns: List[int] = field(default_factory=list)
+    total_ns: int = 0
+    matches: int = 0
+
+    @property
+    def submissions(self) -> int:
+        return len(self.latencies_ns)
+
+    @property
+    def submissions_per_second(self) -> float:
+        return self.submissions / (self.total_ns / 1e9) if self.total_ns else 0
+
+    @property
+    def matches_per_second(self) -> float:
+        return self.matches / (self.total_ns / 1e9) if self.total_ns else 0
+
+    def latency_ms(self, percent: float) -> float:
+        return percentile(self.latencies_ns, percent) / 1e6
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "submissions": self.submissions,
+            "matches": self.matches,
+            "submissions_per_second": self.submissions_per_second,
+            "matches_per_second": self.matches_per_second,
+            "p50_ms": self.latency_ms(50),
+            "p99_ms": self.latency_ms(99),
+        }
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    subscriptions: int
+    distinct_queries: int
+    blocks: int
+    build_seconds: float
+    modes: List[ModeResult] = field(default_factory=list)
+    matcher_memory_bytes: int = 0
+    peak_memory_bytes: int = 0
+    max_rss_bytes: int = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "subscriptions": self.subscriptions,
+            "distinct_queries": self.distinct_queries,
+            "blocks": self.blocks,
+            "build_seconds": self.build_seconds,
+            "modes": [mode.to_json() for mode in self.modes],
+            "matcher_memory_bytes": self.matcher_memory_bytes,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "max_rss_bytes": self.max_rss_bytes,
+        }
+
+    def describe(self) -> str:
+        lines = [
+            f"{self.name}: {self.subscriptions} subscriptions, {self.distinct_queries} distinct queries, "
+            f"{self.blocks} blocks, built in {self.build_seconds:.2f}s",
+        ]
+        for mode in self.modes:
+            lines.append(
+                f"  {mode.mode:>6}: {mode.submissions_per_second:10.1f} submissions/s, "
+                f"{mode.matches_per_second:10.1f} matches/s, "
+                f"p50 {mode.latency_ms(50):8.3f}ms, p99 {mode.latency_ms(99):8.3f}ms"
+            )
+        if self.peak_memory_bytes:
+            lines.append(
+                f"  memory: matcher {self.matcher_memory_bytes / 2**20:.1f}MiB, "
+                f"peak {self.peak_memory_bytes / 2**20:.1f}MiB, max RSS {self.max_rss_bytes / 2**20:.1f}MiB"
+            )
+        return "\n".join(lines)
+
+
+def _naive_matcher(subscription_set: SubscriptionSet) -> Callable[[QueryTarget], List[Subscription]]:
+    # Checks every subscription against every submission, as the subscription watcher used to
+    blocklist_queries = {dest: blocklist.as_compiled_query() for dest, blocklist in subscription_set.blocklists.items()}
+
+    def match(target: QueryTarget) -> List[Subscription]:
+        return [
+            sub
+            for sub in subscription_set.subscriptions
+            if sub.matches_result(target, blocklist_queries.get(sub.destination))
+        ]
+
+    return match
+
+
+def run_mode(
+    mode: str,
+    subscription_set: SubscriptionSet,
+    matcher: SubscriptionMatcher,
+    targets: Sequence[QueryTarget],
+    batch_size: int,
+    repeat: int,
+) -> tuple[ModeResult, List[Set[Subscription]]]:
+    """
+    Matches the corpus with the given mode, and returns the timings along with the subscriptions each submission matched
+    """
+    result = ModeResult(mode)
+    matched: List[Set[Subscription]] = []
+    naive_match = _naive_matcher(subscription_set) if mode == MODE_NAIVE else None
+    for run in range(repeat):
+        matched = []
+        if mode == MODE_BATCH:
+            for start in range(0, len(targets), batch_size):
+                batch = targets[start : start + batch_size]
+                start_ns = time.perf_counter_ns()
+                batch_matches = matcher.match_batch(batch)
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                # Each submission in a batch waits for the whole batch
+                result.latencies_ns.extend([elapsed_ns] * len(batch))
+                result.total_ns += elapsed_ns
+                matched.extend(set(subs) for subs in batch_matches)
+        else:
+            for target in targets:
+                start_ns = time.perf_counter_ns()
+                subs = naive_match(target) if naive_match is not None else matcher.match(target)
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                result.latencies_ns.append(elapsed_ns)
+                result.total_ns += elapsed_ns
+                matched.append(set(subs))
+        result.matches += sum(len(subs) for subs in matched)
+    return result, matched
+
+
+def measure_memory(subscription_set: SubscriptionSet, targets: Sequence[QueryTarget]) -> tuple[int, int]:
+    """
+    Measures the memory allocated by building a matcher for the subscriptions, and the peak memory allocated while
+    building it and matching the corpus once. Returns both, in bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        matcher = build_matcher(subscription_set)
+        matcher_bytes, _ = tracemalloc.get_traced_memory()
+        matcher.match_batch(targets[:1])
+        for target in targets:
+            matcher.match(target)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return matcher_bytes, peak_bytes
+
+
+def run_benchmark(
+    name: str,
+    subscription_set: SubscriptionSet,
+    targets: Sequence[QueryTarget],
+    modes: Sequence[str],
+    batch_size: int = 10,
+    repeat: int = 3,
+    measure_memory_usage: bool = True,
+) -> BenchmarkResult:
+    gc.collect()
+    start = time.perf_counter()
+    matcher = build_matcher(subscription_set)
+    build_seconds = time.perf_counter() - start
+    result = BenchmarkResult(
+        name,
+        len(subscription_set.subscriptions),
+        matcher.count_distinct_queries(),
+        subscription_set.count_blocks(),
+        build_seconds,
+    )
+    # Warm up caches on the corpus, such as tokenised fields, so that every mode is timed on equal terms
+    for target in targets:
+        matcher.match(target)
+    expected_matches = None
+    for mode in modes:
+        logger.info("Running %s benchmark in %s mode", name, mode)
+        mode_result, matched = run_mode(mode, subscription_set, matcher, targets, batch_size, repeat)
+        if expected_matches is None:
+            expected_matches = matched
+        elif matched != expected_matches:
+            raise ValueError(f"Matching in {mode} mode gave different results to {modes[0]} mode")
+        result.modes.append(mode_result)
+    if measure_memory_usage:
+        del matcher
+        result.matcher_memory_bytes, result.peak_memory_bytes = measure_memory(subscription_set, targets)
+        # On linux, ru_maxrss is in kilobytes
+        result.max_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
+
+
+def save_results(results: List[BenchmarkResult], filename: str) -> None:
+    with open(filename, "w") as f:
+        json.dump({"results": [result.to_json() for result in results]}, f, indent=2)
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """
+    Describes the change in throughput and latency of each benchmark between two saved results files
+    """
+    lines = []
+    baseline_modes = {
+        (result["name"], mode["mode"]): mode for result in baseline["results"] for mode in result["modes"]
+    }
+    for result in current["results"]:
+        for mode in result["modes"]:
+            before = baseline_modes.get((result["name"], mode["mode"]))
+            if before is None or not before["submissions_per_second"]:
+                continue
+            speed_up = mode["submissions_per_second"] / before["submissions_per_second"]
+            lines.append(
+                f"{result['name']} {mode['mode']}: {speed_up:.2f}x throughput, "
+                f"p50 {before['p50_ms']:.3f}ms -> {mode['p50_ms']:.3f}ms, "
+                f"p99 {before['p99_ms']:.3f}ms -> {mode['p99_ms']:.3f}ms"
+            )
+    return lines
@@ -0,0 +1,34 @@
+# Word lists shared by the synthetic subscription and submission generators, roughly in order of how common they are
+
+# fmt: off
+SPECIES = [
+    "wolf", "fox", "dragon", "cat", "dog", "rabbit", "bunny", "deer", "horse", "tiger", "lion", "otter", "raccoon",
+    "husky", "shark", "bat", "bear", "hyena", "kangaroo", "skunk", "squirrel", "mouse", "rat", "goat", "sheep", "cow",
+    "bird", "gryphon", "protogen", "sergal", "avian", "lizard", "snake", "kobold", "cheetah", "leopard", "snow leopard",
+    "red panda", "panda", "coyote", "jackal", "fennec", "arctic fox", "lynx", "bobcat", "ferret", "weasel", "badger",
+    "possum", "dinosaur", "raptor", "wyvern", "eastern dragon", "unicorn", "pegasus", "pony", "dutch angel dragon",
+]
+
+THEMES = [
+    "sketch", "commission", "ych", "adoptable", "comic", "portrait", "headshot", "badge", "icon", "reference sheet",
+    "ref sheet", "pinup", "sfw", "cute", "fluffy", "feral", "anthro", "chibi", "traditional", "digital", "painting",
+    "lineart", "colored", "shaded", "animation", "gif", "3d", "render", "fursuit", "photography", "story", "poetry",
+    "music", "halloween", "christmas", "winter", "summer", "beach", "forest", "space", "sci-fi", "fantasy", "armor",
+    "knight", "wizard", "magic", "pokemon", "digimon", "sonic", "zootopia", "my little pony", "overwatch", "pride",
+    "valentine", "birthday", "gift", "art trade", "raffle", "stream", "wip", "speedpaint", "tutorial", "couple",
+    "wings", "horns", "tail", "paws", "scales", "feathers", "muscles", "chubby", "tall", "small", "macro", "micro",
+    "inflation", "transformation", "tf", "vore", "latex", "goo", "robot", "cyborg", "mecha", "vampire", "werewolf",
+]
+
+COLOURS = ["red", "blue", "green", "black", "white", "purple", "pink", "orange", "yellow", "grey", "golden", "silver"]
+
+FILLER = [
+    "the", "a", "and", "of", "to", "in", "for", "with", "my", "on", "is", "this", "it", "by", "at", "from", "his",
+    "her", "their", "new", "little", "big", "another", "finished", "thanks", "please", "enjoy", "again", "here",
+]
+
+SYLLABLES = [
+    "ka", "ri", "to", "mo", "zu", "la", "fen", "der", "wolf", "shi", "ro", "ne", "ko", "vex", "tal", "ash", "byn",
+    "dra", "gon", "lu", "mi", "nar", "os", "pix", "quil", "ren", "syl", "tor", "ul", "vin", "wyn", "xa", "yor", "zed",
+]
+# fmt: on
@@ -20,6 +20,7 @@ from fa_search_bot.functionalities.inline_favs import InlineFavsFunctionality
 from fa_search_bot.functionalities.inline_gallery import InlineGalleryFunctionality
 from fa_search_bot.functionalities.inline_neaten import InlineNeatenFunctionality
 from fa_search_bot.functionalities.inline_search import InlineSearchFunctionality
+from fa_search_bot.functionalities.match_profile import MatchProfileFunctionality
 from fa_search_bot.functionalities.neaten import NeatenFunctionality, \
     NeatenDocumentFilenameFunctionality
 from fa_search_bot.functionalities.subscriptions import BlocklistFunctionality, SubscriptionFunctionality
@@ -172,6 +173,7 @@ class FASearchBot:
             SubscriptionFunctionality(self.subscription_watcher),
             BlocklistFunctionality(self.subscription_watcher),
             SupergroupUpgradeFunctionality(self.subscription_watcher),
+            MatchProfileFunctionality(self.subscription_watcher, self.config.admin_ids),
             UnhandledMessageFunctionality(),
         ]
         for functionality in functionalities:
@@ -2,13 +2,24 @@ from __future__ import annotations
 
 import dataclasses
 import json
-from typing import Optional
+from typing import List, Optional
 
 DEFAULT_NUM_DATA_FETCHERS = 2
 DEFAULT_NUM_MEDIA_DOWNLOADERS = 2
 DEFAULT_NUM_MEDIA_UPLOADERS = 1
 DEFAULT_MAX_READY_FOR_UPLOAD = 100    # Maximum number of submissions which should be ready for media upload, to prevent data being too stale by the time it comes to upload, especially if catching up on backlog
 DEFAULT_FETCH_REFRESH_LIMIT = 25
+DEFAULT_NUM_MATCHER_PROCESSES = 0    # Number of worker processes for subscription matching, or 0 to match on the event loop
+DEFAULT_NUM_SEND_WORKERS = 5    # Number of destinations which the sender can send messages to at once
+DEFAULT_MAX_SENDING_SUBMISSIONS = 20    # Maximum number of submissions being sent at once, before the sender stops taking more from the wait pool
+DEFAULT_MIN_DATA_FETCHERS = 1    # Bounds on the number of each task runner, when the worker pools are autoscaled
+DEFAULT_MAX_DATA_FETCHERS = 8
+DEFAULT_MIN_MEDIA_DOWNLOADERS = 1
+DEFAULT_MAX_MEDIA_DOWNLOADERS = 8
+DEFAULT_MIN_MEDIA_UPLOADERS = 1
+DEFAULT_MAX_MEDIA_UPLOADERS = 4
+DEFAULT_AUTOSCALE_INTERVAL = 30    # Seconds between each check of whether the worker pools should be scaled
+DEFAULT_AUTOSCALE_TARGET_DRAIN_SECONDS = 60    # Pools are scaled up if their queue would take longer to clear
 
 
 @dataclasses.dataclass
@@ -49,6 +60,19 @@ class SubscriptionWatcherConfig:
     num_media_uploaders: int
     max_ready_for_upload: int
     fetch_refresh_limit: int
+    num_matcher_processes: int
+    profile_matching: bool = False
+    num_send_workers: int = DEFAULT_NUM_SEND_WORKERS
+    max_sending_submissions: int = DEFAULT_MAX_SENDING_SUBMISSIONS
+    autoscale_workers: bool = False
+    min_data_fetchers: int = DEFAULT_MIN_DATA_FETCHERS
+    max_data_fetchers: int = DEFAULT_MAX_DATA_FETCHERS
+    min_media_downloaders: int = DEFAULT_MIN_MEDIA_DOWNLOADERS
+    max_media_downloaders: int = DEFAULT_MAX_MEDIA_DOWNLOADERS
+    min_media_uploaders: int = DEFAULT_MIN_MEDIA_UPLOADERS
+    max_media_uploaders: int = DEFAULT_MAX_MEDIA_UPLOADERS
+    autoscale_interval: float = DEFAULT_AUTOSCALE_INTERVAL
+    autoscale_target_drain_seconds: float = DEFAULT_AUTOSCALE_TARGET_DRAIN_SECONDS
 
     def total_num_task_runners(self) -> int:
         return self.num_data_fetchers + self.num_media_downloaders + self.num_media_uploaders
@@ -62,6 +86,21 @@ class SubscriptionWatcherConfig:
             num_media_uploaders=conf.get("num_media_uploaders", DEFAULT_NUM_MEDIA_UPLOADERS),
             max_ready_for_upload=conf.get("max_ready_for_upload", DEFAULT_MAX_READY_FOR_UPLOAD),
             fetch_refresh_limit=conf.get("fetch_refresh_limit", DEFAULT_FETCH_REFRESH_LIMIT),
+            num_matcher_processes=conf.get("num_matcher_processes", DEFAULT_NUM_MATCHER_PROCESSES),
+            profile_matching=conf.get("profile_matching", False),
+            num_send_workers=conf.get("num_send_workers", DEFAULT_NUM_SEND_WORKERS),
+            max_sending_submissions=conf.get("max_sending_submissions", DEFAULT_MAX_SENDING_SUBMISSIONS),
+            autoscale_workers=conf.get("autoscale_workers", False),
+            min_data_fetchers=conf.get("min_data_fetchers", DEFAULT_MIN_DATA_FETCHERS),
+            max_data_fetchers=conf.get("max_data_fetchers", DEFAULT_MAX_DATA_FETCHERS),
+            min_media_downloaders=conf.get("min_media_downloaders", DEFAULT_MIN_MEDIA_DOWNLOADERS),
+            max_media_downloaders=conf.get("max_media_downloaders", DEFAULT_MAX_MEDIA_DOWNLOADERS),
+            min_media_uploaders=conf.get("min_media_uploaders", DEFAULT_MIN_MEDIA_UPLOADERS),
+            max_media_uploaders=conf.get("max_media_uploaders", DEFAULT_MAX_MEDIA_UPLOADERS),
+            autoscale_interval=conf.get("autoscale_interval", DEFAULT_AUTOSCALE_INTERVAL),
+            autoscale_target_drain_seconds=conf.get(
+                "autoscale_target_drain_seconds", DEFAULT_AUTOSCALE_TARGET_DRAIN_SECONDS
+            ),
         )
 
 
@@ -73,6 +112,7 @@ class Config:
     weasyl: Optional[WeasylConfig]
     subscription_watcher: SubscriptionWatcherConfig
     prometheus_port: Optional[int]
+    admin_ids: List[int] = dataclasses.field(default_factory=list)
 
     @classmethod
     def from_dict(cls, conf: dict) -> "Config":
@@ -87,6 +127,7 @@ class Config:
             weasyl_config,
             SubscriptionWatcherConfig.from_dict(conf.get("subscription_watcher", {})),
             conf.get("prometheus_port", 7065),
+            conf.get("admin_ids", []),
         )
 
     @classmethod
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import html
+import logging
+import re
+from typing import TYPE_CHECKING
+
+from telethon.events import NewMessage, StopPropagation
+
+from fa_search_bot.functionalities.functionalities import BotFunctionality
+
+if TYPE_CHECKING:
+    from typing import Collection, List
+
+    from fa_search_bot.subscriptions.match_profiler import ProfileRow
+    from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class MatchProfileFunctionality(BotFunctionality):
+    """
+    Admin-only command to control match profiling, and list the most expensive subscription queries and blocklists
+    """
+
+    profile_cmd = "match_profile"
+    USE_CASE_REPORT = "match_profile_report"
+    USE_CASE_CONTROL = "match_profile_control"
+    DEFAULT_COUNT = 10
+    MAX_COUNT = 50
+
+    def __init__(self, watcher: SubscriptionWatcher, admin_ids: Collection[int]):
+        super().__init__(NewMessage(pattern=re.compile(r"^/" + re.escape(self.profile_cmd)), incoming=True))
+        self.watcher = watcher
+        self.admin_ids = set(admin_ids)
+
+    @property
+    def usage_labels(self) -> List[str]:
+        return [self.USE_CASE_REPORT, self.USE_CASE_CONTROL]
+
+    async def call(self, event: NewMessage.Event) -> None:
+        if event.sender_id not in self.admin_ids:
+            # Other users are treated as if the command does not exist
+            return
+        message_text = event.text
+        command = message_text.split()[0]
+        args = message_text[len(command) :].strip().lower()
+        await event.reply(await self._route_command(args), parse_mode="html")
+        raise StopPropagation
+
+    async def _route_command(self, args: str) -> str:
+        if args in ["on", "enable"]:
+            self.usage_counter.labels(function=self.USE_CASE_CONTROL).inc()
+            self.watcher.set_match_profiling(True)
+            return "Match profiling enabled."
+        if args in ["off", "disable"]:
+            self.usage_counter.labels(function=self.USE_CASE_CONTROL).inc()
+            self.watcher.set_match_profiling(False)
+            return "Match profiling disabled."
+        if args == "reset":
+            self.usage_counter.labels(function=self.USE_CASE_CONTROL).inc()
+            self.watcher.reset_match_profile()
+            return "Match profile reset."
+        if args == "":
+            return await self._report(self.DEFAULT_COUNT)
+        if args.isdigit():
+            return await self._report(min(int(args), self.MAX_COUNT))
+        return f"Usage: /{self.profile_cmd} [on|off|reset|count]"
+
+    async def _report(self, count: int) -> str:
+        self.usage_counter.labels(function=self.USE_CASE_REPORT).inc()
+        queries, blocklists = await self.watcher.slowest_queries(count)
+        lines = [f"Match profiling is {'enabled' if self.watcher.match_profiling_enabled() else 'disabled'}."]
+        if not queries and not blocklists:
+            lines.append("No submissions have been profiled yet.")
+            return "\n".join(lines)
+        lines.append("<b>Slowest subscription queries:</b>")
+        for num, row in enumerate(queries, 1):
+            group = self.watcher.matcher.groups.get(row.key)
+            num_subs = len(group.subscriptions) if group is not None else 0
+            lines.append(f"{num}. <code>{html.escape(row.key)}</code> ({num_subs} subscriptions) {self._timing(row)}")
+        lines.append("<b>Slowest blocklists:</b>")
+        for num, row in enumerate(blocklists, 1):
+            blocklist = self.watcher.blocklists.get(int(row.key))
+            num_blocks = blocklist.count_blocks() if blocklist is not None else 0
+            lines.append(f"{num}. Chat {row.key} ({num_blocks} blocks) {self._timing(row)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _timing(row: ProfileRow) -> str:
+        return f"{row.total_seconds * 1000:.1f}ms total, {row.mean_seconds * 1e6:.1f}µs mean over {row.calls} calls"
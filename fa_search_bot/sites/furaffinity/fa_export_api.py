@@ -77,6 +77,9 @@ class FAExportAPI:
         self.slow_down_status = False
         self.ignore_status = ignore_status
         self._session: Optional[aiohttp.ClientSession] = None
+        # Running totals, so that the rate of cloudflare errors can be checked without reading the prometheus metrics
+        self.request_count = 0
+        self.cloudflare_error_count = 0
         for endpoint in Endpoint:
             cloudflare_errors.labels(endpoint=endpoint.value)
             api_request_times.labels(endpoint=endpoint.value)
@@ -94,12 +97,14 @@ class FAExportAPI:
         with api_request_times.labels(endpoint=endpoint_label.value).time():
             async with self.session.get(path) as resp:
                 await resp.read()
+        self.request_count += 1
         error_type = None
         if resp.status != 200:
             error_data = await resp.json()
             error_type = error_data.get("error_type")
         if resp.status in [429, 503] or error_type in ["fa_cloudflare", "fa_slowdown"]:
             cloudflare_errors.labels(endpoint=endpoint_label.value).inc()
+            self.cloudflare_error_count += 1
             raise CloudflareError()
         return resp
 
@@ -11,7 +11,7 @@ from telethon import Button
 
 from fa_search_bot.sites.submission import Rating
 from fa_search_bot.sites.submission_id import SubmissionID
-from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.query_target import QueryTarget, TokenCache
 
 if TYPE_CHECKING:
     import datetime
@@ -236,6 +236,8 @@ class FASubmissionFull(FASubmissionShort):
         self.rating = rating
         self.posted_at = posted_at
         self._download_file_size: Optional[int] = None
+        # Shared by every QueryTarget made from this submission, so it is only tokenised once
+        self._token_cache = TokenCache()
 
     async def download_file_size(self) -> int:
         if self._download_file_size is None:
@@ -254,6 +256,7 @@ class FASubmissionFull(FASubmissionShort):
             description=[self.description],
             artist=[self.author.name, self.author.profile_name],
             rating=self.rating,
+            token_cache=self._token_cache,
         )
 
 
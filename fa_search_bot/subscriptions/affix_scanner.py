@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+from fa_search_bot.subscriptions.query_parser import (
+    AndQuery,
+    ExceptionQuery,
+    NotQuery,
+    OrQuery,
+    PrefixQuery,
+    Query,
+    SuffixQuery,
+)
+from fa_search_bot.subscriptions.query_target import AnyField, ArtistField, DescriptionField, KeywordField, TitleField
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Set, Type, Union
+
+    from fa_search_bot.subscriptions.query_target import Field, QueryTarget
+
+logger = logging.getLogger(__name__)
+
+_specific_fields: List[Type[Field]] = [TitleField, DescriptionField, KeywordField, ArtistField]
+
+
+def query_affixes(query: Query) -> Iterable[Union[PrefixQuery, SuffixQuery]]:
+    if isinstance(query, (PrefixQuery, SuffixQuery)):
+        yield query
+    elif isinstance(query, (AndQuery, OrQuery)):
+        for sub_query in query.sub_queries:
+            yield from query_affixes(sub_query)
+    elif isinstance(query, NotQuery):
+        yield from query_affixes(query.sub_query)
+    elif isinstance(query, ExceptionQuery):
+        yield from query_affixes(query.word)
+        yield from query_affixes(query.exception)
+
+
+class FieldAffixHits:
+    def __init__(self, prefixes: Set[str], suffixes: Set[str]) -> None:
+        self.prefixes = prefixes
+        self.suffixes = suffixes
+
+
+class AffixHits:
+    """
+    The registered prefixes and suffixes which were found in the words of each field of a QueryTarget. Fields are only
+    scanned when first requested.
+    """
+
+    def __init__(self, scanner: AffixScanner, target: QueryTarget) -> None:
+        self.scanner = scanner
+        self.target = target
+        self._version = -1
+        self._field_hits: Dict[Type[Field], FieldAffixHits] = {}
+
+    def _refresh(self) -> None:
+        # If the scanner's affixes have changed since fields were scanned, those results are stale
+        if self._version != self.scanner.version:
+            self._version = self.scanner.version
+            self._field_hits.clear()
+
+    def is_scanned_prefix(self, prefix: str) -> bool:
+        return prefix in self.scanner.prefix_counts
+
+    def is_scanned_suffix(self, suffix: str) -> bool:
+        return suffix in self.scanner.suffix_counts
+
+    def for_field(self, field: Type[Field]) -> FieldAffixHits:
+        self._refresh()
+        field_hits = self._field_hits.get(field)
+        if field_hits is not None:
+            return field_hits
+        if field is AnyField:
+            prefixes: Set[str] = set()
+            suffixes: Set[str] = set()
+            for specific_field in _specific_fields:
+                specific_hits = self.for_field(specific_field)
+                prefixes.update(specific_hits.prefixes)
+                suffixes.update(specific_hits.suffixes)
+            field_hits = FieldAffixHits(prefixes, suffixes)
+        else:
+            field_hits = self.scanner.scan_words(field.get_field(self.target).tokens().word_set)
+        self._field_hits[field] = field_hits
+        return field_hits
+
+
+class AffixScanner:
+    """
+    Holds the prefix and suffix literals of every registered query, grouped by length, so that a single pass over a
+    submission's words finds every prefix and suffix query which matches. For each word, only one hash lookup is needed
+    per distinct affix length, rather than one check per query.
+    Affixes are reference counted, so that they can be added and removed along with the queries which use them.
+    """
+
+    def __init__(self) -> None:
+        self.prefix_counts: Dict[str, int] = {}
+        self.suffix_counts: Dict[str, int] = {}
+        self._prefix_lengths: List[int] = []
+        self._suffix_lengths: List[int] = []
+        self._lengths_dirty = False
+        self.version = 0
+
+    def add_query(self, query: Query) -> None:
+        for affix_query in query_affixes(query):
+            if isinstance(affix_query, PrefixQuery):
+                self._add(self.prefix_counts, affix_query.prefix_lower)
+            else:
+                self._add(self.suffix_counts, affix_query.suffix_lower)
+
+    def remove_query(self, query: Query) -> None:
+        for affix_query in query_affixes(query):
+            if isinstance(affix_query, PrefixQuery):
+                self._remove(self.prefix_counts, affix_query.prefix_lower)
+            else:
+                self._remove(self.suffix_counts, affix_query.suffix_lower)
+
+    def _add(self, counts: Dict[str, int], affix: str) -> None:
+        if not affix:
+            return
+        count = counts.get(affix, 0)
+        counts[affix] = count + 1
+        if count == 0:
+            self._lengths_dirty = True
+            self.version += 1
+
+    def _remove(self, counts: Dict[str, int], affix: str) -> None:
+        count = counts.get(affix)
+        if count is None:
+            return
+        if count > 1:
+            counts[affix] = count - 1
+            return
+        del counts[affix]
+        self._lengths_dirty = True
+        self.version += 1
+
+    def _update_lengths(self) -> None:
+        if not self._lengths_dirty:
+            return
+        self._prefix_lengths = sorted(set(len(prefix) for prefix in self.prefix_counts.keys()))
+        self._suffix_lengths = sorted(set(len(suffix) for suffix in self.suffix_counts.keys()))
+        self._lengths_dirty = False
+
+    def count_affixes(self) -> int:
+        return len(self.prefix_counts) + len(self.suffix_counts)
+
+    def attach(self, target: QueryTarget) -> None:
+        """
+        Attach lazily evaluated affix hits to the query target, which PrefixQuery and SuffixQuery matching will then use
+        """
+        target.affix_hits = AffixHits(self, target)
+
+    def scan_words(self, words: Iterable[str]) -> FieldAffixHits:
+        """
+        Returns the registered prefixes and suffixes of the given (lowercase) words. As with PrefixQuery and
+        SuffixQuery, a word does not count as its own prefix or suffix.
+        """
+        self._update_lengths()
+        prefix_counts = self.prefix_counts
+        suffix_counts = self.suffix_counts
+        prefix_lengths = self._prefix_lengths
+        suffix_lengths = self._suffix_lengths
+        prefixes: Set[str] = set()
+        suffixes: Set[str] = set()
+        for word in words:
+            word_len = len(word)
+            for length in prefix_lengths:
+                if length >= word_len:
+                    break
+                if word[:length] in prefix_counts:
+                    prefixes.add(word[:length])
+            for length in suffix_lengths:
+                if length >= word_len:
+                    break
+                if word[-length:] in suffix_counts:
+                    suffixes.add(word[-length:])
+        return FieldAffixHits(prefixes, suffixes)
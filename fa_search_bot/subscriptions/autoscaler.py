@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import dataclasses
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from prometheus_client import Counter, Gauge
+
+from fa_search_bot.subscriptions.runnable import Runnable
+from fa_search_bot.subscriptions.utils import time_taken
+
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+    from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
+    from fa_search_bot.subscriptions.wait_pool import StageSignal
+
+
+logger = logging.getLogger(__name__)
+
+time_taken_waiting = time_taken.labels(
+    task="waiting between autoscaling checks", runnable="WorkerAutoscaler", task_type="waiting"
+)
+gauge_pool_stage_latency = Gauge(
+    "fasearchbot_autoscaler_stage_latency_seconds",
+    "Smoothed time taken (in seconds) by a worker to process a single item, for each worker pool",
+    labelnames=["pool"],
+)
+gauge_pool_drain_seconds = Gauge(
+    "fasearchbot_autoscaler_drain_seconds",
+    "Estimated time (in seconds) for each worker pool to clear its queue, at its current size",
+    labelnames=["pool"],
+)
+gauge_pool_utilisation = Gauge(
+    "fasearchbot_autoscaler_utilisation",
+    "Fraction of time which the workers of each pool spent processing items, since the last autoscaling check",
+    labelnames=["pool"],
+)
+counter_scaling_events = Counter(
+    "fasearchbot_autoscaler_scaling_events_total",
+    "Number of times the autoscaler has changed the size of each worker pool",
+    labelnames=["pool", "direction"],
+)
+gauge_throttled = Gauge(
+    "fasearchbot_autoscaler_upstream_throttled",
+    "Whether the autoscaler believes FA is throttling the bot, and so is scaling more slowly",
+)
+
+
+@dataclasses.dataclass
+class PoolSample:
+    workers: int
+    idle_workers: int
+    queue_depth: int
+    # Time spent processing, and number of items processed, by the pool's workers since the previous sample
+    busy_seconds: float
+    items_processed: int
+    elapsed_seconds: float
+
+
+class PoolScaler:
+    """
+    Decides how many workers a single pool should have, from successive samples of its queue and workers. A pool is
+    scaled up one worker at a time, while its queue would take longer than the target to drain and its workers are
+    mostly busy, and scaled down one worker at a time while its workers are mostly idle. Scaling down is slower than
+    scaling up, so that a pool does not flap between sizes, and both are slower still while the upstream is throttling.
+    """
+
+    SCALE_UP_COOLDOWN = 60
+    SCALE_DOWN_COOLDOWN = 300
+    THROTTLED_COOLDOWN_FACTOR = 4
+    # Workers must be at least this busy to be worth adding to, otherwise something other than worker count is the limit
+    SCALE_UP_UTILISATION = 0.5
+    SCALE_DOWN_UTILISATION = 0.25
+    # Weight of each new per-item latency measurement, in the smoothed latency
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(
+            self,
+            name: str,
+            min_workers: int,
+            max_workers: int,
+            target_drain_seconds: float,
+            uses_upstream: bool,
+    ) -> None:
+        self.name = name
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.target_drain_seconds = target_drain_seconds
+        # Whether the pool makes requests to FA, and so should not be scaled up while FA is throttling the bot
+        self.uses_upstream = uses_upstream
+        self.latency: Optional[float] = None
+        self.last_scaled = float("-inf")
+
+    def drain_seconds(self, sample: PoolSample) -> Optional[float]:
+        if not sample.queue_depth:
+            return 0
+        if self.latency is None or not sample.workers:
+            return None
+        return sample.queue_depth * self.latency / sample.workers
+
+    def decide(self, sample: PoolSample, now: float, throttled: bool) -> int:
+        """
+        Returns how many workers the pool should have
+        """
+        if sample.items_processed:
+            item_latency = sample.busy_seconds / sample.items_processed
+            if self.latency is None:
+                self.latency = item_latency
+            else:
+                self.latency += (item_latency - self.latency) * self.LATENCY_SMOOTHING
+        # Always keep within the bounds, even if they have changed
+        bounded = min(max(sample.workers, self.min_workers), self.max_workers)
+        if bounded != sample.workers:
+            self.last_scaled = now
+            return bounded
+        if sample.elapsed_seconds <= 0:
+            # Nothing to compare against yet, so only the bounds can be applied
+            return sample.workers
+        utilisation = self.utilisation(sample)
+        drain_seconds = self.drain_seconds(sample)
+        cooldown_factor = self.THROTTLED_COOLDOWN_FACTOR if throttled else 1
+        since_scaled = now - self.last_scaled
+        if (
+            sample.workers < self.max_workers
+            and not (throttled and self.uses_upstream)
+            and drain_seconds is not None
+            and drain_seconds > self.target_drain_seconds
+            and utilisation >= self.SCALE_UP_UTILISATION
+            and since_scaled >= self.SCALE_UP_COOLDOWN * cooldown_factor
+        ):
+            self.last_scaled = now
+            return sample.workers + 1
+        if (
+            sample.workers > self.min_workers
+            and sample.idle_workers > 0
+            and utilisation < self.SCALE_DOWN_UTILISATION
+            and since_scaled >= self.SCALE_DOWN_COOLDOWN * cooldown_factor
+        ):
+            self.last_scaled = now
+            return sample.workers - 1
+        return sample.workers
+
+    @staticmethod
+    def utilisation(sample: PoolSample) -> float:
+        if not sample.workers or sample.elapsed_seconds <= 0:
+            return 0
+        return min(1.0, sample.busy_seconds / (sample.workers * sample.elapsed_seconds))
+
+
+@dataclasses.dataclass
+class WorkerPool:
+    scaler: PoolScaler
+    workers: Callable[[], Sequence[Runnable]]
+    queue_depth: Callable[[], int]
+    signal: Callable[[], StageSignal]
+    scale: Callable[[int], None]
+    # Totals from each worker at the previous sample, to measure what they did in between
+    seen: Dict[Runnable, Tuple[float, int]] = dataclasses.field(default_factory=dict)
+
+
+class WorkerAutoscaler(Runnable):
+    """
+    Periodically checks the queue depth and stage latency of the DataFetcher, MediaDownloader and MediaUploader pools,
+    and starts or stops workers to keep each queue draining within the target time. Watches the rate of cloudflare
+    errors from the FA API, and while FA appears to be throttling the bot, does not add workers which would make more
+    requests to FA, and scales everything more slowly.
+    """
+
+    # Fraction of FA API requests which returned cloudflare errors, at which FA is considered to be throttling the bot
+    THROTTLE_ERROR_RATE = 0.05
+    # How long to keep scaling slowly, after FA has last been seen throttling the bot
+    THROTTLE_HOLD = 300
+
+    def __init__(self, watcher: SubscriptionWatcher) -> None:
+        super().__init__(watcher)
+        self.clock = time.monotonic
+        config = self.watcher.config
+        target = config.autoscale_target_drain_seconds
+        wait_pool = self.watcher.wait_pool
+        self.pools: List[WorkerPool] = [
+            WorkerPool(
+                PoolScaler("data_fetcher", config.min_data_fetchers, config.max_data_fetchers, target, True),
+                lambda: self.watcher.data_fetchers,
+                lambda: wait_pool.qsize_fetch_new() + wait_pool.qsize_fetch_refresh(),
+                lambda: wait_pool.fetch_signal,
+                self.watcher.scale_data_fetchers,
+            ),
+            WorkerPool(
+                PoolScaler(
+                    "media_downloader", config.min_media_downloaders, config.max_media_downloaders, target, True
+                ),
+                lambda: self.watcher.media_downloaders,
+                wait_pool.qsize_download,
+                lambda: wait_pool.download_signal,
+                self.watcher.scale_media_downloaders,
+            ),
+            WorkerPool(
+                PoolScaler("media_uploader", config.min_media_uploaders, config.max_media_uploaders, target, False),
+                lambda: self.watcher.media_uploaders,
+                wait_pool.qsize_upload,
+                lambda: wait_pool.upload_signal,
+                self.watcher.scale_media_uploaders,
+            ),
+        ]
+        for pool in self.pools:
+            gauge_pool_stage_latency.labels(pool=pool.scaler.name).set_function(
+                lambda scaler=pool.scaler: scaler.latency or 0
+            )
+        self.last_check: Optional[float] = None
+        self.last_request_count = 0
+        self.last_cloudflare_count = 0
+        self.throttled_until = float("-inf")
+
+    async def do_process(self) -> None:
+        self.check_pools()
+        with time_taken_waiting.time():
+            await self._wait_while_running(self.watcher.config.autoscale_interval)
+
+    def check_pools(self) -> None:
+        now = self.clock()
+        throttled = self.check_throttled(now)
+        elapsed = 0.0 if self.last_check is None else now - self.last_check
+        self.last_check = now
+        for pool in self.pools:
+            sample = self.sample_pool(pool, elapsed)
+            target = pool.scaler.decide(sample, now, throttled)
+            drain_seconds = pool.scaler.drain_seconds(sample)
+            gauge_pool_drain_seconds.labels(pool=pool.scaler.name).set(-1 if drain_seconds is None else drain_seconds)
+            gauge_pool_utilisation.labels(pool=pool.scaler.name).set(pool.scaler.utilisation(sample))
+            if target == sample.workers:
+                continue
+            direction = "up" if target > sample.workers else "down"
+            logger.info(
+                "Scaling %s pool %s from %s to %s workers, queue depth: %s, latency: %s, throttled: %s",
+                pool.scaler.name, direction, sample.workers, target, sample.queue_depth, pool.scaler.latency, throttled,
+            )
+            counter_scaling_events.labels(pool=pool.scaler.name, direction=direction).inc()
+            pool.scale(target)
+
+    def sample_pool(self, pool: WorkerPool, elapsed: float) -> PoolSample:
+        workers = pool.workers()
+        busy_seconds = 0.0
+        items_processed = 0
+        seen = {}
+        for worker in workers:
+            last_busy, last_items = pool.seen.get(worker, (0.0, 0))
+            busy_seconds += worker.busy_seconds - last_busy
+            items_processed += worker.items_processed - last_items
+            seen[worker] = (worker.busy_seconds, worker.items_processed)
+        pool.seen = seen
+        return PoolSample(
+            workers=len(workers),
+            idle_workers=pool.signal().count_waiters(),
+            queue_depth=pool.queue_depth(),
+            busy_seconds=busy_seconds,
+            items_processed=items_processed,
+            elapsed_seconds=elapsed,
+        )
+
+    def check_throttled(self, now: float) -> bool:
+        api = self.watcher.api
+        requests = api.request_count - self.last_request_count
+        cloudflare_errors = api.cloudflare_error_count - self.last_cloudflare_count
+        self.last_request_count = api.request_count
+        self.last_cloudflare_count = api.cloudflare_error_count
+        if api.slow_down_status or (requests and cloudflare_errors / requests >= self.THROTTLE_ERROR_RATE):
+            if now >= self.throttled_until:
+                logger.warning("FA appears to be throttling requests, slowing down autoscaling")
+            self.throttled_until = now + self.THROTTLE_HOLD
+        throttled = now < self.throttled_until
+        gauge_throttled.set(1 if throttled else 0)
+        return throttled
+
+    async def revert_last_attempt(self) -> None:
+        # Autoscaling checks do not take anything from the wait pool, so there is nothing to revert
+        pass
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Callable
+
+from fa_search_bot.subscriptions.query_parser import AndQuery, NotQuery, OrQuery, RatingQuery, WordQuery, compile_query
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterator, List, Sequence, Type
+
+    from fa_search_bot.sites.submission import Rating
+    from fa_search_bot.subscriptions.query_parser import Query
+    from fa_search_bot.subscriptions.query_target import Field, QueryTarget
+
+logger = logging.getLogger(__name__)
+
+# Given a batch and a bitset of which targets to check, returns the bitset of those targets which match
+BatchMatcher = Callable[["TargetBatch", int], int]
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    """
+    Yields the index of each set bit, lowest first
+    """
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+class TargetBatch:
+    """
+    A batch of QueryTargets, with each word and rating mapped to the bitset of targets which contain it. Bit i of each
+    bitset refers to targets[i].
+    """
+
+    def __init__(self, targets: Sequence[QueryTarget]) -> None:
+        self.targets = targets
+        self.all_bits = (1 << len(targets)) - 1
+        self._rating_bits: Dict[Rating, int] = {}
+        for index, target in enumerate(targets):
+            self._rating_bits[target.rating] = self._rating_bits.get(target.rating, 0) | (1 << index)
+        # Word bitsets for each field are only built when a query first needs that field
+        self._word_bits: Dict[Type[Field], Dict[str, int]] = {}
+
+    def rating_bits(self, rating: Rating) -> int:
+        return self._rating_bits.get(rating, 0)
+
+    def word_bits(self, field: Type[Field], word_lower: str) -> int:
+        field_bits = self._word_bits.get(field)
+        if field_bits is None:
+            field_bits = {}
+            for index, target in enumerate(self.targets):
+                bit = 1 << index
+                for word in field.get_field(target).tokens().word_set:
+                    field_bits[word] = field_bits.get(word, 0) | bit
+            self._word_bits[field] = field_bits
+        return field_bits.get(word_lower, 0)
+
+
+def _is_bitwise(query: Query) -> bool:
+    if isinstance(query, (WordQuery, RatingQuery)):
+        return True
+    if isinstance(query, (AndQuery, OrQuery)):
+        return all(_is_bitwise(sub_query) for sub_query in query.sub_queries)
+    if isinstance(query, NotQuery):
+        return _is_bitwise(query.sub_query)
+    return False
+
+
+def _compile_batch_children(sub_queries: Sequence[Query]) -> List[BatchMatcher]:
+    # Bitwise checks go first, so that fewer targets are left to be checked one at a time
+    ordered = sorted(sub_queries, key=lambda sub_query: not _is_bitwise(sub_query))
+    return [compile_batch_query(sub_query) for sub_query in ordered]
+
+
+def _compile_batch_fallback(query: Query) -> BatchMatcher:
+    matcher = compile_query(query)
+
+    def check_each(batch: TargetBatch, mask: int) -> int:
+        result = 0
+        targets = batch.targets
+        for index in iter_bits(mask):
+            if matcher(targets[index]):
+                result |= 1 << index
+        return result
+
+    return check_each
+
+
+def _compile_batch_and(sub_queries: Sequence[Query]) -> BatchMatcher:
+    matchers = _compile_batch_children(sub_queries)
+
+    def check_and(batch: TargetBatch, mask: int) -> int:
+        for matcher in matchers:
+            if not mask:
+                break
+            mask = matcher(batch, mask)
+        return mask
+
+    return check_and
+
+
+def _compile_batch_or(sub_queries: Sequence[Query]) -> BatchMatcher:
+    matchers = _compile_batch_children(sub_queries)
+
+    def check_or(batch: TargetBatch, mask: int) -> int:
+        result = 0
+        for matcher in matchers:
+            if not mask:
+                break
+            # Targets which already match do not need checking against the other options
+            hits = matcher(batch, mask)
+            result |= hits
+            mask &= ~hits
+        return result
+
+    return check_or
+
+
+def compile_batch_query(query: Query) -> BatchMatcher:
+    """
+    Compiles a query into a function which checks a whole batch of targets at once. Words, ratings, and the boolean
+    operators between them are evaluated as bitwise operations over the batch, while other query types are checked
+    one target at a time, but only for targets which are still undecided.
+    """
+    if isinstance(query, WordQuery):
+        field = query.field
+        word_lower = query.word_lower
+        return lambda batch, mask: mask & batch.word_bits(field, word_lower)
+    if isinstance(query, RatingQuery):
+        rating = query.rating
+        return lambda batch, mask: mask & batch.rating_bits(rating)
+    if isinstance(query, AndQuery):
+        return _compile_batch_and(query.sub_queries)
+    if isinstance(query, OrQuery):
+        return _compile_batch_or(query.sub_queries)
+    if isinstance(query, NotQuery):
+        sub_matcher = compile_batch_query(query.sub_query)
+        return lambda batch, mask: mask & ~sub_matcher(batch, mask)
+    return _compile_batch_fallback(query)
+
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import dataclasses
 import logging
 from asyncio import QueueEmpty
 from typing import Optional, TYPE_CHECKING
@@ -13,6 +15,10 @@ from fa_search_bot.subscriptions.runnable import Runnable, ShutdownError
 from fa_search_bot.subscriptions.utils import time_taken
 
 if TYPE_CHECKING:
+    from typing import List, Tuple
+
+    from fa_search_bot.subscriptions.query_target import QueryTarget
+    from fa_search_bot.subscriptions.subscription import Subscription
     from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
 
 
@@ -75,9 +81,64 @@ sub_total_matches = Counter(
 )
 
 
+@dataclasses.dataclass(eq=False)
+class PendingMatch:
+    target: QueryTarget
+    result: asyncio.Future
+
+
+class MatchBatcher:
+    """
+    Matches the submissions fetched by all the data fetchers. Each submission is matched as soon as no other batch is
+    being matched, along with any others which were fetched while it waited. So while catching up on a backlog,
+    submissions are matched in batches, but no submission ever waits for others to be fetched.
+    """
+
+    def __init__(self, watcher: SubscriptionWatcher, max_batch_size: int) -> None:
+        self.watcher = watcher
+        self.max_batch_size = max_batch_size
+        self.waiting: List[PendingMatch] = []
+        self.lock = asyncio.Lock()
+
+    async def match(self, target: QueryTarget) -> Tuple[List[Subscription], int]:
+        """
+        Returns the subscriptions matching the target, and the matcher generation from before they were matched
+        """
+        pending = PendingMatch(target, asyncio.get_running_loop().create_future())
+        self.waiting.append(pending)
+        try:
+            async with self.lock:
+                # It may have been matched in another data fetcher's batch while waiting
+                if not pending.result.done():
+                    await self._match_batch(pending)
+        finally:
+            if pending in self.waiting:
+                self.waiting.remove(pending)
+        return pending.result.result()
+
+    async def _match_batch(self, pending: PendingMatch) -> None:
+        others = [other for other in self.waiting if other is not pending][:self.max_batch_size - 1]
+        for other in others:
+            self.waiting.remove(other)
+        batch = [pending] + others
+        # The generation is taken before matching, so that any change made while matching counts as a change since then
+        matched_generation = self.watcher.matcher.generation
+        try:
+            batch_matches = await self.watcher.check_subscriptions_batch([entry.target for entry in batch])
+        except Exception as e:
+            for entry in batch:
+                if not entry.result.done():
+                    entry.result.set_exception(e)
+            return
+        for entry, matching_subscriptions in zip(batch, batch_matches):
+            if not entry.result.done():
+                entry.result.set_result((matching_subscriptions, matched_generation))
+
+
 class DataFetcher(Runnable):
     FETCH_CLOUDFLARE_BACKOFF = 60
     FETCH_EXCEPTION_BACKOFF = 20
+    MATCH_BATCH_SIZE = 10
 
     def __init__(self, watcher: "SubscriptionWatcher") -> None:
         super().__init__(watcher)
@@ -88,7 +149,7 @@ class DataFetcher(Runnable):
             sub_id = await self.watcher.wait_pool.get_next_for_data_fetch()
         except QueueEmpty:
             with time_taken_queue_waiting.time():
-                await self._wait_while_running(self.QUEUE_BACKOFF)
+                await self._wait_while_running(self.QUEUE_WAIT_TIMEOUT, self.watcher.wait_pool.fetch_signal)
             return
         self.last_sub_id = sub_id
         # Fetch data
@@ -98,9 +159,20 @@ class DataFetcher(Runnable):
             counter_subs_missed.inc()
             return
         counter_subs_found.inc()
-        # See if any subscriptions match the submission
+        # See which subscriptions match, in a batch with any other submissions which have been fetched meanwhile
         with time_taken_checking_matches.time():
-            matching_subscriptions = await self.watcher.check_subscriptions(full_result.to_query_target())
+            matching_subscriptions, matched_generation = await self.watcher.match_batcher.match(
+                full_result.to_query_target()
+            )
+        await self.publish_result(sub_id, full_result, matching_subscriptions, matched_generation)
+
+    async def publish_result(
+            self,
+            sub_id: SubmissionID,
+            full_result: FASubmissionFull,
+            matching_subscriptions: list[Subscription],
+            matched_generation: Optional[int] = None,
+    ) -> None:
         logger.debug("Submission %s matches %s subscriptions", sub_id, len(matching_subscriptions))
         # If submission doesn't match any subscriptions, drop it
         if not matching_subscriptions:
@@ -112,7 +184,9 @@ class DataFetcher(Runnable):
         sub_total_matches.inc(len(matching_subscriptions))
         self.latest_id_gauge.set(sub_id.submission_id)
         with time_taken_publishing.time():
-            await self.watcher.wait_pool.set_fetched_data(sub_id, full_result, matching_subscriptions)
+            await self.watcher.wait_pool.set_fetched_data(
+                sub_id, full_result, matching_subscriptions, matched_generation
+            )
 
     async def fetch_data(self, sub_id: SubmissionID) -> Optional[FASubmissionFull]:
         # Keep trying to fetch data, unless it is gone
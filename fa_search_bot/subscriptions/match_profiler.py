@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+import heapq
+from typing import TYPE_CHECKING
+
+from prometheus_client import Counter, Gauge
+
+if TYPE_CHECKING:
+    from typing import Dict, List
+
+    ProfileJson = Dict[str, Dict[str, List[int]]]
+
+KIND_QUERY = "query"
+KIND_BLOCKLIST = "blocklist"
+KINDS = [KIND_QUERY, KIND_BLOCKLIST]
+# Only this many of the most expensive queries and blocklists are exposed as metrics, to bound their cardinality
+TOP_N_METRICS = 10
+
+profiled_submissions = Counter(
+    "fasearchbot_fasubwatcher_profiled_submissions_total",
+    "Number of submissions which have been matched with per-query timing, while match profiling is enabled",
+)
+gauge_profiling_enabled = Gauge(
+    "fasearchbot_fasubwatcher_match_profiling_enabled",
+    "Whether the subscription matcher is profiling the cost of each query and blocklist",
+)
+gauge_slowest_cost = Gauge(
+    "fasearchbot_fasubwatcher_profiled_slowest_cost_seconds",
+    "Cumulative time spent evaluating the most expensive subscription queries and blocklists, by rank, while match "
+    "profiling is enabled",
+    labelnames=["kind", "rank"],
+)
+
+
+class ProfileEntry:
+    __slots__ = ("calls", "total_ns")
+
+    def __init__(self, calls: int = 0, total_ns: int = 0) -> None:
+        self.calls = calls
+        self.total_ns = total_ns
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0
+
+
+@dataclasses.dataclass
+class ProfileRow:
+    kind: str
+    key: str
+    calls: int
+    total_ns: int
+
+    @property
+    def total_seconds(self) -> float:
+        return self.total_ns / 1e9
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0
+
+
+class MatchProfiler:
+    """
+    Records the cumulative evaluation time and call count of each distinct subscription query, and of each
+    destination's blocklist, for a sample of submissions. This is disabled by default, in which case the only cost is
+    one check per submission. Queries are keyed by their normalised query string, and blocklists by destination.
+    """
+
+    # One in this many submissions is profiled, while profiling is enabled
+    SAMPLE_INTERVAL = 16
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.entries: Dict[str, Dict[str, ProfileEntry]] = {kind: {} for kind in KINDS}
+        self._sample_countdown = self.SAMPLE_INTERVAL
+        # The costs of the most expensive entries of each kind, for the metrics, cleared whenever the entries change
+        self._top_costs: Dict[str, List[float]] = {}
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self._sample_countdown = self.SAMPLE_INTERVAL
+
+    def take_sample(self) -> bool:
+        """
+        Whether the next submission to be matched should be profiled
+        """
+        if not self.enabled:
+            return False
+        self._sample_countdown -= 1
+        if self._sample_countdown > 0:
+            return False
+        self._sample_countdown = self.SAMPLE_INTERVAL
+        profiled_submissions.inc()
+        return True
+
+    def record(self, kind: str, key: str, elapsed_ns: int) -> None:
+        entries = self.entries[kind]
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = ProfileEntry()
+        entry.calls += 1
+        entry.total_ns += elapsed_ns
+        self._top_costs.clear()
+
+    def reset(self) -> None:
+        for entries in self.entries.values():
+            entries.clear()
+        self._top_costs.clear()
+
+    def top(self, kind: str, count: int) -> List[ProfileRow]:
+        """
+        Returns the given number of most expensive queries or blocklists, by cumulative evaluation time
+        """
+        most_expensive = heapq.nlargest(count, self.entries[kind].items(), key=lambda item: item[1].total_ns)
+        return [ProfileRow(kind, key, entry.calls, entry.total_ns) for key, entry in most_expensive]
+
+    def top_cost_seconds(self, kind: str, rank: int) -> float:
+        # Each metrics scrape asks for every rank, so the top entries are only found once between changes
+        costs = self._top_costs.get(kind)
+        if costs is None:
+            costs = self._top_costs[kind] = [row.total_seconds for row in self.top(kind, TOP_N_METRICS)]
+        if len(costs) < rank:
+            return 0
+        return costs[rank - 1]
+
+    def to_json(self) -> ProfileJson:
+        return {
+            kind: {key: [entry.calls, entry.total_ns] for key, entry in entries.items()}
+            for kind, entries in self.entries.items()
+        }
+
+    def merge_json(self, data: ProfileJson) -> None:
+        """
+        Adds a profile gathered elsewhere, such as in a matcher process, to this one
+        """
+        for kind, entries in data.items():
+            for key, (calls, total_ns) in entries.items():
+                entry = self.entries[kind].get(key)
+                if entry is None:
+                    entry = self.entries[kind][key] = ProfileEntry()
+                entry.calls += calls
+                entry.total_ns += total_ns
+        self._top_costs.clear()
+
+    def take_json(self) -> ProfileJson:
+        """
+        Returns the profile gathered so far, and clears it, so that it can be merged into another profiler
+        """
+        data = self.to_json()
+        self.reset()
+        return data
+
+
+match_profiler = MatchProfiler()
+gauge_profiling_enabled.set_function(lambda: match_profiler.enabled)
+for _kind in KINDS:
+    for _rank in range(1, TOP_N_METRICS + 1):
+        gauge_slowest_cost.labels(kind=_kind, rank=str(_rank)).set_function(
+            functools.partial(match_profiler.top_cost_seconds, _kind, _rank)
+        )
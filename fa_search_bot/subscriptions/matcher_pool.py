@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from prometheus_client import Counter
+
+from fa_search_bot.subscriptions.match_profiler import match_profiler
+from fa_search_bot.subscriptions.predicate_stats import predicate_stats
+from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+from fa_search_bot.subscriptions.subscription_matcher import SubscriptionMatcher
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from multiprocessing.connection import Connection
+    from multiprocessing.context import SpawnProcess
+    from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+    from fa_search_bot.subscriptions.match_profiler import ProfileJson
+
+    SubscriptionKey = Tuple[str, int]
+
+logger = logging.getLogger(__name__)
+
+worker_failures = Counter(
+    "fasearchbot_fasubwatcher_matcher_pool_failures_total",
+    "Number of times the subscription matcher pool has failed, and matching has fallen back to the event loop",
+)
+
+OP_ADD_SUBSCRIPTION = "add_subscription"
+OP_REMOVE_SUBSCRIPTION = "remove_subscription"
+OP_SET_PAUSED = "set_paused"
+OP_ADD_BLOCK = "add_block"
+OP_REMOVE_BLOCK = "remove_block"
+OP_MATCH = "match"
+OP_MATCH_BATCH = "match_batch"
+OP_SET_PROFILING = "set_profiling"
+OP_RESET_PROFILE = "reset_profile"
+OP_TAKE_PROFILE = "take_profile"
+OP_TAKE_PREDICATE_STATS = "take_predicate_stats"
+OP_STOP = "stop"
+# Operations which send a result back
+REQUEST_OPS = {OP_MATCH, OP_MATCH_BATCH, OP_TAKE_PROFILE, OP_TAKE_PREDICATE_STATS}
+
+
+def subscription_key(subscription: Subscription) -> SubscriptionKey:
+    # Matches the equality and hashing of Subscription
+    return subscription.query_str.casefold(), subscription.destination
+
+
+class MatcherPoolError(Exception):
+    pass
+
+
+class MatcherWorkerState:
+    """
+    The copy of subscriptions and blocklists held by a worker process, kept up to date by the deltas sent from the
+    SubscriptionWatcher.
+    """
+
+    def __init__(self) -> None:
+        self.subscriptions: Dict[SubscriptionKey, Subscription] = {}
+        self.blocklists: Dict[int, DestinationBlocklist] = {}
+        self.matcher = SubscriptionMatcher(self.blocklists)
+
+    def handle(self, op: str, args: Tuple[Any, ...]) -> Any:
+        if op == OP_ADD_SUBSCRIPTION:
+            self.add_subscription(*args)
+        elif op == OP_REMOVE_SUBSCRIPTION:
+            self.remove_subscription(*args)
+        elif op == OP_SET_PAUSED:
+            self.set_paused(*args)
+        elif op == OP_ADD_BLOCK:
+            self.add_block(*args)
+        elif op == OP_REMOVE_BLOCK:
+            self.remove_block(*args)
+        elif op == OP_MATCH:
+            return self.match(*args)
+        elif op == OP_MATCH_BATCH:
+            return self.match_batch(*args)
+        elif op == OP_SET_PROFILING:
+            match_profiler.set_enabled(*args)
+        elif op == OP_RESET_PROFILE:
+            match_profiler.reset()
+        elif op == OP_TAKE_PROFILE:
+            return match_profiler.take_json()
+        elif op == OP_TAKE_PREDICATE_STATS:
+            return predicate_stats.take_new_json()
+        else:
+            raise ValueError(f"Unrecognised matcher operation: {op}")
+        return None
+
+    def add_subscription(self, query_str: str, destination: int, paused: bool) -> None:
+        subscription = Subscription(query_str, destination)
+        subscription.paused = paused
+        self.subscriptions[subscription_key(subscription)] = subscription
+        self.matcher.add_subscription(subscription)
+
+    def remove_subscription(self, query_str: str, destination: int) -> None:
+        subscription = self.subscriptions.pop((query_str.casefold(), destination), None)
+        if subscription is not None:
+            self.matcher.remove_subscription(subscription)
+
+    def set_paused(self, query_str: str, destination: int, paused: bool) -> None:
+        subscription = self.subscriptions.get((query_str.casefold(), destination))
+        if subscription is not None:
+            subscription.paused = paused
+            self.matcher.set_paused(subscription)
+
+    def add_block(self, destination: int, block_query: str) -> None:
+        if destination in self.blocklists:
+            if block_query in self.blocklists[destination].blocklists:
+                self.matcher.remove_block_query(destination, self.blocklists[destination].blocklists[block_query])
+            self.blocklists[destination].add(block_query)
+        else:
+            self.blocklists[destination] = DestinationBlocklist.from_query(destination, block_query)
+        self.matcher.add_block_query(destination, self.blocklists[destination].blocklists[block_query])
+
+    def remove_block(self, destination: int, block_query: str) -> None:
+        blocklist = self.blocklists.get(destination)
+        if blocklist is None or block_query not in blocklist.blocklists:
+            return
+        self.matcher.remove_block_query(destination, blocklist.blocklists[block_query])
+        blocklist.remove(block_query)
+
+    def match(self, target_data: Dict, keys: Optional[List[SubscriptionKey]]) -> List[SubscriptionKey]:
+        target = QueryTarget.from_json(target_data)
+        subscriptions = None
+        if keys is not None:
+            subscriptions = set(self.subscriptions[key] for key in keys if key in self.subscriptions)
+        return [subscription_key(subscription) for subscription in self.matcher.match(target, subscriptions)]
+
+    def match_batch(self, targets_data: List[Dict]) -> List[List[SubscriptionKey]]:
+        targets = [QueryTarget.from_json(target_data) for target_data in targets_data]
+        return [
+            [subscription_key(subscription) for subscription in matches]
+            for matches in self.matcher.match_batch(targets)
+        ]
+
+
+def run_matcher_worker(
+        request_conn: Connection,
+        result_conn: Connection,
+        predicate_stats_filename: Optional[str] = None,
+) -> None:
+    """
+    Entry point of a matcher worker process. Requests are handled in the order they are sent, so deltas always apply
+    before any later match request.
+    """
+    if predicate_stats_filename is not None:
+        # Each worker gathers its own predicate statistics, starting from those saved by the main process. Those it
+        # records are collected and merged into the main process's statistics, before they are saved.
+        predicate_stats.load_from_file(predicate_stats_filename)
+    state = MatcherWorkerState()
+    while True:
+        try:
+            op, args = request_conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if op == OP_STOP:
+            return
+        try:
+            result = state.handle(op, args)
+        except Exception as e:
+            logger.error("Matcher worker failed to handle %s operation", op, exc_info=e)
+            if op in REQUEST_OPS:
+                result_conn.send(e)
+            continue
+        if op in REQUEST_OPS:
+            result_conn.send(result)
+
+
+class MatcherWorker:
+    # Seconds to wait for a result, before the process is assumed to have hung
+    REQUEST_TIMEOUT = 60
+    # Seconds to wait for the process to exit when stopping, before it is terminated
+    STOP_TIMEOUT = 5
+
+    def __init__(
+            self,
+            context: multiprocessing.context.SpawnContext,
+            predicate_stats_filename: Optional[str] = None,
+    ) -> None:
+        worker_request_conn, self.request_conn = context.Pipe(duplex=False)
+        self.result_conn, worker_result_conn = context.Pipe(duplex=False)
+        self.process: SpawnProcess = context.Process(
+            target=run_matcher_worker,
+            args=(worker_request_conn, worker_result_conn, predicate_stats_filename),
+            daemon=True,
+        )
+        self.process.start()
+        # The worker holds its own copies of these ends of the pipes
+        worker_request_conn.close()
+        worker_result_conn.close()
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        # Sends are made from a single thread per worker, so that a full pipe cannot block the event loop, and the
+        # worker still receives everything in the order it was sent
+        self.send_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="matcher_send")
+        self.send_error: Optional[BaseException] = None
+
+    def send(self, op: str, *args: Any) -> Future:
+        try:
+            future = self.send_executor.submit(self.request_conn.send, (op, args))
+        except RuntimeError as e:
+            raise OSError("Subscription matcher process has been stopped") from e
+        future.add_done_callback(self._check_sent)
+        return future
+
+    def _check_sent(self, future: Future) -> None:
+        if future.cancelled() or self.send_error is not None:
+            return
+        self.send_error = future.exception()
+
+    async def request(self, op: str, *args: Any) -> Any:
+        self.pending += 1
+        try:
+            # Only one request is in flight per worker, so results come back in order
+            async with self.lock:
+                await asyncio.wrap_future(self.send(op, *args))
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, self._receive_result)
+        finally:
+            self.pending -= 1
+        if isinstance(result, Exception):
+            raise MatcherPoolError("Subscription matcher process could not match submission") from result
+        return result
+
+    def _receive_result(self) -> Any:
+        # Polling with a timeout means a hung process cannot hold the lock, or an executor thread, forever
+        if not self.result_conn.poll(self.REQUEST_TIMEOUT):
+            raise TimeoutError(f"Subscription matcher process did not respond within {self.REQUEST_TIMEOUT} seconds")
+        return self.result_conn.recv()
+
+    def stop(self) -> None:
+        """
+        Stops the process, waiting for it to exit. This blocks, so should not be called on a running event loop.
+        """
+        try:
+            self.send(OP_STOP)
+        except OSError:
+            pass
+        self.process.join(timeout=self.STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=self.STOP_TIMEOUT)
+        # Once the process has exited, any sends still waiting on the pipe fail straight away
+        self.send_executor.shutdown(wait=True, cancel_futures=True)
+        self.request_conn.close()
+        self.result_conn.close()
+
+
+class MatcherPool:
+    """
+    A pool of worker processes which each keep a resident copy of every subscription and blocklist, so that matching
+    can be moved off the event loop. Once started, the SubscriptionWatcher sends each change to the pool as a delta,
+    and match requests only need to send the QueryTarget.
+    If a worker fails, the whole pool is stopped, and matching falls back to the event loop until the pool is restarted.
+    The pool is restarted by the next match request after a backoff, which doubles with each failure in a row, and
+    the current subscriptions and blocklists are replayed to the new workers.
+    """
+
+    RESTART_BACKOFF = 30
+    MAX_RESTART_BACKOFF = 1800
+
+    def __init__(self, num_workers: int, predicate_stats_filename: Optional[str] = None) -> None:
+        self.num_workers = num_workers
+        self.predicate_stats_filename = predicate_stats_filename
+        self.clock = time.monotonic
+        self.workers: List[MatcherWorker] = []
+        self.subscriptions: Dict[SubscriptionKey, Subscription] = {}
+        # The subscriptions and blocklists which the pool was started with, kept to replay to restarted workers
+        self._subscription_source: Iterable[Subscription] = ()
+        self._blocklist_source: Dict[int, DestinationBlocklist] = {}
+        self.started = False
+        # Number of failures since a request last succeeded, and when the pool is next due to be restarted
+        self.failures = 0
+        self.restart_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self.workers)
+
+    def available(self) -> bool:
+        """
+        Whether match requests should be sent to the pool, either because it is running, or because it is due to be
+        restarted by the next request
+        """
+        return self.running or self._restart_due()
+
+    def start(self, subscriptions: Iterable[Subscription], blocklists: Dict[int, DestinationBlocklist]) -> None:
+        if self.started:
+            raise RuntimeError("Matcher pool is already running")
+        self.started = True
+        self._subscription_source = subscriptions
+        self._blocklist_source = blocklists
+        self._start_workers(self._spawn_workers())
+
+    def _spawn_workers(self) -> List[MatcherWorker]:
+        context = multiprocessing.get_context("spawn")
+        workers = [MatcherWorker(context, self.predicate_stats_filename) for _ in range(self.num_workers)]
+        logger.info("Started %s subscription matcher processes", self.num_workers)
+        return workers
+
+    def _start_workers(self, workers: List[MatcherWorker]) -> None:
+        self.workers = workers
+        self.subscriptions.clear()
+        for subscription in self._subscription_source:
+            self.add_subscription(subscription)
+        for blocklist in self._blocklist_source.values():
+            for block_query in blocklist.blocklists.keys():
+                self.add_block(blocklist.destination, block_query)
+        if match_profiler.enabled:
+            self.set_profiling(True)
+
+    def stop(self) -> None:
+        self.started = False
+        self.restart_at = None
+        workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.stop()
+        self.subscriptions.clear()
+
+    def _restart_due(self) -> bool:
+        return self.restart_at is not None and self.clock() >= self.restart_at
+
+    async def _restart(self) -> None:
+        self.restart_at = None
+        logger.info("Restarting subscription matcher pool, after %s failures", self.failures)
+        loop = asyncio.get_running_loop()
+        workers = await loop.run_in_executor(None, self._spawn_workers)
+        if not self.started:
+            # The pool was stopped while the workers were starting
+            for worker in workers:
+                await loop.run_in_executor(None, worker.stop)
+            return
+        self._start_workers(workers)
+
+    async def _fail(self, worker: MatcherWorker, error: BaseException) -> None:
+        if worker not in self.workers:
+            # The pool has already been stopped because of this failure
+            return
+        self.failures += 1
+        backoff = min(self.RESTART_BACKOFF * 2 ** (self.failures - 1), self.MAX_RESTART_BACKOFF)
+        logger.error(
+            "Subscription matcher process failed, stopping pool and restarting in %s seconds", backoff, exc_info=error
+        )
+        worker_failures.inc()
+        self.restart_at = self.clock() + backoff
+        workers, self.workers = self.workers, []
+        self.subscriptions.clear()
+        loop = asyncio.get_running_loop()
+        for stopped_worker in workers:
+            await loop.run_in_executor(None, stopped_worker.stop)
+
+    async def _check_workers(self) -> None:
+        for worker in self.workers:
+            if worker.send_error is not None:
+                # A worker which misses a delta no longer has the right state, so the whole pool has to stop
+                await self._fail(worker, worker.send_error)
+                raise MatcherPoolError("Failed to send update to subscription matcher process") from worker.send_error
+
+    def _broadcast(self, op: str, *args: Any) -> None:
+        for worker in self.workers:
+            # Failures to send are picked up by the next request
+            worker.send(op, *args)
+
+    def add_subscription(self, subscription: Subscription) -> None:
+        if not self.running:
+            return
+        self.subscriptions[subscription_key(subscription)] = subscription
+        self._broadcast(OP_ADD_SUBSCRIPTION, subscription.query_str, subscription.destination, subscription.paused)
+
+    def remove_subscription(self, subscription: Subscription) -> None:
+        if not self.running:
+            return
+        self.subscriptions.pop(subscription_key(subscription), None)
+        self._broadcast(OP_REMOVE_SUBSCRIPTION, subscription.query_str, subscription.destination)
+
+    def set_paused(self, subscription: Subscription) -> None:
+        self._broadcast(OP_SET_PAUSED, subscription.query_str, subscription.destination, subscription.paused)
+
+    def add_block(self, destination: int, block_query: str) -> None:
+        self._broadcast(OP_ADD_BLOCK, destination, block_query)
+
+    def remove_block(self, destination: int, block_query: str) -> None:
+        self._broadcast(OP_REMOVE_BLOCK, destination, block_query)
+
+    def set_profiling(self, enabled: bool) -> None:
+        self._broadcast(OP_SET_PROFILING, enabled)
+
+    def reset_profile(self) -> None:
+        self._broadcast(OP_RESET_PROFILE)
+
+    async def take_profiles(self) -> List[ProfileJson]:
+        """
+        Collects the match profile gathered by each worker since it was last collected
+        """
+        return await self._request_all(OP_TAKE_PROFILE)
+
+    async def take_predicate_stats(self) -> List[Dict[str, List[int]]]:
+        """
+        Collects the predicate statistics recorded by each worker since they were last collected
+        """
+        return await self._request_all(OP_TAKE_PREDICATE_STATS)
+
+    async def _request_all(self, op: str) -> List[Any]:
+        if not self.running:
+            return []
+        await self._check_workers()
+        results = []
+        for worker in self.workers[:]:
+            results.append(await self._request_worker(worker, op))
+        return results
+
+    async def match(
+            self,
+            target: QueryTarget,
+            subscriptions: Optional[Set[Subscription]] = None,
+    ) -> List[Subscription]:
+        keys = None
+        if subscriptions is not None:
+            keys = [subscription_key(subscription) for subscription in subscriptions]
+        result_keys = await self._request(OP_MATCH, target.to_json(), keys)
+        return self._resolve(result_keys)
+
+    async def match_batch(self, targets: List[QueryTarget]) -> List[List[Subscription]]:
+        results = await self._request(OP_MATCH_BATCH, [target.to_json() for target in targets])
+        return [self._resolve(result_keys) for result_keys in results]
+
+    async def _request(self, op: str, *args: Any) -> Any:
+        if not self.running and self._restart_due():
+            await self._restart()
+        if not self.running:
+            raise MatcherPoolError("Matcher pool is not running")
+        await self._check_workers()
+        worker = min(self.workers, key=lambda w: w.pending)
+        return await self._request_worker(worker, op, *args)
+
+    async def _request_worker(self, worker: MatcherWorker, op: str, *args: Any) -> Any:
+        try:
+            result = await worker.request(op, *args)
+        except (EOFError, OSError, ValueError, TimeoutError) as e:
+            await self._fail(worker, e)
+            raise MatcherPoolError("Subscription matcher process failed") from e
+        self.failures = 0
+        return result
+
+    def _resolve(self, result_keys: List[SubscriptionKey]) -> List[Subscription]:
+        matches = [self.subscriptions.get(key) for key in result_keys]
+        # Subscriptions may have been paused or removed while the worker was matching
+        return [subscription for subscription in matches if subscription is not None and not subscription.paused]
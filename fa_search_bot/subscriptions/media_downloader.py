@@ -73,7 +73,7 @@ class MediaDownloader(Runnable):
             full_data = await self.watcher.wait_pool.get_next_for_media_download()
         except QueueEmpty:
             with time_taken_waiting.time():
-                await self._wait_while_running(self.QUEUE_BACKOFF)
+                await self._wait_while_running(self.QUEUE_WAIT_TIMEOUT, self.watcher.wait_pool.download_signal)
             return
         sendable = SendableFASubmission(full_data)
         sub_id = sendable.submission_id
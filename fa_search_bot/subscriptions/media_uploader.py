@@ -58,7 +58,7 @@ class MediaUploader(Runnable):
             sub_state = await self.watcher.wait_pool.get_next_for_media_upload()
         except QueueEmpty:
             with time_taken_waiting.time():
-                await self._wait_while_running(self.QUEUE_BACKOFF)
+                await self._wait_while_running(self.QUEUE_WAIT_TIMEOUT, self.watcher.wait_pool.upload_signal)
             return
         sub_id = sub_state.sub_id
         self.last_processed = sub_id
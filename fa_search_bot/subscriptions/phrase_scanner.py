@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import collections
+import logging
+from typing import TYPE_CHECKING
+
+from fa_search_bot.subscriptions.query_parser import (
+    AndQuery,
+    ExceptionQuery,
+    NotQuery,
+    OrQuery,
+    PhraseQuery,
+    Query,
+)
+from fa_search_bot.subscriptions.query_target import (
+    AnyField,
+    ArtistField,
+    DescriptionField,
+    KeywordField,
+    TitleField,
+    case_folds_simply,
+    punctuation,
+)
+
+if TYPE_CHECKING:
+    from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Type
+
+    from fa_search_bot.subscriptions.query_target import Field, QueryTarget
+
+logger = logging.getLogger(__name__)
+
+_punctuation_chars = frozenset(punctuation)
+_specific_fields: List[Type[Field]] = [TitleField, DescriptionField, KeywordField, ArtistField]
+
+
+def _is_boundary(char: str) -> bool:
+    # Matches the characters allowed either side of a phrase by boundary_pattern_start and boundary_pattern_end
+    return char.isspace() or char in _punctuation_chars
+
+
+def query_phrases(query: Query) -> Iterable[PhraseQuery]:
+    if isinstance(query, PhraseQuery):
+        yield query
+    elif isinstance(query, (AndQuery, OrQuery)):
+        for sub_query in query.sub_queries:
+            yield from query_phrases(sub_query)
+    elif isinstance(query, NotQuery):
+        yield from query_phrases(query.sub_query)
+    elif isinstance(query, ExceptionQuery):
+        yield from query_phrases(query.word)
+        yield from query_phrases(query.exception)
+
+
+class FieldPhraseHits:
+    def __init__(self, phrases: Set[str], unscanned_texts: List[str]) -> None:
+        self.phrases = phrases
+        # Texts which the automaton could not scan, and which must still be checked with the phrase regex
+        self.unscanned_texts = unscanned_texts
+
+
+class PhraseHits:
+    """
+    The phrases which were found in each field of a QueryTarget. Fields are only scanned when first requested.
+    """
+
+    def __init__(self, scanner: PhraseScanner, target: QueryTarget) -> None:
+        self.scanner = scanner
+        self.target = target
+        self._version = -1
+        self.scanned_phrases: FrozenSet[str] = frozenset()
+        self._field_hits: Dict[Type[Field], FieldPhraseHits] = {}
+
+    def _refresh(self) -> None:
+        # If the scanner's phrases have changed since fields were scanned, those results are stale
+        if self._version != self.scanner.version:
+            self.scanned_phrases = self.scanner.phrase_set()
+            self._version = self.scanner.version
+            self._field_hits.clear()
+
+    def is_scanned(self, phrase: str) -> bool:
+        self._refresh()
+        return phrase in self.scanned_phrases
+
+    def for_field(self, field: Type[Field]) -> FieldPhraseHits:
+        self._refresh()
+        field_hits = self._field_hits.get(field)
+        if field_hits is not None:
+            return field_hits
+        if field is AnyField:
+            phrases: Set[str] = set()
+            unscanned: List[str] = []
+            for specific_field in _specific_fields:
+                specific_hits = self.for_field(specific_field)
+                phrases.update(specific_hits.phrases)
+                unscanned.extend(specific_hits.unscanned_texts)
+            field_hits = FieldPhraseHits(phrases, unscanned)
+        else:
+            field_hits = self.scanner.scan_texts(field.get_field(self.target).texts())
+        self._field_hits[field] = field_hits
+        return field_hits
+
+
+class PhraseScanner:
+    """
+    An Aho-Corasick automaton over the phrase literals of every registered query, which can find all of those phrases
+    in a text with a single pass, rather than running one regex per phrase.
+    Phrases are reference counted, so that they can be added and removed along with the queries which use them. Adding
+    a phrase extends the trie in place, and the failure links are recalculated lazily on the next scan.
+    """
+    ROOT = 0
+
+    def __init__(self) -> None:
+        self._phrase_counts: Dict[str, int] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terminal: List[Optional[str]] = [None]
+        self._fail: List[int] = [self.ROOT]
+        self._outputs: List[tuple[str, ...]] = [()]
+        self._links_dirty = False
+        self._dead_nodes = 0
+        self._phrase_set: FrozenSet[str] = frozenset()
+        self.version = 0
+
+    def add_query(self, query: Query) -> None:
+        for phrase_query in query_phrases(query):
+            self.add_phrase(phrase_query.phrase)
+
+    def remove_query(self, query: Query) -> None:
+        for phrase_query in query_phrases(query):
+            self.remove_phrase(phrase_query.phrase)
+
+    def add_phrase(self, phrase: str) -> None:
+        if not phrase or not case_folds_simply(phrase):
+            return
+        phrase = phrase.lower()
+        count = self._phrase_counts.get(phrase, 0)
+        self._phrase_counts[phrase] = count + 1
+        if count == 0:
+            self._insert(phrase)
+
+    def remove_phrase(self, phrase: str) -> None:
+        phrase = phrase.lower()
+        count = self._phrase_counts.get(phrase)
+        if count is None:
+            return
+        if count > 1:
+            self._phrase_counts[phrase] = count - 1
+            return
+        del self._phrase_counts[phrase]
+        node = self._find(phrase)
+        if node is not None:
+            self._terminal[node] = None
+        self._dead_nodes += len(phrase)
+        self._links_dirty = True
+        self.version += 1
+
+    def phrase_set(self) -> FrozenSet[str]:
+        self._update_links()
+        return self._phrase_set
+
+    def count_phrases(self) -> int:
+        return len(self._phrase_counts)
+
+    def attach(self, target: QueryTarget) -> None:
+        """
+        Attach lazily evaluated phrase hits to the query target, which PhraseQuery matching will then use
+        """
+        target.phrase_hits = PhraseHits(self, target)
+
+    def _find(self, phrase: str) -> Optional[int]:
+        node = self.ROOT
+        for char in phrase:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                return None
+            node = next_node
+        return node
+
+    def _insert(self, phrase: str) -> None:
+        node = self.ROOT
+        for char in phrase:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._terminal.append(None)
+                self._fail.append(self.ROOT)
+                self._outputs.append(())
+                self._goto[node][char] = next_node
+            node = next_node
+        self._terminal[node] = phrase
+        self._links_dirty = True
+        self.version += 1
+
+    def _rebuild_trie(self) -> None:
+        self._goto = [{}]
+        self._terminal = [None]
+        self._fail = [self.ROOT]
+        self._outputs = [()]
+        self._dead_nodes = 0
+        for phrase in self._phrase_counts.keys():
+            self._insert(phrase)
+
+    def _update_links(self) -> None:
+        if not self._links_dirty:
+            return
+        # If many phrases have been removed, compact the trie rather than keep scanning through dead branches
+        if self._dead_nodes > len(self._goto) // 2:
+            self._rebuild_trie()
+        # Breadth first walk to set failure links, and collect outputs along them
+        queue: Deque[int] = collections.deque()
+        self._outputs[self.ROOT] = ()
+        for child in self._goto[self.ROOT].values():
+            self._fail[child] = self.ROOT
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            terminal = self._terminal[node]
+            inherited = self._outputs[self._fail[node]]
+            self._outputs[node] = (terminal, *inherited) if terminal is not None else inherited
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback != self.ROOT and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, self.ROOT)
+                queue.append(child)
+        self._phrase_set = frozenset(self._phrase_counts.keys())
+        self._links_dirty = False
+
+    def scan(self, text: str) -> Set[str]:
+        """
+        Returns the set of registered phrases which appear in the text, bounded by whitespace, punctuation, or the
+        ends of the text. The text must pass case_folds_simply()
+        """
+        self._update_links()
+        hits: Set[str] = set()
+        if not self._phrase_counts:
+            return hits
+        lowered = text.lower()
+        text_len = len(lowered)
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        node = self.ROOT
+        for index, char in enumerate(lowered):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, self.ROOT)
+            if not outputs[node]:
+                continue
+            end = index + 1
+            if end != text_len and not _is_boundary(lowered[end]):
+                continue
+            for phrase in outputs[node]:
+                start = end - len(phrase)
+                if start == 0 or _is_boundary(lowered[start - 1]):
+                    hits.add(phrase)
+        return hits
+
+    def scan_texts(self, texts: Iterable[str]) -> FieldPhraseHits:
+        phrases: Set[str] = set()
+        unscanned: List[str] = []
+        for text in texts:
+            if case_folds_simply(text):
+                phrases.update(self.scan(text))
+            else:
+                unscanned.append(text)
+        return FieldPhraseHits(phrases, unscanned)
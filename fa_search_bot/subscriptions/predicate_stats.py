@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING
+
+from prometheus_client import Counter, Gauge
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+predicate_samples = Counter(
+    "fasearchbot_fasubwatcher_predicate_samples_total",
+    "Number of submissions matched with sampling, in which every sub-query was timed to gather cost and pass rate "
+    "statistics",
+)
+predicate_reorders = Counter(
+    "fasearchbot_fasubwatcher_predicate_reorders_total",
+    "Number of times the sub-queries of an AND or OR query have been reordered, based on their runtime statistics",
+)
+gauge_predicate_count = Gauge(
+    "fasearchbot_fasubwatcher_predicate_stats_count",
+    "Number of distinct sub-queries which have runtime cost and pass rate statistics",
+)
+gauge_predicate_pass_rate = Gauge(
+    "fasearchbot_fasubwatcher_predicate_mean_pass_rate",
+    "Mean pass rate of the sub-queries which have runtime statistics",
+)
+gauge_predicate_cost = Gauge(
+    "fasearchbot_fasubwatcher_predicate_mean_cost_seconds",
+    "Mean time taken to check the sub-queries which have runtime statistics",
+)
+
+# Avoids dividing by zero for predicates which always, or never, pass
+_MIN_PROBABILITY = 0.001
+
+
+class PredicateStat:
+    __slots__ = ("calls", "passes", "total_ns", "last_recorded", "new_calls", "new_passes", "new_ns")
+
+    # Once this many calls are recorded, the counts are halved, so that the statistics follow changes in traffic
+    MAX_CALLS = 10_000
+
+    def __init__(
+            self,
+            calls: int = 0,
+            passes: int = 0,
+            total_ns: int = 0,
+            last_recorded: Optional[float] = None,
+    ) -> None:
+        self.calls = calls
+        self.passes = passes
+        self.total_ns = total_ns
+        # Unix time at which a call was last recorded, so that statistics for sub-queries which are no longer used can
+        # be dropped
+        self.last_recorded = time.time() if last_recorded is None else last_recorded
+        # Calls recorded since the new calls were last taken, to be merged into the statistics of another process
+        self.new_calls = 0
+        self.new_passes = 0
+        self.new_ns = 0
+
+    def record(self, elapsed_ns: int, passed: bool) -> None:
+        self.calls += 1
+        self.passes += passed
+        self.total_ns += elapsed_ns
+        self.new_calls += 1
+        self.new_passes += passed
+        self.new_ns += elapsed_ns
+        self.last_recorded = time.time()
+        if self.calls >= self.MAX_CALLS:
+            self._halve()
+
+    def merge(self, calls: int, passes: int, total_ns: int) -> None:
+        self.calls += calls
+        self.passes += passes
+        self.total_ns += total_ns
+        self.last_recorded = time.time()
+        while self.calls >= self.MAX_CALLS:
+            self._halve()
+
+    def _halve(self) -> None:
+        self.calls //= 2
+        self.passes //= 2
+        self.total_ns //= 2
+
+    def take_new(self) -> List[int]:
+        new = [self.new_calls, self.new_passes, self.new_ns]
+        self.new_calls = self.new_passes = self.new_ns = 0
+        return new
+
+    @property
+    def cost_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0
+
+    @property
+    def pass_rate(self) -> float:
+        return self.passes / self.calls if self.calls else 0
+
+    def to_json(self) -> List[Union[int, float]]:
+        return [self.calls, self.passes, self.total_ns, self.last_recorded]
+
+
+class PredicateStats:
+    """
+    Runtime cost and pass rate of the sub-queries of compiled AND and OR queries, gathered by sampling live matching.
+    Sub-queries are keyed by their repr(), so that the statistics are shared by every query which contains them, and
+    can be saved and loaded across restarts. Statistics for sub-queries which have not been evaluated for a while are
+    dropped when saving, as no subscription is likely to use them any more.
+    The sub-queries of an AND query are ordered by cost divided by rejection probability, and those of an OR query by
+    cost divided by pass probability, so that evaluation short-circuits as cheaply as possible.
+    """
+
+    # One in this many submissions is matched with sampling, and each AND or OR query is reordered after this many of
+    # its sampled evaluations
+    SAMPLE_INTERVAL = 32
+    REORDER_INTERVAL = 8
+    # Sub-queries are only reordered once each has at least this many recorded calls
+    MIN_CALLS = 16
+    SAVE_INTERVAL_SECONDS = 300
+    MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+    def __init__(self) -> None:
+        self.stats: Dict[str, PredicateStat] = {}
+        self.last_saved = time.monotonic()
+        self._sample_countdown = self.SAMPLE_INTERVAL
+
+    def record(self, key: str, elapsed_ns: int, passed: bool) -> None:
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = PredicateStat()
+        stat.record(elapsed_ns, passed)
+
+    def score(self, key: str, is_and: bool) -> Optional[float]:
+        stat = self.stats.get(key)
+        if stat is None or stat.calls < self.MIN_CALLS:
+            return None
+        # For AND queries, a rejection short-circuits, for OR queries a pass does
+        short_circuit_rate = (1 - stat.pass_rate) if is_and else stat.pass_rate
+        return stat.cost_ns / max(short_circuit_rate, _MIN_PROBABILITY)
+
+    def order(self, keys: Sequence[str], is_and: bool) -> Optional[List[int]]:
+        """
+        Returns the indexes of the given sub-query keys, in the order they should be checked, or None if there are not
+        yet enough statistics for all of them.
+        """
+        scores = []
+        for key in keys:
+            score = self.score(key, is_and)
+            if score is None:
+                return None
+            scores.append(score)
+        return sorted(range(len(keys)), key=lambda index: scores[index])
+
+    def mean_pass_rate(self) -> float:
+        if not self.stats:
+            return 0
+        return sum(stat.pass_rate for stat in self.stats.values()) / len(self.stats)
+
+    def mean_cost_seconds(self) -> float:
+        if not self.stats:
+            return 0
+        return sum(stat.cost_ns for stat in self.stats.values()) / len(self.stats) / 1e9
+
+    def take_sample(self) -> bool:
+        """
+        Whether the next submission to be matched should be sampled
+        """
+        self._sample_countdown -= 1
+        if self._sample_countdown > 0:
+            return False
+        self._sample_countdown = self.SAMPLE_INTERVAL
+        predicate_samples.inc()
+        return True
+
+    def save_due(self) -> bool:
+        return time.monotonic() - self.last_saved >= self.SAVE_INTERVAL_SECONDS
+
+    def to_json(self) -> Dict[str, List[Union[int, float]]]:
+        return {key: stat.to_json() for key, stat in self.stats.items()}
+
+    def load_json(self, data: Dict[str, List[Union[int, float]]]) -> None:
+        for key, values in data.items():
+            # Statistics saved before the last recorded time was kept are treated as recorded now
+            calls, passes, total_ns, *last_recorded = values
+            self.stats[key] = PredicateStat(int(calls), int(passes), int(total_ns), *last_recorded)
+
+    def take_new_json(self) -> Dict[str, List[int]]:
+        """
+        Returns the calls recorded since this was last called, so that they can be merged into another process's
+        statistics without counting any of them twice
+        """
+        return {key: stat.take_new() for key, stat in self.stats.items() if stat.new_calls}
+
+    def merge_json(self, data: Dict[str, List[int]]) -> None:
+        for key, (calls, passes, total_ns) in data.items():
+            stat = self.stats.get(key)
+            if stat is None:
+                stat = self.stats[key] = PredicateStat()
+            stat.merge(calls, passes, total_ns)
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.MAX_AGE_SECONDS
+        stale_keys = [key for key, stat in self.stats.items() if stat.last_recorded < cutoff]
+        for key in stale_keys:
+            del self.stats[key]
+        if stale_keys:
+            logger.info("Dropped runtime statistics for %s unused query predicates", len(stale_keys))
+
+    def save_to_file(self, filename: str) -> None:
+        self.prune()
+        temp_filename = f"{filename}.temp"
+        with open(temp_filename, "w") as f:
+            json.dump(self.to_json(), f)
+        os.replace(temp_filename, filename)
+        self.last_saved = time.monotonic()
+
+    def load_from_file(self, filename: str) -> None:
+        try:
+            with open(filename, "r") as f:
+                self.load_json(json.load(f))
+        except FileNotFoundError:
+            return
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning("Could not load predicate statistics from %s", filename, exc_info=e)
+            return
+        logger.info("Loaded runtime statistics for %s query predicates", len(self.stats))
+
+
+predicate_stats = PredicateStats()
+gauge_predicate_count.set_function(lambda: len(predicate_stats.stats))
+gauge_predicate_pass_rate.set_function(predicate_stats.mean_pass_rate)
+gauge_predicate_cost.set_function(predicate_stats.mean_cost_seconds)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import bisect
 import functools
 import logging
+import operator
 import re
+import time
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Type
+from typing import TYPE_CHECKING, Callable, Type
 
 import pyparsing
 from pyparsing import (
@@ -20,9 +23,11 @@ from pyparsing import (
 )
 
 from fa_search_bot.sites.submission import Rating
+from fa_search_bot.subscriptions.predicate_stats import predicate_reorders, predicate_stats
 from fa_search_bot.subscriptions.query_target import FieldLocation, QueryTarget, Field, AnyField, \
     boundary_pattern_start, boundary_pattern_end, not_punctuation_pattern, ArtistField, KeywordField, DescriptionField, \
     TitleField
+from fa_search_bot.subscriptions.wildcard import WildcardPattern
 
 if TYPE_CHECKING:
     from typing import Any, Optional, Pattern, Sequence
@@ -74,17 +79,56 @@ class MatchLocation:
         return f"MatchLocation(FieldLocation({self.field}), {self.start_position}, {self.end_position})"
 
 
+QueryMatcher = Callable[[QueryTarget], bool]
+
+
+def _always_true(sub: QueryTarget) -> bool:
+    return True
+
+
+def _always_false(sub: QueryTarget) -> bool:
+    return False
+
+
+_field_getters: dict[Type[Field], Callable[[QueryTarget], Field]] = {
+    AnyField: operator.attrgetter("any_field"),
+    TitleField: operator.attrgetter("title"),
+    DescriptionField: operator.attrgetter("description"),
+    KeywordField: operator.attrgetter("keywords"),
+    ArtistField: operator.attrgetter("artist"),
+}
+
+
+def _field_getter(field: Type[Field]) -> Callable[[QueryTarget], Field]:
+    # Resolve the field lookup once at compile time, rather than calling get_field() on every match
+    return _field_getters.get(field, field.get_field)
+
+
 class Query(ABC):
     @abstractmethod
     def matches_submission(self, sub: QueryTarget) -> bool:
         raise NotImplementedError
 
+    def compile(self) -> QueryMatcher:
+        """
+        Returns a callable which gives the same result as matches_submission(), but with as much work as possible done
+        up front. Sub-classes override this to specialise their matching.
+        """
+        return self.matches_submission
+
 
 class LocationQuery(Query, ABC):
     @abstractmethod
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
         raise NotImplementedError
 
+    @abstractmethod
+    def location_patterns(self) -> list[Pattern[str]]:
+        """
+        The compiled patterns whose matches in the field texts give the match locations
+        """
+        raise NotImplementedError
+
 
 class OrQuery(Query):
     def __init__(self, sub_queries: Sequence["Query"]):
@@ -98,6 +142,9 @@ class OrQuery(Query):
     def matches_submission(self, sub: QueryTarget) -> bool:
         return any(q.matches_submission(sub) for q in self.sub_queries)
 
+    def compile(self) -> QueryMatcher:
+        return _compile_or(self.sub_queries)
+
     def __eq__(self, other: Any) -> bool:
         return (
             isinstance(other, OrQuery)
@@ -126,6 +173,9 @@ class LocationOrQuery(OrQuery, LocationQuery):
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
         return list(set(match for q in self.sub_queries for match in q.match_locations(sub)))
 
+    def location_patterns(self) -> list[Pattern[str]]:
+        return [pattern for q in self.sub_queries for pattern in q.location_patterns()]
+
 
 class AndQuery(Query):
     def __init__(self, sub_queries: list["Query"]):
@@ -139,6 +189,9 @@ class AndQuery(Query):
     def matches_submission(self, sub: QueryTarget) -> bool:
         return all(q.matches_submission(sub) for q in self.sub_queries)
 
+    def compile(self) -> QueryMatcher:
+        return _compile_and(self.sub_queries)
+
     def __eq__(self, other: Any) -> bool:
         return (
             isinstance(other, AndQuery)
@@ -160,6 +213,24 @@ class NotQuery(Query):
     def matches_submission(self, sub: QueryTarget) -> bool:
         return not self.sub_query.matches_submission(sub)
 
+    def compile(self) -> QueryMatcher:
+        if isinstance(self.sub_query, NotQuery):
+            return self.sub_query.sub_query.compile()
+        sub_matcher = self.sub_query.compile()
+        if sub_matcher is _always_true:
+            return _always_false
+        if sub_matcher is _always_false:
+            return _always_true
+
+        def matcher(sub: QueryTarget) -> bool:
+            return not sub_matcher(sub)
+
+        sampling_sub_matcher = sampling_matcher(sub_matcher)
+        if sampling_sub_matcher is not sub_matcher:
+            matcher.sampling_matcher = lambda sub: not sampling_sub_matcher(sub)  # type: ignore[attr-defined]
+
+        return matcher
+
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, NotQuery) and self.sub_query == other.sub_query
 
@@ -177,6 +248,9 @@ class RatingQuery(Query):
     def matches_submission(self, sub: QueryTarget) -> bool:
         return sub.rating == self.rating
 
+    def compile(self) -> QueryMatcher:
+        return _compile_ratings({self.rating})
+
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, RatingQuery) and self.rating == other.rating
 
@@ -190,21 +264,28 @@ class RatingQuery(Query):
 class WordQuery(LocationQuery):
     def __init__(self, word: str, field: Optional[Type[Field]] = None):
         self.word = word
+        self.word_lower = word.lower()
+        self.location_regex = re.compile(boundary_pattern_start + re.escape(word) + boundary_pattern_end, re.I)
         if field is None:
             field = AnyField
         self.field = field
 
     def matches_submission(self, sub: QueryTarget) -> bool:
-        return self.word.lower() in self.field.get_field(sub).words()
+        return self.field.get_field(sub).tokens().has_word(self.word_lower)
+
+    def compile(self) -> QueryMatcher:
+        return _compile_words_all(self.field, {self.word_lower})
 
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
-        regex = re.compile(boundary_pattern_start + re.escape(self.word) + boundary_pattern_end, re.I)
         return [
             MatchLocation(location, m.start(), m.end())
             for location, text in self.field.get_field(sub).texts_dict().items()
-            for m in regex.finditer(text)
+            for m in self.location_regex.finditer(text)
         ]
 
+    def location_patterns(self) -> list[Pattern[str]]:
+        return [self.location_regex]
+
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, WordQuery) and self.word == other.word and self.field == other.field
 
@@ -222,27 +303,45 @@ class WordQuery(LocationQuery):
 class PrefixQuery(LocationQuery):
     def __init__(self, prefix: str, field: Optional[Type[Field]] = None):
         self.prefix = prefix
+        self.prefix_lower = prefix.lower()
+        self.location_regex = re.compile(
+            boundary_pattern_start + re.escape(prefix) + not_punctuation_pattern + boundary_pattern_end,
+            re.I,
+        )
         if field is None:
             field = AnyField
         self.field = field
 
     def matches_submission(self, sub: QueryTarget) -> bool:
-        return any(
-            word.startswith(self.prefix.lower()) and word != self.prefix.lower()
-            for word in self.field.get_field(sub).words()
-        )
+        # If the submission's words have been scanned for this prefix already, check those results
+        affix_hits = sub.affix_hits
+        if affix_hits is not None and affix_hits.is_scanned_prefix(self.prefix_lower):
+            return self.prefix_lower in affix_hits.for_field(self.field).prefixes
+        return self.field.get_field(sub).tokens().has_prefix(self.prefix_lower)
+
+    def compile(self) -> QueryMatcher:
+        get_field = _field_getter(self.field)
+        field = self.field
+        prefix = self.prefix_lower
+
+        def matcher(sub: QueryTarget) -> bool:
+            affix_hits = sub.affix_hits
+            if affix_hits is not None and affix_hits.is_scanned_prefix(prefix):
+                return prefix in affix_hits.for_field(field).prefixes
+            return get_field(sub).tokens().has_prefix(prefix)
+
+        return matcher
 
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
-        regex = re.compile(
-            boundary_pattern_start + re.escape(self.prefix) + not_punctuation_pattern + boundary_pattern_end,
-            re.I,
-        )
         return [
             MatchLocation(location, m.start(), m.end())
             for location, text in self.field.get_field(sub).texts_dict().items()
-            for m in regex.finditer(text)
+            for m in self.location_regex.finditer(text)
         ]
 
+    def location_patterns(self) -> list[Pattern[str]]:
+        return [self.location_regex]
+
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, PrefixQuery) and self.prefix == other.prefix and self.field == other.field
 
@@ -260,27 +359,45 @@ class PrefixQuery(LocationQuery):
 class SuffixQuery(LocationQuery):
     def __init__(self, suffix: str, field: Optional[Type[Field]] = None):
         self.suffix = suffix
+        self.suffix_lower = suffix.lower()
+        self.location_regex = re.compile(
+            boundary_pattern_start + not_punctuation_pattern + re.escape(suffix) + boundary_pattern_end,
+            re.I,
+        )
         if field is None:
             field = AnyField
         self.field = field
 
     def matches_submission(self, sub: QueryTarget) -> bool:
-        return any(
-            word.endswith(self.suffix.lower()) and word != self.suffix.lower()
-            for word in self.field.get_field(sub).words()
-        )
+        # If the submission's words have been scanned for this suffix already, check those results
+        affix_hits = sub.affix_hits
+        if affix_hits is not None and affix_hits.is_scanned_suffix(self.suffix_lower):
+            return self.suffix_lower in affix_hits.for_field(self.field).suffixes
+        return self.field.get_field(sub).tokens().has_suffix(self.suffix_lower)
+
+    def compile(self) -> QueryMatcher:
+        get_field = _field_getter(self.field)
+        field = self.field
+        suffix = self.suffix_lower
+
+        def matcher(sub: QueryTarget) -> bool:
+            affix_hits = sub.affix_hits
+            if affix_hits is not None and affix_hits.is_scanned_suffix(suffix):
+                return suffix in affix_hits.for_field(field).suffixes
+            return get_field(sub).tokens().has_suffix(suffix)
+
+        return matcher
 
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
-        regex = re.compile(
-            boundary_pattern_start + not_punctuation_pattern + re.escape(self.suffix) + boundary_pattern_end,
-            re.I,
-        )
         return [
             MatchLocation(location, m.start(), m.end())
             for location, text in self.field.get_field(sub).texts_dict().items()
-            for m in regex.finditer(text)
+            for m in self.location_regex.finditer(text)
         ]
 
+    def location_patterns(self) -> list[Pattern[str]]:
+        return [self.location_regex]
+
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, SuffixQuery) and self.suffix == other.suffix and self.field == other.field
 
@@ -296,15 +413,48 @@ class SuffixQuery(LocationQuery):
 
 
 class RegexQuery(LocationQuery):
-    def __init__(self, pattern: Pattern[str], field: Optional[Type[Field]] = None):
+    def __init__(
+            self,
+            pattern: Pattern[str],
+            field: Optional[Type[Field]] = None,
+            wildcard: Optional[WildcardPattern] = None,
+    ):
         self.pattern = pattern
         if field is None:
             field = AnyField
         self.field = field
+        # If set, this is used for matching instead of the regex, which is then only used for match locations
+        self.wildcard = wildcard
 
     def matches_submission(self, sub: QueryTarget) -> bool:
+        if self.wildcard is not None:
+            simple_words, other_words = self.field.get_field(sub).tokens().split_words()
+            if self.wildcard.matches_any(simple_words):
+                return True
+            return any(self.pattern.search(word) for word in other_words)
         return any(self.pattern.search(word) for word in self.field.get_field(sub).words())
 
+    def compile(self) -> QueryMatcher:
+        get_field = _field_getter(self.field)
+        search = self.pattern.search
+        wildcard = self.wildcard
+        if wildcard is not None:
+            wildcard_matches = wildcard.matches
+
+            def wildcard_matcher(sub: QueryTarget) -> bool:
+                simple_words, other_words = get_field(sub).tokens().split_words()
+                for word in simple_words:
+                    if wildcard_matches(word):
+                        return True
+                return any(search(word) for word in other_words)
+
+            return wildcard_matcher
+
+        def matcher(sub: QueryTarget) -> bool:
+            return any(search(word) for word in get_field(sub).words())
+
+        return matcher
+
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
         return [
             MatchLocation(location, m.start(), m.end())
@@ -312,13 +462,16 @@ class RegexQuery(LocationQuery):
             for m in self.pattern.finditer(text)
         ]
 
+    def location_patterns(self) -> list[Pattern[str]]:
+        return [self.pattern]
+
     @classmethod
     def from_string_with_asterisks(cls, word: str, field: Optional[Type[Field]] = None) -> "RegexQuery":
         word_split = re.split(r"\*+", word)
         parts = [re.escape(part) for part in word_split]
         regex = boundary_pattern_start + not_punctuation_pattern.join(parts) + boundary_pattern_end
         pattern = re.compile(regex, re.I)
-        return RegexQuery(pattern, field)
+        return RegexQuery(pattern, field, WildcardPattern.from_string(word))
 
     def __eq__(self, other: Any) -> bool:
         return (
@@ -341,14 +494,37 @@ class RegexQuery(LocationQuery):
 class PhraseQuery(LocationQuery):
     def __init__(self, phrase: str, field: Optional[Type[Field]] = None):
         self.phrase = phrase
+        self.phrase_lower = phrase.lower()
         self.phrase_regex = re.compile(boundary_pattern_start + re.escape(self.phrase) + boundary_pattern_end, re.I)
         if field is None:
             field = AnyField
         self.field = field
 
     def matches_submission(self, sub: QueryTarget) -> bool:
+        # If the submission has been scanned for this phrase already, check those results
+        phrase_hits = sub.phrase_hits
+        if phrase_hits is not None and phrase_hits.is_scanned(self.phrase_lower):
+            field_hits = phrase_hits.for_field(self.field)
+            if self.phrase_lower in field_hits.phrases:
+                return True
+            return any(self.phrase_regex.search(text) for text in field_hits.unscanned_texts)
         return any(self.phrase_regex.search(text) for text in self.field.get_field(sub).texts())
 
+    def compile(self) -> QueryMatcher:
+        get_field = _field_getter(self.field)
+        field = self.field
+        phrase = self.phrase_lower
+        search = self.phrase_regex.search
+
+        def matcher(sub: QueryTarget) -> bool:
+            phrase_hits = sub.phrase_hits
+            if phrase_hits is not None and phrase_hits.is_scanned(phrase):
+                field_hits = phrase_hits.for_field(field)
+                return phrase in field_hits.phrases or any(search(text) for text in field_hits.unscanned_texts)
+            return any(search(text) for text in get_field(sub).texts())
+
+        return matcher
+
     def match_locations(self, sub: QueryTarget) -> list[MatchLocation]:
         return [
             MatchLocation(location, m.start(), m.end())
@@ -356,6 +532,9 @@ class PhraseQuery(LocationQuery):
             for m in self.phrase_regex.finditer(text)
         ]
 
+    def location_patterns(self) -> list[Pattern[str]]:
+        return [self.phrase_regex]
+
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, PhraseQuery) and self.phrase == other.phrase and self.field == other.field
 
@@ -374,11 +553,33 @@ class ExceptionQuery(Query):
     def __init__(self, word: LocationQuery, exception: LocationQuery):
         self.word = word
         self.exception = exception
+        self.word_patterns = word.location_patterns()
+        self.exception_patterns = exception.location_patterns()
+        # Both sides are normally over the same field, so they can be checked one text at a time
+        self.field: Optional[Type[Field]] = getattr(word, "field", None)
+        if self.field is None or self.field != getattr(exception, "field", self.field):
+            self.field = None
+        # Phrase matching can use the phrase scanner, and gives the same result as searching for match locations
+        self.exception_is_phrases = all(isinstance(q, PhraseQuery) for q in _location_leaves(exception))
 
     def matches_submission(self, sub: QueryTarget) -> bool:
-        word_locations = self.word.match_locations(sub)
-        exception_locations = self.exception.match_locations(sub)
-        return any(not location.overlaps_any(exception_locations) for location in word_locations)
+        if self.field is None:
+            word_locations = self.word.match_locations(sub)
+            exception_locations = self.exception.match_locations(sub)
+            return any(not location.overlaps_any(exception_locations) for location in word_locations)
+        check_exceptions = True
+        if self.exception_is_phrases and not self.exception.matches_submission(sub):
+            check_exceptions = False
+        for text in self.field.get_field(sub).texts():
+            word_spans = [m.span() for pattern in self.word_patterns for m in pattern.finditer(text)]
+            if not word_spans:
+                continue
+            if not check_exceptions:
+                return True
+            exception_spans = [m.span() for pattern in self.exception_patterns for m in pattern.finditer(text)]
+            if _any_span_uncovered(word_spans, exception_spans):
+                return True
+        return False
 
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, ExceptionQuery) and self.word == other.word and self.exception == other.exception
@@ -390,6 +591,322 @@ class ExceptionQuery(Query):
         return f"{self.word} EXCEPT {self.exception}"
 
 
+def _location_leaves(query: LocationQuery) -> list[LocationQuery]:
+    if isinstance(query, LocationOrQuery):
+        return [leaf for sub_query in query.sub_queries for leaf in _location_leaves(sub_query)]
+    return [query]
+
+
+def _any_span_uncovered(spans: list[tuple[int, int]], cover_spans: list[tuple[int, int]]) -> bool:
+    """
+    Whether any of the (start, end) spans does not overlap any of the cover spans. The cover spans are merged into
+    sorted, disjoint intervals, so each span can be checked with a binary search.
+    """
+    if not cover_spans:
+        return bool(spans)
+    starts: list[int] = []
+    ends: list[int] = []
+    for start, end in sorted(cover_spans):
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    for start, end in spans:
+        # The last interval starting before this span ends is the only one which could overlap it
+        index = bisect.bisect_left(starts, end) - 1
+        if index < 0 or ends[index] <= start:
+            return True
+    return False
+
+
+def _compile_ratings(ratings: set[Rating]) -> QueryMatcher:
+    if not ratings:
+        return _always_false
+    if len(ratings) == len(Rating):
+        return _always_true
+    if len(ratings) == 1:
+        rating = next(iter(ratings))
+
+        def matcher(sub: QueryTarget) -> bool:
+            return sub.rating == rating
+
+        return matcher
+    allowed = frozenset(ratings)
+
+    def matcher_set(sub: QueryTarget) -> bool:
+        return sub.rating in allowed
+
+    return matcher_set
+
+
+def _compile_words_all(field: Type[Field], words: set[str]) -> QueryMatcher:
+    get_field = _field_getter(field)
+    if len(words) == 1:
+        word = next(iter(words))
+
+        def matcher(sub: QueryTarget) -> bool:
+            return word in get_field(sub).tokens().word_set
+
+        return matcher
+    required = frozenset(words)
+
+    def matcher_all(sub: QueryTarget) -> bool:
+        return required.issubset(get_field(sub).tokens().word_set)
+
+    return matcher_all
+
+
+def _compile_words_any(field: Type[Field], words: set[str]) -> QueryMatcher:
+    if len(words) == 1:
+        return _compile_words_all(field, words)
+    get_field = _field_getter(field)
+    options = frozenset(words)
+
+    def matcher(sub: QueryTarget) -> bool:
+        return not options.isdisjoint(get_field(sub).tokens().word_set)
+
+    return matcher
+
+
+def _query_cost(query: Query) -> int:
+    # Rough static estimate of how expensive a query is to check, so that cheap checks can short-circuit costly ones
+    if isinstance(query, (RatingQuery, WordQuery)):
+        return 0
+    if isinstance(query, (PrefixQuery, SuffixQuery)):
+        return 1
+    if isinstance(query, NotQuery):
+        return _query_cost(query.sub_query)
+    if isinstance(query, (AndQuery, OrQuery)):
+        return max([_query_cost(q) for q in query.sub_queries], default=0)
+    return 2
+
+
+def _ratings_key(ratings: set[Rating]) -> str:
+    return "RATINGS(" + ", ".join(str(rating) for rating in sorted(ratings, key=lambda rating: rating.value)) + ")"
+
+
+def _words_key(prefix: str, field: Type[Field], words: set[str]) -> str:
+    return f"{prefix}({field.__name__}: " + ", ".join(sorted(words)) + ")"
+
+
+def _compile_static(matchers: list[QueryMatcher], is_and: bool) -> QueryMatcher:
+    if len(matchers) == 2:
+        first, second = matchers
+        if is_and:
+
+            def matcher_pair_and(sub: QueryTarget) -> bool:
+                return first(sub) and second(sub)
+
+            return matcher_pair_and
+
+        def matcher_pair_or(sub: QueryTarget) -> bool:
+            return first(sub) or second(sub)
+
+        return matcher_pair_or
+    matcher_tuple = tuple(matchers)
+    if is_and:
+
+        def matcher_and(sub: QueryTarget) -> bool:
+            for sub_matcher in matcher_tuple:
+                if not sub_matcher(sub):
+                    return False
+            return True
+
+        return matcher_and
+
+    def matcher_or(sub: QueryTarget) -> bool:
+        for sub_matcher in matcher_tuple:
+            if sub_matcher(sub):
+                return True
+        return False
+
+    return matcher_or
+
+
+def _compile_checks(checks: list[tuple[str, QueryMatcher]], expensive: bool, is_and: bool) -> QueryMatcher:
+    # Word and rating checks are all about as cheap as each other, so are only worth reordering alongside costlier ones
+    if not expensive:
+        return _compile_static([check for _, check in checks], is_and)
+    return _compile_adaptive(checks, is_and)
+
+
+def sampling_matcher(matcher: QueryMatcher) -> QueryMatcher:
+    """
+    Returns the version of a compiled query which records runtime statistics for its sub-queries, and reorders them as
+    those statistics change. This is slower, so is only used for a sample of submissions.
+    """
+    return getattr(matcher, "sampling_matcher", matcher)
+
+
+def _compile_adaptive(checks: list[tuple[str, QueryMatcher]], is_and: bool) -> QueryMatcher:
+    """
+    Combines the checks of the sub-queries of an AND or OR query, each given with the key its runtime statistics are
+    recorded under. When sampling, every check is run and timed, and the checks are periodically reordered based on
+    those statistics, so that evaluation short-circuits as cheaply as possible.
+    """
+    stats = predicate_stats
+    order = stats.order([key for key, _ in checks], is_and)
+    if order is not None:
+        checks = [checks[index] for index in order]
+    matcher_tuple = tuple(check for _, check in checks)
+    samples = 0
+
+    def sampled(sub: QueryTarget) -> bool:
+        nonlocal checks, matcher_tuple, samples
+        result = is_and
+        for key, check in checks:
+            check = sampling_matcher(check)
+            start = time.perf_counter_ns()
+            passed = check(sub)
+            stats.record(key, time.perf_counter_ns() - start, passed)
+            if passed != is_and:
+                result = not is_and
+        samples += 1
+        if samples % stats.REORDER_INTERVAL == 0:
+            new_order = stats.order([key for key, _ in checks], is_and)
+            if new_order is not None and new_order != sorted(new_order):
+                checks = [checks[index] for index in new_order]
+                matcher_tuple = tuple(check for _, check in checks)
+                predicate_reorders.inc()
+        return result
+
+    if is_and:
+
+        def matcher_and(sub: QueryTarget) -> bool:
+            for sub_matcher in matcher_tuple:
+                if not sub_matcher(sub):
+                    return False
+            return True
+
+        matcher_and.sampling_matcher = sampled  # type: ignore[attr-defined]
+        return matcher_and
+
+    def matcher_or(sub: QueryTarget) -> bool:
+        for sub_matcher in matcher_tuple:
+            if sub_matcher(sub):
+                return True
+        return False
+
+    matcher_or.sampling_matcher = sampled  # type: ignore[attr-defined]
+    return matcher_or
+
+
+def _compile_and(sub_queries: Sequence[Query]) -> QueryMatcher:
+    words_by_field: dict[Type[Field], set[str]] = {}
+    ratings: Optional[set[Rating]] = None
+    others: list[Query] = []
+    for query in _flatten(sub_queries, AndQuery):
+        if isinstance(query, WordQuery):
+            words_by_field.setdefault(query.field, set()).add(query.word_lower)
+        elif isinstance(query, RatingQuery):
+            ratings = {query.rating} if ratings is None else ratings & {query.rating}
+        else:
+            others.append(query)
+    checks: list[tuple[str, QueryMatcher]] = []
+    if ratings is not None:
+        checks.append((_ratings_key(ratings), _compile_ratings(ratings)))
+    for field, words in words_by_field.items():
+        checks.append((_words_key("WORDS_ALL", field, words), _compile_words_all(field, words)))
+    checks.extend((repr(q), q.compile()) for q in sorted(others, key=_query_cost))
+    # Fold constants
+    if any(m is _always_false for _, m in checks):
+        return _always_false
+    checks = [(key, m) for key, m in checks if m is not _always_true]
+    if not checks:
+        return _always_true
+    if len(checks) == 1:
+        return checks[0][1]
+    return _compile_checks(checks, any(_query_cost(q) > 0 for q in others), True)
+
+
+def _compile_or(sub_queries: Sequence[Query]) -> QueryMatcher:
+    words_by_field: dict[Type[Field], set[str]] = {}
+    ratings: set[Rating] = set()
+    others: list[Query] = []
+    for query in _flatten(sub_queries, OrQuery):
+        if isinstance(query, WordQuery):
+            words_by_field.setdefault(query.field, set()).add(query.word_lower)
+        elif isinstance(query, RatingQuery):
+            ratings.add(query.rating)
+        else:
+            others.append(query)
+    checks: list[tuple[str, QueryMatcher]] = []
+    if ratings:
+        checks.append((_ratings_key(ratings), _compile_ratings(ratings)))
+    for field, words in words_by_field.items():
+        checks.append((_words_key("WORDS_ANY", field, words), _compile_words_any(field, words)))
+    checks.extend((repr(q), q.compile()) for q in sorted(others, key=_query_cost))
+    # Fold constants
+    if any(m is _always_true for _, m in checks):
+        return _always_true
+    checks = [(key, m) for key, m in checks if m is not _always_false]
+    if not checks:
+        return _always_false
+    if len(checks) == 1:
+        return checks[0][1]
+    return _compile_checks(checks, any(_query_cost(q) > 0 for q in others), False)
+
+
+def _flatten(sub_queries: Sequence[Query], query_type: Type[Query]) -> list[Query]:
+    flattened: list[Query] = []
+    for query in sub_queries:
+        if isinstance(query, query_type):
+            flattened.extend(_flatten(query.sub_queries, query_type))  # type: ignore[attr-defined]
+        else:
+            flattened.append(query)
+    return flattened
+
+
+def compile_query(query: Query) -> QueryMatcher:
+    """
+    Compiles a parsed query into a single callable, with constant sub-expressions folded, nested AND and OR queries
+    flattened, word checks merged into set operations, and field lookups resolved ahead of time.
+    """
+    return query.compile()
+
+
+_all_ratings: frozenset[Rating] = frozenset(Rating)
+
+
+def query_rating_bounds(query: Query) -> tuple[frozenset[Rating], frozenset[Rating]]:
+    """
+    Works out from the structure of a query alone, which submission ratings it could possibly match, and which ratings
+    it definitely matches regardless of anything else about the submission. Returns a (possible, certain) tuple.
+    """
+    if isinstance(query, RatingQuery):
+        ratings = frozenset([query.rating])
+        return ratings, ratings
+    if isinstance(query, AndQuery):
+        possible = _all_ratings
+        certain = _all_ratings
+        for sub_query in query.sub_queries:
+            sub_possible, sub_certain = query_rating_bounds(sub_query)
+            possible &= sub_possible
+            certain &= sub_certain
+        return possible, certain
+    if isinstance(query, OrQuery):
+        possible = frozenset()
+        certain = frozenset()
+        for sub_query in query.sub_queries:
+            sub_possible, sub_certain = query_rating_bounds(sub_query)
+            possible |= sub_possible
+            certain |= sub_certain
+        return possible, certain
+    if isinstance(query, NotQuery):
+        sub_possible, sub_certain = query_rating_bounds(query.sub_query)
+        return _all_ratings - sub_certain, _all_ratings - sub_possible
+    # Other queries depend on the text of the submission
+    return _all_ratings, frozenset()
+
+
+def query_allowed_ratings(query: Query) -> frozenset[Rating]:
+    """
+    Returns the set of submission ratings which the query could possibly match
+    """
+    return query_rating_bounds(query)[0]
+
+
 class InvalidQueryException(Exception):
     pass
 
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import bisect
 import re
 import string
+import sys
 from abc import ABC, abstractmethod
-from functools import lru_cache
-from typing import NewType
+from typing import TYPE_CHECKING, NewType
 
 from fa_search_bot.sites.submission import Rating
 from fa_search_bot.sites.submission_id import SubmissionID
@@ -14,24 +15,156 @@ punctuation_pattern = r"[\s" + re.escape(punctuation) + "]+"
 not_punctuation_pattern = r"[^\s" + re.escape(punctuation) + "]+"
 boundary_pattern_start = r"(?:^|(?<=[\s" + re.escape(punctuation) + "]))"
 boundary_pattern_end = r"(?:(?=[\s" + re.escape(punctuation) + "])|$)"
+_separator_regex = re.compile(r"[\s" + re.escape(punctuation) + "]")
 
 
 def _split_text_to_words(text: str) -> list[str]:
     return re.split(punctuation_pattern, text)
 
 
-def _clean_word_list(words: list[str]) -> list[str]:
-    return [x.lower().strip(punctuation) for x in words]
+_word_regex = re.compile(not_punctuation_pattern)
 
 
-def _split_text_to_cleaned_words(text: str) -> list[str]:
-    return _clean_word_list(_split_text_to_words(text))
+class TextTokens:
+    """
+    The lower-cased, interned words of a text, along with the offset in the text at which each word starts
+    """
+
+    __slots__ = ("words", "offsets")
+
+    def __init__(self, words: list[str], offsets: list[int]) -> None:
+        self.words = words
+        self.offsets = offsets
+
+    @classmethod
+    def from_text(cls, text: str) -> TextTokens:
+        # A single pass over the text, splitting at whitespace and punctuation other than hyphens and underscores
+        words = []
+        offsets = []
+        for match in _word_regex.finditer(text):
+            words.append(sys.intern(match.group().lower()))
+            offsets.append(match.start())
+        return cls(words, offsets)
+
+    @classmethod
+    def from_whole_text(cls, text: str, strip: str = "") -> TextTokens:
+        """
+        Tokenises a text as a single word, for fields such as keywords and artist names, which are not split
+        """
+        stripped = text.lstrip(strip)
+        return cls([sys.intern(text.lower().strip(strip))], [len(text) - len(stripped)])
+
+
+def split_text_to_words(text: str) -> list[str]:
+    """
+    The lower-cased words of a text, split the same way as the text fields of a submission
+    """
+    return TextTokens.from_text(text).words
+
+
+class TokenCache:
+    """
+    The tokens of each field of a submission, which can be shared by every QueryTarget made from that submission, so
+    that each submission is only tokenised once however many times it is matched.
+    """
+
+    def __init__(self) -> None:
+        self.text_tokens: dict[str, list[TextTokens]] = {}
+        self.field_tokens: dict[str, FieldTokens] = {}
+        self.index_words: dict[str, frozenset[str]] = {}
+
+
+def case_folds_simply(text: str) -> bool:
+    """
+    Whether lower-casing this text character by character gives the same results as a case-insensitive regex.
+    A few unicode characters (e.g. "ſ" or "İ") have case-insensitive equivalents which lower() does not produce, or
+    change length when lower-cased, and so texts and phrases containing them are left to the regex.
+    """
+    if text.isascii():
+        return True
+    for char in text:
+        if char.isascii():
+            continue
+        lower = char.lower()
+        if len(lower) != 1 or lower != char.upper().lower():
+            return False
+    return True
+
+
+if TYPE_CHECKING:
+    from typing import Iterable, Optional
+
+    from fa_search_bot.subscriptions.affix_scanner import AffixHits
+    from fa_search_bot.subscriptions.phrase_scanner import PhraseHits
 
 
 FieldLocation = NewType("FieldLocation", str)
 
 
+class FieldTokens:
+    """
+    Precomputed set of the words in a field, for constant time word lookups, along with sorted arrays of the words
+    and reversed words, for prefix and suffix lookups.
+    """
+
+    def __init__(self, words: Iterable[str]) -> None:
+        self.word_set: frozenset[str] = frozenset(sys.intern(word) for word in words)
+        self._sorted_words: Optional[list[str]] = None
+        self._sorted_reversed_words: Optional[list[str]] = None
+        self._split_words: Optional[tuple[frozenset[str], list[str]]] = None
+
+    def split_words(self) -> tuple[frozenset[str], list[str]]:
+        """
+        The words split further at any whitespace or punctuation left inside them (e.g. in keywords), for wildcard
+        matching. Words which do not case-fold simply are returned separately and unsplit, to be checked by regex.
+        """
+        if self._split_words is None:
+            simple_words: set[str] = set()
+            other_words: list[str] = []
+            for word in self.word_set:
+                if not case_folds_simply(word):
+                    other_words.append(word)
+                elif _separator_regex.search(word):
+                    simple_words.update(part for part in _split_text_to_words(word) if part)
+                else:
+                    simple_words.add(word)
+            self._split_words = frozenset(simple_words), other_words
+        return self._split_words
+
+    def has_word(self, word: str) -> bool:
+        return word in self.word_set
+
+    def sorted_words(self) -> list[str]:
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self.word_set)
+        return self._sorted_words
+
+    def sorted_reversed_words(self) -> list[str]:
+        if self._sorted_reversed_words is None:
+            self._sorted_reversed_words = sorted(word[::-1] for word in self.word_set)
+        return self._sorted_reversed_words
+
+    @staticmethod
+    def _has_longer_word_with_prefix(sorted_words: list[str], prefix: str) -> bool:
+        # Any words starting with the prefix sort directly after the prefix itself, so only one word needs checking
+        index = bisect.bisect_right(sorted_words, prefix)
+        return index < len(sorted_words) and sorted_words[index].startswith(prefix)
+
+    def has_prefix(self, prefix: str) -> bool:
+        """
+        Whether any word starts with the given (lowercase) prefix, excluding the prefix itself
+        """
+        return self._has_longer_word_with_prefix(self.sorted_words(), prefix)
+
+    def has_suffix(self, suffix: str) -> bool:
+        """
+        Whether any word ends with the given (lowercase) suffix, excluding the suffix itself
+        """
+        return self._has_longer_word_with_prefix(self.sorted_reversed_words(), suffix[::-1])
+
+
 class Field(ABC):
+    __slots__ = ()
 
     @classmethod
     @abstractmethod
@@ -42,6 +175,10 @@ class Field(ABC):
     def words(self) -> list[str]:
         raise NotImplementedError()
 
+    @abstractmethod
+    def tokens(self) -> FieldTokens:
+        raise NotImplementedError()
+
     @abstractmethod
     def texts(self) -> list[str]:
         raise NotImplementedError()
@@ -52,83 +189,116 @@ class Field(ABC):
 
 
 class SpecificField(Field, ABC):
-    def __init__(self, value: list[str]) -> None:
-        self.value = value
+    __slots__ = ("value", "token_cache", "_texts_dict")
+    # Key of this field's tokens in the TokenCache, and prefix of its field locations
+    name: str
 
+    def __init__(self, value: list[str], token_cache: Optional[TokenCache] = None) -> None:
+        self.value = value
+        self.token_cache = token_cache if token_cache is not None else TokenCache()
+        self._texts_dict: Optional[dict[FieldLocation, str]] = None
 
-class KeywordField(SpecificField):
     @classmethod
-    def get_field(cls, sub: QueryTarget) -> KeywordField:
-        return sub.keywords
+    @abstractmethod
+    def tokenize(cls, text: str) -> TextTokens:
+        raise NotImplementedError()
+
+    def text_tokens(self) -> list[TextTokens]:
+        text_tokens = self.token_cache.text_tokens.get(self.name)
+        if text_tokens is None:
+            text_tokens = [self.tokenize(text) for text in self.value]
+            self.token_cache.text_tokens[self.name] = text_tokens
+        return text_tokens
 
-    @lru_cache
     def words(self) -> list[str]:
-        return _clean_word_list(self.value)
+        return [word for text_tokens in self.text_tokens() for word in text_tokens.words]
+
+    def tokens(self) -> FieldTokens:
+        tokens = self.token_cache.field_tokens.get(self.name)
+        if tokens is None:
+            tokens = FieldTokens(self.words())
+            self.token_cache.field_tokens[self.name] = tokens
+        return tokens
+
+    def index_words(self) -> frozenset[str]:
+        """
+        The words, along with the parts of any texts which are not split into words (e.g. keywords, artist names), as
+        phrases are indexed on split words.
+        """
+        index_words = self.token_cache.index_words.get(self.name)
+        if index_words is None:
+            words = set(self.tokens().word_set)
+            for text_tokens, text in zip(self.text_tokens(), self.value):
+                if len(text_tokens.words) == 1 and _separator_regex.search(text):
+                    words.update(TextTokens.from_text(text).words)
+            index_words = self.token_cache.index_words[self.name] = frozenset(words)
+        return index_words
 
-    @lru_cache
     def texts(self) -> list[str]:
         return self.value
 
-    @lru_cache
     def texts_dict(self) -> dict[FieldLocation, str]:
-        return {FieldLocation(f"keyword_{num}"): keyword for num, keyword in enumerate(self.value)}
+        if self._texts_dict is None:
+            self._texts_dict = {FieldLocation(f"{self.name}_{num}"): text for num, text in enumerate(self.value)}
+        return self._texts_dict
+
+
+class KeywordField(SpecificField):
+    __slots__ = ()
+    name = "keyword"
+
+    @classmethod
+    def get_field(cls, sub: QueryTarget) -> KeywordField:
+        return sub.keywords
+
+    @classmethod
+    def tokenize(cls, text: str) -> TextTokens:
+        return TextTokens.from_whole_text(text, punctuation)
 
 
 class TitleField(SpecificField):
+    __slots__ = ()
+    name = "title"
+
     @classmethod
     def get_field(cls, sub: QueryTarget) -> TitleField:
         return sub.title
 
-    @lru_cache
-    def words(self) -> list[str]:
-        return sum([_split_text_to_cleaned_words(title) for title in self.value], start=[])
-
-    @lru_cache
-    def texts(self) -> list[str]:
-        return self.value
-
-    @lru_cache
-    def texts_dict(self) -> dict[FieldLocation, str]:
-        return {FieldLocation(f"title_{num}"): title for num, title in enumerate(self.value)}
+    @classmethod
+    def tokenize(cls, text: str) -> TextTokens:
+        return TextTokens.from_text(text)
 
 
 class DescriptionField(SpecificField):
+    __slots__ = ()
+    name = "description"
+
     @classmethod
     def get_field(cls, sub: QueryTarget) -> DescriptionField:
         return sub.description
 
-    @lru_cache
-    def words(self) -> list[str]:
-        return sum([_split_text_to_cleaned_words(desc) for desc in self.value], start=[])
-
-    @lru_cache
-    def texts(self) -> list[str]:
-        return self.value
-
-    @lru_cache
-    def texts_dict(self) -> dict[FieldLocation, str]:
-        return {FieldLocation(f"description_{num}"): desc for num, desc in enumerate(self.value)}
+    @classmethod
+    def tokenize(cls, text: str) -> TextTokens:
+        return TextTokens.from_text(text)
 
 
 class ArtistField(SpecificField):
+    __slots__ = ()
+    name = "artist"
+
     @classmethod
     def get_field(cls, sub: QueryTarget) -> ArtistField:
         return sub.artist
 
-    @lru_cache
-    def words(self) -> list[str]:
-        return [artist.lower() for artist in self.value]
-
-    @lru_cache
-    def texts(self) -> list[str]:
-        return self.value
-
-    @lru_cache
-    def texts_dict(self) -> dict[FieldLocation, str]:
-        return {FieldLocation(f"artist_{num}"): artist for num, artist in enumerate(self.value)}
+    @classmethod
+    def tokenize(cls, text: str) -> TextTokens:
+        return TextTokens.from_whole_text(text)
 
 
 class AnyField(Field):
+    __slots__ = ("title", "description", "keyword", "artist", "token_cache", "_texts", "_texts_dict")
+    name = "any"
+
     def __init__(
             self,
             title: TitleField,
@@ -140,12 +310,26 @@ class AnyField(Field):
         self.description = description
         self.keyword = keyword
         self.artist = artist
+        self.token_cache = title.token_cache
+        self._texts: Optional[list[str]] = None
+        self._texts_dict: Optional[dict[FieldLocation, str]] = None
 
     @classmethod
     def get_field(cls, sub: QueryTarget) -> AnyField:
         return sub.any_field
 
-    @lru_cache
+    def tokens(self) -> FieldTokens:
+        tokens = self.token_cache.field_tokens.get(self.name)
+        if tokens is None:
+            tokens = FieldTokens(
+                self.title.tokens().word_set
+                | self.description.tokens().word_set
+                | self.keyword.tokens().word_set
+                | self.artist.tokens().word_set
+            )
+            self.token_cache.field_tokens[self.name] = tokens
+        return tokens
+
     def words(self) -> list[str]:
         return [
             *self.title.words(),
@@ -154,26 +338,41 @@ class AnyField(Field):
             *self.artist.words(),
         ]
 
-    @lru_cache
     def texts(self) -> list[str]:
-        return [
-            *self.title.texts(),
-            *self.description.texts(),
-            *self.keyword.texts(),
-            *self.artist.texts(),
-        ]
+        if self._texts is None:
+            self._texts = [
+                *self.title.texts(),
+                *self.description.texts(),
+                *self.keyword.texts(),
+                *self.artist.texts(),
+            ]
+        return self._texts
 
-    @lru_cache
     def texts_dict(self) -> dict[FieldLocation, str]:
-        return {
-            **self.title.texts_dict(),
-            **self.description.texts_dict(),
-            **self.keyword.texts_dict(),
-            **self.artist.texts_dict(),
-        }
+        if self._texts_dict is None:
+            self._texts_dict = {
+                **self.title.texts_dict(),
+                **self.description.texts_dict(),
+                **self.keyword.texts_dict(),
+                **self.artist.texts_dict(),
+            }
+        return self._texts_dict
 
 
 class QueryTarget:
+    __slots__ = (
+        "sub_id",
+        "token_cache",
+        "title",
+        "description",
+        "keywords",
+        "artist",
+        "rating",
+        "any_field",
+        "phrase_hits",
+        "affix_hits",
+    )
+
     def __init__(
             self,
             sub_id: SubmissionID,
@@ -182,14 +381,21 @@ class QueryTarget:
             keywords: list[str],
             artist: list[str],
             rating: Rating,
+            token_cache: Optional[TokenCache] = None,
     ) -> None:
         self.sub_id = sub_id
-        self.title = TitleField(title)
-        self.description = DescriptionField(description)
-        self.keywords = KeywordField(keywords)
-        self.artist = ArtistField(artist)
+        # Each field stores its tokens in the cache, which may be shared with other targets for the same submission
+        self.token_cache = token_cache if token_cache is not None else TokenCache()
+        self.title = TitleField(title, self.token_cache)
+        self.description = DescriptionField(description, self.token_cache)
+        self.keywords = KeywordField(keywords, self.token_cache)
+        self.artist = ArtistField(artist, self.token_cache)
         self.rating = rating
         self.any_field = AnyField(self.title, self.description, self.keywords, self.artist)
+        # Set by the PhraseScanner, if phrases have been scanned for in bulk
+        self.phrase_hits: Optional[PhraseHits] = None
+        # Set by the AffixScanner, if prefixes and suffixes have been looked up in bulk
+        self.affix_hits: Optional[AffixHits] = None
 
     def to_json(self) -> dict:
         return {
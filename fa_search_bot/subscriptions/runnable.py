@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import datetime
 import logging
+import time
 from abc import ABC, abstractmethod
 from typing import TYPE_CHECKING
 
@@ -12,7 +13,10 @@ from prometheus_client import Gauge, Counter, Summary
 from fa_search_bot.subscriptions.utils import time_taken
 
 if TYPE_CHECKING:
+    from typing import Optional, Set
+
     from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
+    from fa_search_bot.subscriptions.wait_pool import StageSignal
 
 
 logger = logging.getLogger(__name__)
@@ -51,14 +55,22 @@ class ShutdownError(RuntimeError):
 
 
 class Runnable(ABC):
-    QUEUE_BACKOFF = 0.5
+    # Workers waiting for their stage of the wait pool are woken when an item is ready, this only bounds how long they
+    # wait without being woken, and needs to be shorter than the heartbeat interval
+    QUEUE_WAIT_TIMEOUT = 20
     SECONDS_PER_HEARTBEAT = 60
 
     def __init__(self, watcher: "SubscriptionWatcher"):
         self.watcher = watcher
         self.running = False
-        self._stop_event = asyncio.Event()
+        self._waiters: Set[asyncio.Future[None]] = set()
         self.heartbeat_expiry = datetime.datetime.now()
+        # Running totals of time spent processing items, and how many were processed, ignoring any do_process() call
+        # which waited for its stage of the wait pool to have work. Used to autoscale the worker pools.
+        self.busy_seconds = 0.0
+        self.items_processed = 0
+        self.items_in_process = 1
+        self._waited_for_work = False
         self.class_name = self.__class__.__name__
         self.time_taken_updating_heartbeat = time_taken.labels(
             task="updating heartbeat", runnable=self.class_name, task_type="active",
@@ -72,6 +84,9 @@ class Runnable(ABC):
         # Start the subscription task
         self.running = True
         while self.running:
+            self.items_in_process = 1
+            self._waited_for_work = False
+            start_time = time.monotonic()
             try:
                 with self.time_taken_processing.time():
                     await self.do_process()
@@ -79,6 +94,9 @@ class Runnable(ABC):
                 logger.error("Runnable task %s has failed (will restart) with exception:", self.class_name, exc_info=e)
                 # Revert the failed attempt, so it may be attempted again
                 await self.revert_last_attempt()
+            if not self._waited_for_work:
+                self.busy_seconds += time.monotonic() - start_time
+                self.items_processed += self.items_in_process
             # Update metrics
             self.update_processed_metrics()
             # Update heartbeat
@@ -98,8 +116,9 @@ class Runnable(ABC):
 
     def stop(self) -> None:
         self.running = False
-        self._stop_event.set()
-        self._stop_event.clear()
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
 
     def update_processed_metrics(self) -> None:
         self.runnable_latest_processed.set_to_current_time()
@@ -112,14 +131,27 @@ class Runnable(ABC):
             logger.debug("Heartbeat from %s", self.class_name)
             self.heartbeat_expiry = datetime.datetime.now() + datetime.timedelta(seconds=self.SECONDS_PER_HEARTBEAT)
 
-    async def _wait_while_running(self, seconds: float) -> None:
-        done, pending = await asyncio.wait(
-            [
-                asyncio.create_task(self._stop_event.wait()),
-                asyncio.create_task(asyncio.sleep(seconds)),
-            ],
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-        for task in pending:
-            task.cancel()
-        return
+    async def _wait_while_running(self, seconds: float, signal: Optional[StageSignal] = None) -> None:
+        """
+        Waits for the given number of seconds, returning early if the runnable is stopped, or if a signal is given and
+        it wakes this runnable
+        """
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        timeout = loop.call_later(seconds, _wake_waiter, waiter)
+        self._waiters.add(waiter)
+        if signal is not None:
+            self._waited_for_work = True
+            signal.add_waiter(waiter)
+        try:
+            await waiter
+        finally:
+            timeout.cancel()
+            self._waiters.discard(waiter)
+            if signal is not None:
+                signal.remove_waiter(waiter)
+
+
+def _wake_waiter(waiter: asyncio.Future[None]) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import heapq
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from prometheus_client import Counter
+
+from fa_search_bot.subscriptions.wait_pool import StageSignal
+
+if TYPE_CHECKING:
+    from typing import Deque, Dict, List, Optional, Set, Tuple
+
+    from fa_search_bot.sites.furaffinity.sendable import SendableFASubmission
+    from fa_search_bot.sites.submission_id import SubmissionID
+    from fa_search_bot.subscriptions.wait_pool import SubmissionCheckState
+
+logger = logging.getLogger(__name__)
+
+PARK_REASON_CHAT_FLOOD_WAIT = "chat_flood_wait"
+PARK_REASON_GLOBAL_FLOOD_WAIT = "global_flood_wait"
+PARK_REASON_SEND_FAILURES = "send_failures"
+
+parked_seconds = Counter(
+    "fasearchbot_subscriptionsender_parked_seconds_total",
+    "Total time (in seconds) which destinations have spent parked, and which all sending has spent parked, by reason",
+    labelnames=["reason"],
+)
+parked_seconds_chat_flood_wait = parked_seconds.labels(reason=PARK_REASON_CHAT_FLOOD_WAIT)
+parked_seconds_global_flood_wait = parked_seconds.labels(reason=PARK_REASON_GLOBAL_FLOOD_WAIT)
+parked_seconds_send_failures = parked_seconds.labels(reason=PARK_REASON_SEND_FAILURES)
+parked_seconds_by_reason = {
+    PARK_REASON_CHAT_FLOOD_WAIT: parked_seconds_chat_flood_wait,
+    PARK_REASON_SEND_FAILURES: parked_seconds_send_failures,
+}
+
+
+@dataclasses.dataclass
+class SubmissionSend:
+    state: SubmissionCheckState
+    sendable: SendableFASubmission
+    # Number of destinations which this submission has not yet been sent to, and how many of those are parked
+    pending: int = 0
+    parked: int = 0
+
+    def holds_capacity(self) -> bool:
+        # Submissions which are only waiting for parked destinations, or for earlier submissions to be completed, should
+        # not hold up any other destination
+        return self.pending > self.parked
+
+
+@dataclasses.dataclass
+class SendJob:
+    submission: SubmissionSend
+    destination: int
+    prefix: str
+    failures: int = 0
+    # Whether the job is counted as parked, and so does not hold up other destinations
+    parked: bool = False
+
+
+class SendScheduler:
+    """
+    Holds an ordered queue of messages to send for each destination, for a pool of send workers to drain. Each
+    destination is only handed to one worker at a time, so every chat receives submissions in the order they were
+    scheduled, while different chats are sent to in parallel.
+    A submission is completed once it has been sent to every destination, and submissions are always completed in the
+    order they were scheduled, so that the latest submission recorded as sent never skips one which has not been.
+    Only a limited number of submissions can be scheduled at once, so that backpressure reaches the wait pool.
+    When Telegram asks for a flood wait, or sending to a destination keeps failing, only that destination is parked
+    for a while, and the other destinations carry on. Submissions which are only waiting for parked destinations, or
+    for earlier submissions to be completed, do not count towards the limit, so that a parked destination does not hold
+    up the rest of the queue. Instead, there are separate limits on how many such submissions can be waiting, and on
+    how many messages each parked destination can have queued without counting towards the limit. If many destinations
+    are parked for flood waits at once, the flood wait is assumed to apply to the whole bot, and all sending is parked.
+    """
+
+    # Number of destinations parked for flood waits at once, at which all sending is parked
+    GLOBAL_FLOOD_WAIT_DESTINATIONS = 3
+    # Number of queued messages for each parked destination which do not count towards the limit
+    PARKED_BACKLOG_LIMIT = 50
+    # Number of submissions which can be waiting only for parked destinations, or for earlier submissions to complete
+    MAX_DEFERRED_SUBMISSIONS = 500
+
+    def __init__(self, max_submissions: int) -> None:
+        self.max_submissions = max_submissions
+        self.clock = time.monotonic
+        self.destination_queues: Dict[int, Deque[SendJob]] = {}
+        # Destinations with queued messages which no worker is sending to, in the order they became ready
+        self.ready_destinations: Deque[int] = collections.deque()
+        self.busy_destinations: Set[int] = set()
+        # Destinations which cannot be sent to until a deadline, along with when and why they were parked, and a heap
+        # of their deadlines
+        self.parked_destinations: Dict[int, Tuple[float, float, str]] = {}
+        self._park_deadlines: List[Tuple[float, int]] = []
+        # Number of queued messages counted as parked, for each parked destination
+        self.parked_backlogs: Dict[int, int] = {}
+        # All sending is parked until this deadline, and was parked at this time
+        self.global_deadline: Optional[float] = None
+        self._global_parked_at = 0.0
+        # Submissions which have been scheduled but not completed, in the order they were scheduled
+        self.submissions: Dict[SubmissionID, SubmissionSend] = {}
+        # Number of submissions which count towards the limit, the rest are deferred
+        self.capacity_used = 0
+        self.work_signal = StageSignal()
+        self.capacity_signal = StageSignal()
+
+    def has_capacity(self) -> bool:
+        if len(self.submissions) - self.capacity_used >= self.MAX_DEFERRED_SUBMISSIONS:
+            return False
+        return self.capacity_used < self.max_submissions
+
+    def schedule(self, submission: SubmissionSend, prefixes: Dict[int, str]) -> List[SubmissionSend]:
+        """
+        Queues the submission to be sent to each destination, with the given message prefix. Returns any submissions
+        which are completed by this, which is only the case if there were no destinations to send to.
+        """
+        self.submissions[submission.state.sub_id] = submission
+        for destination, prefix in prefixes.items():
+            self._queue_job(SendJob(submission, destination, prefix))
+        return self._pop_completed()
+
+    def _queue_job(self, job: SendJob) -> None:
+        job.parked = job.destination in self.parked_destinations and self._take_parked_slot(job.destination)
+        self._update(job.submission, pending=1, parked=1 if job.parked else 0)
+        queue = self.destination_queues.get(job.destination)
+        if queue is not None:
+            # The destination is already either waiting for a worker, or being sent to
+            queue.append(job)
+            return
+        self.destination_queues[job.destination] = collections.deque([job])
+        self.ready_destinations.append(job.destination)
+        self.work_signal.notify()
+
+    def next_job(self) -> Optional[SendJob]:
+        """
+        Takes the next message to send, from the destination which has waited longest for a worker
+        """
+        now = self.clock()
+        self._unpark_due(now)
+        if self.global_deadline is not None:
+            return None
+        if not self.ready_destinations:
+            return None
+        destination = self.ready_destinations.popleft()
+        self.busy_destinations.add(destination)
+        return self.destination_queues[destination].popleft()
+
+    def finish_job(
+            self,
+            job: SendJob,
+            retry: bool = False,
+            park_seconds: Optional[float] = None,
+            park_reason: str = PARK_REASON_CHAT_FLOOD_WAIT,
+    ) -> List[SubmissionSend]:
+        """
+        Hands the job's destination back, once the worker has finished sending to it. If the job is to be retried, it
+        is put back at the front of its destination's queue, and if park_seconds is given, the destination is parked
+        for that long first, for the given reason. Returns the submissions which are now completed, in order.
+        """
+        destination = job.destination
+        queue = self.destination_queues[destination]
+        self.busy_destinations.discard(destination)
+        if retry:
+            queue.appendleft(job)
+        if park_seconds is not None:
+            self._park(destination, park_seconds, park_reason)
+        elif queue:
+            self.ready_destinations.append(destination)
+            self.work_signal.notify()
+        else:
+            del self.destination_queues[destination]
+        if not retry:
+            self._update(job.submission, pending=-1)
+        return self._pop_completed()
+
+    def _park(self, destination: int, seconds: float, reason: str) -> None:
+        now = self.clock()
+        deadline = now + seconds
+        self.parked_destinations[destination] = (deadline, now, reason)
+        self.parked_backlogs[destination] = 0
+        for job in self.destination_queues[destination]:
+            if not self._take_parked_slot(destination):
+                break
+            job.parked = True
+            self._update(job.submission, parked=1)
+        heapq.heappush(self._park_deadlines, (deadline, destination))
+        logger.info("Parking destination %s for %s seconds, reason: %s", destination, seconds, reason)
+        if reason != PARK_REASON_CHAT_FLOOD_WAIT:
+            return
+        parked_now = [
+            parked for parked, _, parked_reason in self.parked_destinations.values()
+            if parked > now and parked_reason == PARK_REASON_CHAT_FLOOD_WAIT
+        ]
+        if len(parked_now) >= self.GLOBAL_FLOOD_WAIT_DESTINATIONS:
+            if self.global_deadline is None:
+                logger.warning("Many destinations are flood waiting, parking all sending for %s seconds", seconds)
+                self._global_parked_at = now
+                self.global_deadline = deadline
+            else:
+                self.global_deadline = max(self.global_deadline, deadline)
+
+    def _unpark_due(self, now: float) -> None:
+        if self.global_deadline is not None and self.global_deadline <= now:
+            parked_seconds_global_flood_wait.inc(now - self._global_parked_at)
+            self.global_deadline = None
+        while self._park_deadlines and self._park_deadlines[0][0] <= now:
+            deadline, destination = heapq.heappop(self._park_deadlines)
+            parked = self.parked_destinations.get(destination)
+            # A destination parked again since this deadline was pushed is left parked
+            if parked is None or parked[0] != deadline:
+                continue
+            del self.parked_destinations[destination]
+            del self.parked_backlogs[destination]
+            for job in self.destination_queues[destination]:
+                if job.parked:
+                    job.parked = False
+                    self._update(job.submission, parked=-1)
+            parked_seconds_by_reason[parked[2]].inc(now - parked[1])
+            self.ready_destinations.append(destination)
+
+    def _take_parked_slot(self, destination: int) -> bool:
+        # Only a limited backlog of messages to each parked destination stops counting towards the limit
+        if self.parked_backlogs[destination] >= self.PARKED_BACKLOG_LIMIT:
+            return False
+        self.parked_backlogs[destination] += 1
+        return True
+
+    def seconds_until_unpark(self) -> Optional[float]:
+        """
+        Time until the next parked destination, or all sending, can be resumed, or None if nothing is parked
+        """
+        deadlines = [deadline for deadline, _ in self._park_deadlines[:1]]
+        if self.global_deadline is not None:
+            deadlines.append(self.global_deadline)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - self.clock())
+
+    def _update(self, submission: SubmissionSend, pending: int = 0, parked: int = 0) -> None:
+        held = submission.holds_capacity()
+        submission.pending += pending
+        submission.parked += parked
+        if held and not submission.holds_capacity():
+            self.capacity_used -= 1
+            self.capacity_signal.notify()
+        elif not held and submission.holds_capacity():
+            self.capacity_used += 1
+
+    def _pop_completed(self) -> List[SubmissionSend]:
+        completed = []
+        while self.submissions:
+            first = next(iter(self.submissions.values()))
+            if first.pending:
+                break
+            del self.submissions[first.state.sub_id]
+            completed.append(first)
+        if completed:
+            # Completing submissions makes room for more deferred submissions
+            self.capacity_signal.notify()
+        return completed
+
+    def count_queued_messages(self) -> int:
+        return sum(len(queue) for queue in self.destination_queues.values())
+
+    def count_busy_destinations(self) -> int:
+        return len(self.busy_destinations)
+
+    def count_parked_destinations(self) -> int:
+        return len(self.parked_destinations)
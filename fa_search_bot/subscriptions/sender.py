@@ -1,22 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import collections
 import datetime
 import logging
 from typing import Union, Dict, List, Optional, TYPE_CHECKING
 
-from prometheus_client import Counter, Summary, Histogram
-from telethon.errors import UserIsBlockedError, InputUserDeactivatedError, ChannelPrivateError, PeerIdInvalidError, FloodWaitError
+from prometheus_client import Counter, Gauge, Summary, Histogram
+from telethon.errors import UserIsBlockedError, InputUserDeactivatedError, ChannelPrivateError, PeerIdInvalidError, FloodWaitError, \
+    ChatWriteForbiddenError, ChatAdminRequiredError, ChatRestrictedError, UserBannedInChannelError, \
+    ChatSendMediaForbiddenError, ChannelInvalidError, ChatIdInvalidError
 from telethon.errors.rpcerrorlist import FilePartMissingError, FilePart0MissingError
 from telethon.tl.types import TypeInputPeer
 
 from fa_search_bot.sites.furaffinity.sendable import SendableFASubmission
 from fa_search_bot.subscriptions.runnable import Runnable
+from fa_search_bot.subscriptions.send_scheduler import PARK_REASON_CHAT_FLOOD_WAIT, PARK_REASON_SEND_FAILURES, \
+    SendJob, SendScheduler, SubmissionSend
 from fa_search_bot.subscriptions.subscription import Subscription
 from fa_search_bot.subscriptions.utils import time_taken, TimeKeeper
 from fa_search_bot.subscriptions.wait_pool import SubmissionCheckState
 
 if TYPE_CHECKING:
+    from asyncio import Task
+
     from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
 
 
@@ -33,6 +40,12 @@ time_taken_sending_messages = time_taken.labels(
     task="sending messages to subscriptions", runnable="Sender", task_type="active"
 )
 time_taken_saving_config = time_taken.labels(task="updating configuration", runnable="Sender", task_type="active")
+time_taken_waiting_for_capacity = time_taken.labels(
+    task="waiting for send workers to catch up", runnable="Sender", task_type="waiting"
+)
+time_taken_send_worker_waiting = time_taken.labels(
+    task="waiting for messages to send", runnable="SendWorker", task_type="waiting"
+)
 sub_updates = Counter("fasearchbot_subscriptionsender_updates_sent_total", "Number of subscription updates sent")
 sub_blocked = Counter(
     "fasearchbot_subscriptionsender_dest_blocked_total",
@@ -69,73 +82,190 @@ send_attempts_needed_success = send_attempts_needed.labels(result="success")
 send_attempts_needed_failed = send_attempts_needed.labels(result="failed")
 send_attempts_needed_file_part_mising = send_attempts_needed.labels(result="file_part_missing")
 send_attempts_needed_blocked = send_attempts_needed.labels(result="blocked")
+gauge_scheduled_submissions = Gauge(
+    "fasearchbot_subscriptionsender_scheduled_submissions",
+    "Number of submissions which have been scheduled for sending, and not yet sent to every destination",
+)
+gauge_queued_messages = Gauge(
+    "fasearchbot_subscriptionsender_queued_messages",
+    "Number of messages queued to be sent to destinations, not including those currently being sent",
+)
+gauge_busy_send_workers = Gauge(
+    "fasearchbot_subscriptionsender_busy_send_workers",
+    "Number of send workers currently sending a message to a destination",
+)
+gauge_parked_destinations = Gauge(
+    "fasearchbot_subscriptionsender_parked_destinations",
+    "Number of destinations which are parked, waiting for a flood wait to expire or to retry after failing, before "
+    "they can be sent to",
+)
+send_job_retries = Counter(
+    "fasearchbot_subscriptionsender_message_retries_total",
+    "Number of times a message failed unexpectedly, and its destination was parked before retrying",
+)
 single_message_send_timer = Summary(
     "fasearchbot_subscriptionsender_single_message_send_time_taken",
     "Amount of time taken (in seconds) to send a submission to a single chat which is subscribed to it",
 )
 
 
+# Errors which mean the bot can never send to a destination, until whoever runs it changes something
+UNREACHABLE_DESTINATION_ERRORS = (
+    UserIsBlockedError,
+    InputUserDeactivatedError,
+    ChannelPrivateError,
+    PeerIdInvalidError,
+    ChatWriteForbiddenError,
+    ChatAdminRequiredError,
+    ChatRestrictedError,
+    UserBannedInChannelError,
+    ChatSendMediaForbiddenError,
+    ChannelInvalidError,
+    ChatIdInvalidError,
+)
+
+
 class MediaMissing(Exception):
     pass
 
 
 class Sender(Runnable):
-    WAIT_BETWEEN_FLOOD_LOGS = datetime.timedelta(60)
     SEND_ATTEMPTS = 3
+    # A destination which a message keeps failing to send to is parked for this long, doubling with each failure
+    SEND_JOB_RETRY_BACKOFF = 20
+    SEND_JOB_MAX_RETRY_BACKOFF = 3600
 
     def __init__(self, watcher: "SubscriptionWatcher") -> None:
         super().__init__(watcher)
         self.last_state: Optional[SubmissionCheckState] = None
+        self.scheduler = SendScheduler(self.watcher.config.max_sending_submissions)
+        self.send_workers: List[Task] = []
+        gauge_scheduled_submissions.set_function(lambda: len(self.scheduler.submissions))
+        gauge_queued_messages.set_function(lambda: self.scheduler.count_queued_messages())
+        gauge_busy_send_workers.set_function(lambda: self.scheduler.count_busy_destinations())
+        gauge_parked_destinations.set_function(lambda: self.scheduler.count_parked_destinations())
+
+    async def run(self) -> None:
+        # The Sender takes submissions from the wait pool in order, and the send workers deliver them to destinations
+        self.running = True
+        event_loop = asyncio.get_event_loop()
+        self.send_workers = [
+            event_loop.create_task(self._run_send_worker()) for _ in range(self.watcher.config.num_send_workers)
+        ]
+        try:
+            await super().run()
+        finally:
+            # Workers stop once they have finished their current message
+            await asyncio.gather(*self.send_workers, return_exceptions=True)
+            self.send_workers.clear()
 
     async def do_process(self) -> None:
+        # Only take submissions from the wait pool while the send workers are keeping up, so that backpressure from
+        # sending reaches the wait pool
+        if not self.scheduler.has_capacity():
+            with time_taken_waiting_for_capacity.time():
+                await self._wait_while_running(self.QUEUE_WAIT_TIMEOUT, self.scheduler.capacity_signal)
+            return
         with time_taken_reading_queue.time():
             next_state = await self.watcher.wait_pool.pop_next_ready_to_send()
         if not next_state:
             with time_taken_waiting.time():
-                await self._wait_while_running(self.QUEUE_BACKOFF)
+                await self._wait_while_running(self.QUEUE_WAIT_TIMEOUT, self.watcher.wait_pool.send_signal)
             return
         self.last_state = next_state
         logger.debug("Got submission ready to send: %s", next_state.sub_id)
-        # Send out messages
+        # Schedule messages to send out
         await self._send_updates(next_state)
-        # Log the posting date of the latest sent submission
-        self.watcher.update_latest_observed(next_state.full_data.posted_at)
-        # Update latest ids with the submission we just checked, and save config
-        with time_taken_saving_config.time():
-            await self.watcher.update_latest_id(next_state.sub_id)
-        self.latest_id_gauge.set(next_state.sub_id.submission_id)
 
     async def _send_updates(self, state: SubmissionCheckState) -> None:
         sendable = SendableFASubmission(state.full_data)
         # Check subscriptions
         with time_taken_checking_matches.time():
             # Check the previously-matched subscriptions again, in case any have been removed or blocklists have changed
-            subscriptions = await self.watcher.check_subscriptions(
-                state.full_data.to_query_target(),
+            subscriptions = await self.watcher.recheck_subscriptions(
+                state.full_data,
                 state.matching_subscriptions,
+                state.matched_generation,
             )
             # Map which subscriptions require this submission at each destination
             destination_map: Dict[int, List[Subscription]] = collections.defaultdict(lambda: [])
             for sub in subscriptions:
                 sub.latest_update = datetime.datetime.now()
                 destination_map[sub.destination].append(sub)
-        # Send the submission to each location
-        send_all_timer = TimeKeeper(time_taken_sending_messages)
-        with send_all_timer.time():
-            for dest, subs in destination_map.items():
-                if dest in state.sent_to:
-                    # Already sent to that destination, skip
-                    continue
-                queries = ", ".join([f'"{sub.query_str}"' for sub in subs])
-                prefix = f"Update on {queries} subscription{'' if len(subs) == 1 else 's'}:"
-                send_one_timer = TimeKeeper(single_message_send_timer)
-                with send_one_timer.time():
-                    await self._try_send_subscription_update(sendable, state, dest, prefix)
-                logger.debug(
-                    "Sent submission %s to destination for %s subscriptions, duration: %s",
-                    state.sub_id, len(subs), send_one_timer.duration
+        # Queue the submission for each destination it has not already been sent to
+        prefixes: Dict[int, str] = {}
+        for dest, subs in destination_map.items():
+            if dest in state.sent_to:
+                continue
+            queries = ", ".join([f'"{sub.query_str}"' for sub in subs])
+            prefixes[dest] = f"Update on {queries} subscription{'' if len(subs) == 1 else 's'}:"
+        logger.debug("Scheduling submission %s to be sent to %s destinations", state.sub_id, len(prefixes))
+        completed_submissions = self.scheduler.schedule(SubmissionSend(state, sendable), prefixes)
+        # The send workers are responsible for the submission now, so it must not be reverted to the wait pool
+        self.last_state = None
+        await self._submissions_sent(completed_submissions)
+
+    async def _run_send_worker(self) -> None:
+        while self.running:
+            job = self.scheduler.next_job()
+            if job is None:
+                # Wake up when work is scheduled, or when a parked destination can be sent to again
+                wait_seconds = self.QUEUE_WAIT_TIMEOUT
+                until_unpark = self.scheduler.seconds_until_unpark()
+                if until_unpark is not None:
+                    wait_seconds = min(wait_seconds, until_unpark)
+                with time_taken_send_worker_waiting.time():
+                    await self._wait_while_running(wait_seconds, self.scheduler.work_signal)
+                continue
+            retry = False
+            park_seconds = None
+            park_reason = PARK_REASON_CHAT_FLOOD_WAIT
+            try:
+                await self._send_job(job)
+            except FloodWaitError as e:
+                # Park the destination and move on to other destinations, this does not count as a failure
+                retry = True
+                park_seconds = e.seconds
+            except Exception:
+                # The failure has already been logged. Messages are never given up on, so park the destination, keeping
+                # its messages in order, and move on to other destinations. The backoff grows, so that a destination
+                # which keeps failing is rarely retried.
+                job.failures += 1
+                retry = True
+                park_seconds = min(
+                    self.SEND_JOB_RETRY_BACKOFF * 2 ** (job.failures - 1), self.SEND_JOB_MAX_RETRY_BACKOFF
+                )
+                park_reason = PARK_REASON_SEND_FAILURES
+                send_job_retries.inc()
+                logger.warning(
+                    "Failed to send submission %s to %s, %s times so far, retrying in %s seconds",
+                    job.submission.state.sub_id, job.destination, job.failures, park_seconds,
                 )
-        logger.debug("Sent messages for submission %s, duration: %s", state.sub_id, send_all_timer.duration)
+            await self._submissions_sent(self.scheduler.finish_job(job, retry, park_seconds, park_reason))
+
+    async def _send_job(self, job: SendJob) -> None:
+        state = job.submission.state
+        send_one_timer = TimeKeeper(single_message_send_timer)
+        with time_taken_sending_messages.time(), send_one_timer.time():
+            await self._try_send_subscription_update(job.submission.sendable, state, job.destination, job.prefix)
+        logger.debug(
+            "Sent submission %s to destination %s, duration: %s", state.sub_id, job.destination, send_one_timer.duration
+        )
+
+    async def _submissions_sent(self, completed_submissions: List[SubmissionSend]) -> None:
+        for completed in completed_submissions:
+            try:
+                await self._submission_sent(completed.state)
+            except Exception as e:
+                logger.error("Failed to record submission %s as sent", completed.state.sub_id, exc_info=e)
+
+    async def _submission_sent(self, state: SubmissionCheckState) -> None:
+        # Log the posting date of the latest sent submission
+        self.watcher.update_latest_observed(state.full_data.posted_at)
+        # Update latest ids with the submission we just sent, and save config
+        with time_taken_saving_config.time():
+            await self.watcher.update_latest_id(state.sub_id)
+        self.latest_id_gauge.set(state.sub_id.submission_id)
 
     async def _try_send_subscription_update(
         self,
@@ -154,21 +284,20 @@ class Sender(Runnable):
                 state.sent_to.append(chat)
                 send_attempts_needed_success.observe(send_attempt)
                 return
-            except (UserIsBlockedError, InputUserDeactivatedError, ChannelPrivateError, PeerIdInvalidError):
+            except UNREACHABLE_DESTINATION_ERRORS as e:
                 sub_blocked.inc()
-                logger.info("Destination %s is blocked or deleted, pausing subscriptions", chat)
-                all_subs = [sub for sub in self.watcher.subscriptions if sub.destination == chat]
-                for sub in all_subs:
-                    sub.paused = True
+                logger.info(
+                    "Destination %s is blocked, deleted, or cannot be posted to, pausing subscriptions: %s", chat, e
+                )
+                await self.watcher.pause_unreachable_destination(chat)
                 send_attempts_needed_blocked.observe(send_attempt)
                 return
             except FloodWaitError as e:
                 seconds = e.seconds
                 flood_waits_requested.observe(seconds)
-                logger.warning("Received flood wait error, have to sleep %s seconds", seconds)
-                await self._flood_wait(seconds)
-                logger.info("Flood wait complete, retrying sending submission")
-                continue
+                logger.warning("Received flood wait error for %s, have to wait %s seconds", chat, seconds)
+                # The send worker parks this destination, rather than waiting here and holding up other destinations
+                raise
             except (FilePartMissingError, FilePart0MissingError) as e:
                 file_part_missing_errors.inc()
                 logger.warning(
@@ -236,21 +365,12 @@ class Sender(Runnable):
 
     async def revert_last_attempt(self) -> None:
         """
-        As there's only 1 Sender, we can push the state back into the wait pool if it failed.
-        If there were more than 1 Sender, this would risk posts being out of order, as the other would have grabbed a
-        new post to send. But having more than 1 Sender would present multiple other challenges.
+        As there's only 1 Sender taking submissions from the wait pool, we can push the state back into the wait pool if
+        it failed before being scheduled. Once scheduled, the state is forgotten here, and the send workers retry until
+        it is sent, so it is never pushed back and sent twice.
         """
         if self.last_state is None:
-            raise ValueError("Can't revert last attempt, as last attempt did not exist")
-        self.watcher.wait_pool.return_populated_state(self.last_state)
-
-    async def _flood_wait(self, seconds: int) -> None:
-        start_time = datetime.datetime.now(tz=datetime.timezone.utc)
-        end_time = start_time + datetime.timedelta(seconds=seconds)
-        remaining_time = end_time - datetime.datetime.now(tz=datetime.timezone.utc)
-        while remaining_time > datetime.timedelta(seconds=0):
-            logger.warning("Waiting for flood warning to expire. %s seconds remain", remaining_time.total_seconds())
-            sleep_batch = min(remaining_time, self.WAIT_BETWEEN_FLOOD_LOGS)
-            await self._wait_while_running(sleep_batch.total_seconds())
-            remaining_time = end_time - datetime.datetime.now(tz=datetime.timezone.utc)
-        logger.info("Flood wait complete")
+            logger.debug("No unscheduled submission to revert")
+            return
+        state, self.last_state = self.last_state, None
+        await self.watcher.wait_pool.return_populated_state(state)
@@ -5,8 +5,11 @@ from typing import Optional, Dict, Any
 
 import dateutil.parser
 
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.subscriptions.batch_matcher import BatchMatcher, compile_batch_query
 from fa_search_bot.subscriptions.query_target import QueryTarget
-from fa_search_bot.subscriptions.query_parser import parse_query, Query, AndQuery, NotQuery
+from fa_search_bot.subscriptions.query_parser import parse_query, Query, AndQuery, NotQuery, QueryMatcher, \
+    compile_query, query_rating_bounds
 
 
 class DestinationBlocklist:
@@ -14,6 +17,9 @@ class DestinationBlocklist:
         self.destination = destination
         self.blocklists = blocklists
         self._combined_query: Optional[Query] = None
+        self._compiled_query: Optional[QueryMatcher] = None
+        self._batch_query: Optional[BatchMatcher] = None
+        self._rating_queries: Dict[Rating, QueryMatcher] = {}
 
     def count_blocks(self) -> int:
         return len(self.blocklists)
@@ -21,16 +27,51 @@ class DestinationBlocklist:
     def add(self, query: str) -> None:
         self.blocklists[query] = parse_query(query)
         self._combined_query = None
+        self._compiled_query = None
+        self._batch_query = None
+        self._rating_queries.clear()
 
     def remove(self, query: str) -> None:
         del self.blocklists[query]
         self._combined_query = None
+        self._compiled_query = None
+        self._batch_query = None
+        self._rating_queries.clear()
 
     def as_combined_query(self) -> Query:
         if self._combined_query is None:
             self._combined_query = AndQuery([NotQuery(query) for query in self.blocklists.values()])
         return self._combined_query
 
+    def as_compiled_query(self) -> QueryMatcher:
+        if self._compiled_query is None:
+            self._compiled_query = compile_query(self.as_combined_query())
+        return self._compiled_query
+
+    def as_rating_query(self, rating: Rating) -> QueryMatcher:
+        """
+        Compiled blocklist check for submissions of the given rating. Block queries which cannot match that rating are
+        left out, and if any block query matches every submission of that rating, nothing is allowed.
+        """
+        matcher = self._rating_queries.get(rating)
+        if matcher is None:
+            blocks: list[Query] = []
+            for query in self.blocklists.values():
+                possible, certain = query_rating_bounds(query)
+                if rating in certain:
+                    blocks = [AndQuery([])]
+                    break
+                if rating in possible:
+                    blocks.append(query)
+            matcher = compile_query(AndQuery([NotQuery(query) for query in blocks]))
+            self._rating_queries[rating] = matcher
+        return matcher
+
+    def as_batch_query(self) -> BatchMatcher:
+        if self._batch_query is None:
+            self._batch_query = compile_batch_query(self.as_combined_query())
+        return self._batch_query
+
     def to_json(self) -> list[dict[str, str]]:
         return [{"query": query} for query in self.blocklists.keys()]
 
@@ -50,19 +91,18 @@ class Subscription:
         self.destination = destination
         self.latest_update: Optional[datetime.datetime] = None
         self.query = parse_query(query_str)
+        self.compiled_query = compile_query(self.query)
         self.paused = False
         self.creation_date: Optional[datetime.datetime] = None
         self.creator_id: Optional[int] = None
 
-    def matches_result(self, result: QueryTarget, blocklist_query: Optional[Query]) -> bool:
+    def matches_result(self, result: QueryTarget, blocklist_query: Optional[QueryMatcher]) -> bool:
         if self.paused:
             return False
-        full_query = self.query
         if blocklist_query is not None:
             # Checking this way, rather than constructing an AndQuery, is twice as fast.
-            return self.query.matches_submission(result) and blocklist_query.matches_submission(result)
-            # full_query = AndQuery([self.query, blocklist_query])
-        return self.query.matches_submission(result)
+            return self.compiled_query(result) and blocklist_query(result)
+        return self.compiled_query(result)
 
     def to_json(self) -> Dict:
         latest_update_str = None
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import collections
+import logging
+from typing import TYPE_CHECKING, Generic, Hashable, TypeVar, Union
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.subscriptions.query_parser import (
+    AndQuery,
+    ExceptionQuery,
+    OrQuery,
+    PhraseQuery,
+    Query,
+    RatingQuery,
+    WordQuery,
+    query_rating_bounds,
+)
+from fa_search_bot.subscriptions.query_target import (
+    AnyField,
+    ArtistField,
+    DescriptionField,
+    Field,
+    KeywordField,
+    QueryTarget,
+    SpecificField,
+    TitleField,
+    split_text_to_words,
+)
+
+if TYPE_CHECKING:
+    from typing import DefaultDict, Dict, FrozenSet, Optional, Set, Type
+
+logger = logging.getLogger(__name__)
+
+# An index term is either a word within a specific field (or AnyField), or a submission rating
+IndexTerm = Union[tuple[type[Field], str], Rating]
+T = TypeVar("T", bound=Hashable)
+
+
+def _phrase_index_terms(phrase: PhraseQuery) -> Optional[FrozenSet[IndexTerm]]:
+    words = split_text_to_words(phrase.phrase)
+    if not words:
+        return None
+    # Every word of the phrase has to be present for it to match, so pick the longest, as likely the most selective
+    return frozenset([(phrase.field, max(words, key=len))])
+
+
+def _and_index_terms(query: AndQuery) -> Optional[FrozenSet[IndexTerm]]:
+    # Any one of the sub-queries' required terms will do, so pick the most selective looking set of terms.
+    options = [terms for terms in (query_index_terms(q) for q in query.sub_queries) if terms is not None]
+    if not options:
+        return None
+    return min(options, key=lambda terms: (any(isinstance(t, Rating) for t in terms), len(terms)))
+
+
+def _or_index_terms(query: OrQuery) -> Optional[FrozenSet[IndexTerm]]:
+    terms: Set[IndexTerm] = set()
+    for sub_query in query.sub_queries:
+        sub_terms = query_index_terms(sub_query)
+        if sub_terms is None:
+            return None
+        terms.update(sub_terms)
+    return frozenset(terms)
+
+
+def query_index_terms(query: Query) -> Optional[FrozenSet[IndexTerm]]:
+    """
+    Returns a set of index terms, at least one of which must be present in a QueryTarget for the query to match it.
+    Returns None if no such set can be determined for the query, for example for negations and wildcards.
+    """
+    if isinstance(query, WordQuery):
+        return frozenset([(query.field, query.word.lower())])
+    if isinstance(query, PhraseQuery):
+        return _phrase_index_terms(query)
+    if isinstance(query, RatingQuery):
+        return frozenset([query.rating])
+    if isinstance(query, ExceptionQuery):
+        # The exception can only reduce the matches of the word query
+        return query_index_terms(query.word)
+    if isinstance(query, AndQuery):
+        return _and_index_terms(query)
+    if isinstance(query, OrQuery):
+        return _or_index_terms(query)
+    return None
+
+
+def _artist_names(query: Query) -> Optional[FrozenSet[str]]:
+    if isinstance(query, WordQuery) and query.field is ArtistField:
+        return frozenset([query.word_lower])
+    if isinstance(query, OrQuery) and query.sub_queries:
+        names: Set[str] = set()
+        for sub_query in query.sub_queries:
+            sub_names = _artist_names(sub_query)
+            if sub_names is None:
+                return None
+            names.update(sub_names)
+        return frozenset(names)
+    return None
+
+
+def _is_rating_only(query: Query) -> bool:
+    # If the ratings a query could match are the same as those it always matches, then nothing else matters
+    possible, certain = query_rating_bounds(query)
+    return possible == certain
+
+
+def query_artist_names(query: Query) -> Optional[FrozenSet[str]]:
+    """
+    If the query is just a check for one of a set of artists, possibly along with rating checks, returns the lowercase
+    names of those artists. For a submission of a rating which the query allows, the query matches exactly when one of
+    the submission's artist names is in that set.
+    Returns None for any other query.
+    """
+    names = _artist_names(query)
+    if names is not None or not isinstance(query, AndQuery):
+        return names
+    for sub_query in query.sub_queries:
+        sub_names = _artist_names(sub_query)
+        if sub_names is not None and names is None:
+            names = sub_names
+        elif not _is_rating_only(sub_query):
+            return None
+    return names
+
+
+def target_index_terms(target: QueryTarget) -> Set[IndexTerm]:
+    terms: Set[IndexTerm] = {target.rating}
+    fields: Dict[Type[Field], SpecificField] = {
+        TitleField: target.title,
+        DescriptionField: target.description,
+        KeywordField: target.keywords,
+        ArtistField: target.artist,
+    }
+    for field_cls, field in fields.items():
+        for word in field.index_words():
+            terms.add((field_cls, word))
+            terms.add((AnyField, word))
+    return terms
+
+
+class SubscriptionIndex(Generic[T]):
+    """
+    An inverted index from the terms which queries require, to the items (e.g. subscriptions) with those queries.
+    Items whose queries cannot be indexed are kept in an "always check" bucket, and are always returned as candidates.
+    """
+
+    def __init__(self) -> None:
+        self._term_index: DefaultDict[IndexTerm, Set[T]] = collections.defaultdict(set)
+        self._item_terms: Dict[T, Optional[FrozenSet[IndexTerm]]] = {}
+        self.always_check: Set[T] = set()
+
+    def add(self, item: T, query: Query) -> None:
+        if item in self._item_terms:
+            self.remove(item)
+        terms = query_index_terms(query)
+        self._item_terms[item] = terms
+        if terms is None:
+            self.always_check.add(item)
+            return
+        for term in terms:
+            self._term_index[term].add(item)
+
+    def remove(self, item: T) -> None:
+        terms = self._item_terms.pop(item, None)
+        self.always_check.discard(item)
+        if terms is None:
+            return
+        for term in terms:
+            items = self._term_index.get(term)
+            if items is None:
+                continue
+            items.discard(item)
+            if not items:
+                del self._term_index[term]
+
+    def clear(self) -> None:
+        self._term_index.clear()
+        self._item_terms.clear()
+        self.always_check.clear()
+
+    def candidates(self, target: QueryTarget) -> Set[T]:
+        """
+        Returns the set of items which might match the given target. Any items not returned definitely do not match.
+        """
+        candidates = set(self.always_check)
+        for term in target_index_terms(target):
+            items = self._term_index.get(term)
+            if items:
+                candidates.update(items)
+        return candidates
+
+    def count_unindexed(self) -> int:
+        return len(self.always_check)
+
+    def __len__(self) -> int:
+        return len(self._item_terms)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._item_terms
+
+
+class ArtistIndex(Generic[T]):
+    """
+    A hash index from lowercase artist name to the items (e.g. subscriptions) whose queries only check the artist, as
+    found by query_artist_names(). Such items can be matched by looking up the artist names of a QueryTarget, without
+    evaluating their queries at all.
+    """
+
+    def __init__(self) -> None:
+        self._name_index: DefaultDict[str, Set[T]] = collections.defaultdict(set)
+        self._item_names: Dict[T, FrozenSet[str]] = {}
+
+    def add(self, item: T, names: FrozenSet[str]) -> None:
+        if item in self._item_names:
+            self.remove(item)
+        self._item_names[item] = names
+        for name in names:
+            self._name_index[name].add(item)
+
+    def remove(self, item: T) -> None:
+        names = self._item_names.pop(item, None)
+        if names is None:
+            return
+        for name in names:
+            items = self._name_index.get(name)
+            if items is None:
+                continue
+            items.discard(item)
+            if not items:
+                del self._name_index[name]
+
+    def clear(self) -> None:
+        self._name_index.clear()
+        self._item_names.clear()
+
+    def matches(self, target: QueryTarget) -> Set[T]:
+        """
+        Returns the set of items which match the given target
+        """
+        matches: Set[T] = set()
+        for name in target.artist.tokens().word_set:
+            items = self._name_index.get(name)
+            if items:
+                matches.update(items)
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._item_names)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._item_names
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.subscriptions.affix_scanner import AffixScanner
+from fa_search_bot.subscriptions.batch_matcher import TargetBatch, compile_batch_query, iter_bits
+from fa_search_bot.subscriptions.match_profiler import KIND_BLOCKLIST, KIND_QUERY, match_profiler
+from fa_search_bot.subscriptions.phrase_scanner import PhraseScanner, case_folds_simply
+from fa_search_bot.subscriptions.predicate_stats import predicate_stats
+from fa_search_bot.subscriptions.query_parser import query_allowed_ratings, sampling_matcher
+from fa_search_bot.subscriptions.subscription_index import ArtistIndex, SubscriptionIndex, query_artist_names
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+    from fa_search_bot.subscriptions.query_parser import Query, QueryMatcher
+    from fa_search_bot.subscriptions.query_target import QueryTarget
+    from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+
+logger = logging.getLogger(__name__)
+
+
+def query_key(query_str: str) -> str:
+    """
+    Normalised form of a query string, such that queries with the same key will always match the same submissions.
+    Matching is case-insensitive, except for a few unusual unicode characters.
+    """
+    if case_folds_simply(query_str):
+        return query_str.lower()
+    return query_str
+
+
+class QueryGroup:
+    """
+    All the subscriptions which share the same query, so that the query only needs checking once per submission
+    """
+
+    def __init__(self, key: str, query: Query, compiled_query: QueryMatcher) -> None:
+        self.key = key
+        self.query = query
+        # Shared with the subscription which created the group, so each query is only compiled once
+        self.compiled_query = compiled_query
+        self.sampling_query = sampling_matcher(self.compiled_query)
+        self.batch_query = compile_batch_query(query)
+        self.allowed_ratings = query_allowed_ratings(query)
+        # Queries which only check the artist are looked up by artist name, rather than evaluated
+        self.artist_names = query_artist_names(query)
+        self.subscriptions: Set[Subscription] = set()
+
+    def __repr__(self) -> str:
+        return f"QueryGroup({self.key!r}, subscriptions={len(self.subscriptions)})"
+
+
+class SubscriptionMatcher:
+    """
+    Holds the matching state for all subscriptions and blocklists, and works out which subscriptions match a submission.
+    Each change to the subscriptions or blocklists is applied as a delta, and stamped with a new generation number, so
+    that it can be told which subscriptions have changed since a submission was matched.
+    """
+
+    def __init__(self, blocklists: Dict[int, DestinationBlocklist]) -> None:
+        self.blocklists = blocklists
+        self.groups: Dict[str, QueryGroup] = {}
+        self.subscription_groups: Dict[Subscription, QueryGroup] = {}
+        # Queries are partitioned by the submission ratings they could possibly match, so each submission only
+        # needs checking against the queries in the bucket for its own rating
+        self.rating_indexes: Dict[Rating, SubscriptionIndex[QueryGroup]] = {
+            rating: SubscriptionIndex() for rating in Rating
+        }
+        self.rating_artist_indexes: Dict[Rating, ArtistIndex[QueryGroup]] = {rating: ArtistIndex() for rating in Rating}
+        self.phrase_scanner = PhraseScanner()
+        self.affix_scanner = AffixScanner()
+        # Paused subscriptions are kept out of the query groups and indexes, so matching never has to consider them
+        self.paused_subscriptions: Set[Subscription] = set()
+        # The generation of the latest change, and of the latest change to each subscription and destination blocklist
+        self.generation = 0
+        self.subscription_generations: Dict[Subscription, int] = {}
+        self.destination_generations: Dict[int, int] = {}
+
+    def _next_generation(self) -> int:
+        self.generation += 1
+        return self.generation
+
+    def add_subscription(self, subscription: Subscription) -> None:
+        if subscription in self.subscription_generations:
+            return
+        self.subscription_generations[subscription] = self._next_generation()
+        if subscription.paused:
+            self.paused_subscriptions.add(subscription)
+        else:
+            self._activate(subscription)
+
+    def remove_subscription(self, subscription: Subscription) -> None:
+        if self.subscription_generations.pop(subscription, None) is None:
+            return
+        self._next_generation()
+        if subscription in self.paused_subscriptions:
+            self.paused_subscriptions.discard(subscription)
+        else:
+            self._deactivate(subscription)
+
+    def set_paused(self, subscription: Subscription) -> None:
+        """
+        Moves a subscription into or out of the paused set, to match its paused flag
+        """
+        if subscription not in self.subscription_generations:
+            return
+        if subscription.paused == (subscription in self.paused_subscriptions):
+            return
+        self.subscription_generations[subscription] = self._next_generation()
+        if subscription.paused:
+            self._deactivate(subscription)
+            self.paused_subscriptions.add(subscription)
+        else:
+            self.paused_subscriptions.discard(subscription)
+            self._activate(subscription)
+
+    def changed_since(self, subscription: Subscription, generation: int) -> bool:
+        """
+        Whether a subscription, or its destination's blocklist, has changed since the given generation. Subscriptions
+        which have since been removed count as changed.
+        """
+        subscription_generation = self.subscription_generations.get(subscription)
+        if subscription_generation is None or subscription_generation > generation:
+            return True
+        return self.destination_generations.get(subscription.destination, 0) > generation
+
+    def _activate(self, subscription: Subscription) -> None:
+        key = query_key(subscription.query_str)
+        group = self.groups.get(key)
+        if group is None:
+            group = QueryGroup(key, subscription.query, subscription.compiled_query)
+            self.groups[key] = group
+            for rating in group.allowed_ratings:
+                if group.artist_names is not None:
+                    self.rating_artist_indexes[rating].add(group, group.artist_names)
+                else:
+                    self.rating_indexes[rating].add(group, group.query)
+            self.phrase_scanner.add_query(group.query)
+            self.affix_scanner.add_query(group.query)
+        group.subscriptions.add(subscription)
+        self.subscription_groups[subscription] = group
+
+    def _deactivate(self, subscription: Subscription) -> None:
+        group = self.subscription_groups.pop(subscription, None)
+        if group is None:
+            return
+        group.subscriptions.discard(subscription)
+        if not group.subscriptions:
+            del self.groups[group.key]
+            for rating in group.allowed_ratings:
+                self.rating_indexes[rating].remove(group)
+                self.rating_artist_indexes[rating].remove(group)
+            self.phrase_scanner.remove_query(group.query)
+            self.affix_scanner.remove_query(group.query)
+
+    def add_block_query(self, destination: int, query: Query) -> None:
+        self.destination_generations[destination] = self._next_generation()
+        self.phrase_scanner.add_query(query)
+        self.affix_scanner.add_query(query)
+
+    def remove_block_query(self, destination: int, query: Query) -> None:
+        self.destination_generations[destination] = self._next_generation()
+        self.phrase_scanner.remove_query(query)
+        self.affix_scanner.remove_query(query)
+
+    def rebuild(self, subscriptions: Iterable[Subscription]) -> None:
+        """
+        Builds the matching state from scratch. This is only needed when loading, as every later change is applied as a
+        delta.
+        """
+        self.groups.clear()
+        self.subscription_groups.clear()
+        self.paused_subscriptions.clear()
+        self.subscription_generations.clear()
+        self.destination_generations.clear()
+        for rating_index in self.rating_indexes.values():
+            rating_index.clear()
+        for artist_index in self.rating_artist_indexes.values():
+            artist_index.clear()
+        self.phrase_scanner = PhraseScanner()
+        self.affix_scanner = AffixScanner()
+        for subscription in subscriptions:
+            self.add_subscription(subscription)
+        for blocklist in self.blocklists.values():
+            for block_query in blocklist.blocklists.values():
+                self.add_block_query(blocklist.destination, block_query)
+
+    def count_distinct_queries(self) -> int:
+        return len(self.groups)
+
+    def count_unindexed_queries(self) -> int:
+        unindexed: Set[QueryGroup] = set()
+        for rating_index in self.rating_indexes.values():
+            unindexed.update(rating_index.always_check)
+        return len(unindexed)
+
+    def count_rating_queries(self, rating: Rating) -> int:
+        return len(self.rating_indexes[rating]) + len(self.rating_artist_indexes[rating])
+
+    def count_artist_queries(self) -> int:
+        return len([group for group in self.groups.values() if group.artist_names is not None])
+
+    def count_scanned_phrases(self) -> int:
+        return self.phrase_scanner.count_phrases()
+
+    def count_scanned_affixes(self) -> int:
+        return self.affix_scanner.count_affixes()
+
+    def _destination_allows(self, destination: int, target: QueryTarget) -> bool:
+        blocklist = self.blocklists.get(destination)
+        if blocklist is None:
+            return True
+        return blocklist.as_rating_query(target.rating)(target)
+
+    def _profiled_destination_allows(self, destination: int, target: QueryTarget) -> bool:
+        start_ns = time.perf_counter_ns()
+        allowed = self._destination_allows(destination, target)
+        if destination in self.blocklists:
+            match_profiler.record(KIND_BLOCKLIST, str(destination), time.perf_counter_ns() - start_ns)
+        return allowed
+
+    def _matching_groups(
+            self,
+            target: QueryTarget,
+            subscriptions: Optional[Set[Subscription]],
+            sample: bool,
+            profile: bool = False,
+    ) -> Iterator[QueryGroup]:
+        if subscriptions is None:
+            yield from self.rating_artist_indexes[target.rating].matches(target)
+            # Only check the queries which could possibly match this submission
+            candidates: Iterable[QueryGroup] = self.rating_indexes[target.rating].candidates(target)
+        else:
+            groups = set(self.subscription_groups.get(subscription) for subscription in subscriptions)
+            candidates = [group for group in groups if group is not None and target.rating in group.allowed_ratings]
+        if profile:
+            yield from self._profiled_groups(target, candidates, sample)
+            return
+        for group in candidates:
+            # Each distinct query is only evaluated once, and then the result is shared by each subscription
+            if group.artist_names is not None:
+                if not group.artist_names.isdisjoint(target.artist.tokens().word_set):
+                    yield group
+            else:
+                query_matcher = group.sampling_query if sample else group.compiled_query
+                if query_matcher(target):
+                    yield group
+
+    def _profiled_groups(
+            self,
+            target: QueryTarget,
+            candidates: Iterable[QueryGroup],
+            sample: bool,
+    ) -> Iterator[QueryGroup]:
+        # Kept apart from _matching_groups, so that timing each query costs nothing while profiling is disabled
+        for group in candidates:
+            start_ns = time.perf_counter_ns()
+            if group.artist_names is not None:
+                matched = not group.artist_names.isdisjoint(target.artist.tokens().word_set)
+            else:
+                matched = (group.sampling_query if sample else group.compiled_query)(target)
+            match_profiler.record(KIND_QUERY, group.key, time.perf_counter_ns() - start_ns)
+            if matched:
+                yield group
+
+    def match(self, target: QueryTarget, subscriptions: Optional[Set[Subscription]] = None) -> List[Subscription]:
+        """
+        Returns the list of subscriptions which match the target. If a set of subscriptions is given, only those are
+        checked.
+        """
+        # Scan the submission for every subscription and blocklist phrase, prefix, and suffix in one pass
+        self.phrase_scanner.attach(target)
+        self.affix_scanner.attach(target)
+        # Each destination's blocklist verdict is only calculated once, the first time it is needed
+        destination_allowed: Dict[int, bool] = {}
+        matching_subscriptions = []
+        # A sample of submissions gather runtime statistics on the queries, which are used to reorder them
+        sample = predicate_stats.take_sample()
+        profile = match_profiler.take_sample()
+        for group in self._matching_groups(target, subscriptions, sample, profile):
+            for subscription in group.subscriptions:
+                if subscriptions is not None and subscription not in subscriptions:
+                    continue
+                destination = subscription.destination
+                allowed = destination_allowed.get(destination)
+                if allowed is None:
+                    if profile:
+                        allowed = self._profiled_destination_allows(destination, target)
+                    else:
+                        allowed = self._destination_allows(destination, target)
+                    destination_allowed[destination] = allowed
+                if allowed:
+                    matching_subscriptions.append(subscription)
+        return matching_subscriptions
+
+    def match_batch(self, targets: Sequence[QueryTarget]) -> List[List[Subscription]]:
+        """
+        Returns the list of matching subscriptions for each of the targets. Each distinct query is checked against the
+        whole batch at once.
+        """
+        batch = TargetBatch(targets)
+        # Work out which targets each query needs checking against
+        group_masks: Dict[QueryGroup, int] = {}
+        # The targets which each query matches, where queries which only check the artist need no evaluating
+        group_hits: Dict[QueryGroup, int] = {}
+        for index, target in enumerate(targets):
+            self.phrase_scanner.attach(target)
+            self.affix_scanner.attach(target)
+            bit = 1 << index
+            for group in self.rating_artist_indexes[target.rating].matches(target):
+                group_hits[group] = group_hits.get(group, 0) | bit
+            sample = predicate_stats.take_sample()
+            if match_profiler.take_sample():
+                # Profiled submissions are checked on their own, so that each query and blocklist can be timed
+                candidates = self.rating_indexes[target.rating].candidates(target)
+                for group in self._profiled_groups(target, candidates, sample):
+                    group_hits[group] = group_hits.get(group, 0) | bit
+                self._profile_blocklists(target, group_hits, bit)
+                continue
+            if sample:
+                # Sampled submissions are checked on their own, so runtime statistics can be gathered
+                for group in self.rating_indexes[target.rating].candidates(target):
+                    if group.sampling_query(target):
+                        group_hits[group] = group_hits.get(group, 0) | bit
+                continue
+            for group in self.rating_indexes[target.rating].candidates(target):
+                group_masks[group] = group_masks.get(group, 0) | bit
+        for group, mask in group_masks.items():
+            hits = group.batch_query(batch, mask)
+            if hits:
+                group_hits[group] = group_hits.get(group, 0) | hits
+        # For each destination, the bitset of targets whose blocklist verdict is known, and those which are allowed
+        destination_verdicts: Dict[int, Tuple[int, int]] = {}
+        results: List[List[Subscription]] = [[] for _ in targets]
+        for group, hits in group_hits.items():
+            for subscription in group.subscriptions:
+                destination = subscription.destination
+                checked, allowed = destination_verdicts.get(destination, (0, 0))
+                unchecked = hits & ~checked
+                if unchecked:
+                    allowed |= self._destination_allows_batch(destination, batch, unchecked)
+                    checked |= unchecked
+                    destination_verdicts[destination] = (checked, allowed)
+                for index in iter_bits(hits & allowed):
+                    results[index].append(subscription)
+        return results
+
+    def _profile_blocklists(self, target: QueryTarget, group_hits: Dict[QueryGroup, int], bit: int) -> None:
+        # Batches check each blocklist against many submissions at once, so a profiled submission's blocklists are timed
+        # on their own
+        destinations = {
+            subscription.destination
+            for group, hits in group_hits.items()
+            if hits & bit
+            for subscription in group.subscriptions
+        }
+        for destination in destinations:
+            self._profiled_destination_allows(destination, target)
+
+    def _destination_allows_batch(self, destination: int, batch: TargetBatch, mask: int) -> int:
+        blocklist = self.blocklists.get(destination)
+        if blocklist is None:
+            return mask
+        return blocklist.as_batch_query()(batch, mask)
@@ -3,35 +3,44 @@ from __future__ import annotations
 import asyncio
 import collections
 import datetime
+import functools
 import json
 import logging
+import time
 from asyncio import Task
-from concurrent.futures import ProcessPoolExecutor
 from typing import TYPE_CHECKING
 
 import aiofiles
 import aiofiles.os
-from prometheus_client import Gauge
+from prometheus_client import Counter, Gauge
 
 from fa_search_bot.config import SubscriptionWatcherConfig
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.subscriptions.autoscaler import WorkerAutoscaler
 from fa_search_bot.subscriptions.query_target import QueryTarget
 from fa_search_bot.subscriptions.media_downloader import MediaDownloader
+from fa_search_bot.subscriptions.match_profiler import KIND_BLOCKLIST, KIND_QUERY, match_profiler
+from fa_search_bot.subscriptions.matcher_pool import MatcherPool, MatcherPoolError
 from fa_search_bot.subscriptions.media_uploader import MediaUploader
-from fa_search_bot.subscriptions.runnable import ShutdownError
-from fa_search_bot.subscriptions.query_parser import Query
+from fa_search_bot.subscriptions.predicate_stats import predicate_stats
+from fa_search_bot.subscriptions.runnable import Runnable, ShutdownError
 from fa_search_bot.sites.submission_id import SubmissionID
-from fa_search_bot.subscriptions.data_fetcher import DataFetcher
+from fa_search_bot.subscriptions.data_fetcher import DataFetcher, MatchBatcher
 from fa_search_bot.subscriptions.sender import Sender
 from fa_search_bot.subscriptions.sub_id_gatherer import SubIDGatherer
 from fa_search_bot.subscriptions.subscription import Subscription, DestinationBlocklist
+from fa_search_bot.subscriptions.subscription_matcher import SubscriptionMatcher
 from fa_search_bot.subscriptions.wait_pool import WaitPool
 
 if TYPE_CHECKING:
-    from typing import Deque, Dict, List, Optional, Set
+    from typing import Deque, Dict, List, Optional, Set, Tuple, Type
 
     from telethon import TelegramClient
 
+    from fa_search_bot.subscriptions.match_profiler import ProfileRow
+
     from fa_search_bot.sites.furaffinity.fa_export_api import FAExportAPI
+    from fa_search_bot.sites.furaffinity.fa_submission import FASubmissionFull
     from fa_search_bot.submission_cache import SubmissionCache
 
 logger = logging.getLogger(__name__)
@@ -52,6 +61,31 @@ gauge_sub_blocks = Gauge(
     "fasearchbot_fasubwatcher_subscription_block_query_count",
     "Total number of blocklist queries",
 )
+gauge_sub_distinct_queries = Gauge(
+    "fasearchbot_fasubwatcher_subscription_distinct_query_count",
+    "Number of distinct subscription queries, each of which is checked once per submission",
+)
+gauge_sub_unindexed = Gauge(
+    "fasearchbot_fasubwatcher_subscription_unindexed_count",
+    "Number of distinct subscription queries which cannot be indexed, and so must be checked against every submission",
+)
+gauge_rating_queries = Gauge(
+    "fasearchbot_fasubwatcher_rating_query_count",
+    "Number of distinct subscription queries which could match submissions of each rating",
+    labelnames=["rating"],
+)
+gauge_artist_queries = Gauge(
+    "fasearchbot_fasubwatcher_artist_query_count",
+    "Number of distinct subscription queries which only check the artist, and so are looked up by artist name",
+)
+gauge_scanned_phrases = Gauge(
+    "fasearchbot_fasubwatcher_scanned_phrase_count",
+    "Number of distinct phrases in subscriptions and blocklists which submissions are scanned for in a single pass",
+)
+gauge_scanned_affixes = Gauge(
+    "fasearchbot_fasubwatcher_scanned_affix_count",
+    "Number of distinct prefixes and suffixes in subscriptions and blocklists which are looked up in a single pass",
+)
 gauge_wait_pool_size = Gauge(
     "fasearchbot_fasubwatcher_wait_pool_size",
     "Total number of submissions in the wait pool",
@@ -111,10 +145,25 @@ gauge_expected_task_count = Gauge(
     "fasearchbot_fasubwatcher_expected_task_count",
     "Total number of tasks which are expected to be running",
 )
+gauge_running_matcher_process_count = Gauge(
+    "fasearchbot_fasubwatcher_running_matcher_process_count",
+    "Number of subscription matcher processes currently running",
+)
+gauge_expected_matcher_process_count = Gauge(
+    "fasearchbot_fasubwatcher_expected_matcher_process_count",
+    "Number of subscription matcher processes which are expected to be running",
+)
 latest_sub_posted_at = Gauge(
     "fasearchbot_fasubwatcher_latest_posted_at_unixtime",
     "Time that the latest posted submission was posted on FA",
 )
+counter_sender_rechecks = Counter(
+    "fasearchbot_fasubwatcher_sender_recheck_subscriptions_total",
+    "Number of previously matched subscriptions which the sender re-evaluated, or skipped as unchanged since matching",
+    labelnames=["result"],
+)
+rechecked_subscriptions = counter_sender_rechecks.labels(result="rechecked")
+skipped_rechecks = counter_sender_rechecks.labels(result="skipped")
 
 
 class SubscriptionAlreadyPaused(Exception):
@@ -129,6 +178,8 @@ class SubscriptionWatcher:
     BACK_OFF = 20
     FILENAME = "subscriptions.json"
     FILENAME_TEMP = "subscriptions.temp.json"
+    PREDICATE_STATS_FILENAME = "predicate_stats.json"
+    MATCH_PROFILE_COLLECT_INTERVAL = 60
 
     def __init__(
             self,
@@ -146,6 +197,9 @@ class SubscriptionWatcher:
         self.latest_ids: Deque[str] = collections.deque(maxlen=15)
         self.subscriptions: Set[Subscription] = set()
         self.blocklists: dict[int, DestinationBlocklist] = dict()
+        self.matcher = SubscriptionMatcher(self.blocklists)
+        # Submissions fetched by the data fetchers are matched in batches, when a backlog builds up
+        self.match_batcher = MatchBatcher(self, DataFetcher.MATCH_BATCH_SIZE)
 
         # Initialise sharing data structures
         self.wait_pool = WaitPool(self.config.max_ready_for_upload, self.config.fetch_refresh_limit)
@@ -156,10 +210,13 @@ class SubscriptionWatcher:
         self.media_downloaders: list[MediaDownloader] = []
         self.media_uploaders: list[MediaUploader] = []
         self.sender: Optional[Sender] = None
+        self.autoscaler: Optional[WorkerAutoscaler] = None
         self.sub_tasks: List[Task] = []
 
-        # Initialise the subscription checker process pool
-        self.checker_executor = ProcessPoolExecutor(2)
+        # Initialise the subscription matcher process pool, which is started along with the tasks
+        self.matcher_pool = MatcherPool(self.config.num_matcher_processes, self.PREDICATE_STATS_FILENAME)
+        match_profiler.set_enabled(self.config.profile_matching)
+        self.match_profile_collected = time.monotonic()
 
         # Initialise gauges and prometheus metrics
         self.latest_observed_submission: Optional[datetime.datetime] = None
@@ -169,6 +226,15 @@ class SubscriptionWatcher:
         gauge_sub_active_destinations.set_function(
             lambda: len(set(s.destination for s in self.subscriptions if not s.paused))
         )
+        gauge_sub_distinct_queries.set_function(lambda: self.matcher.count_distinct_queries())
+        gauge_sub_unindexed.set_function(lambda: self.matcher.count_unindexed_queries())
+        for rating in Rating:
+            gauge_rating_queries.labels(rating=rating.name.lower()).set_function(
+                functools.partial(self.matcher.count_rating_queries, rating)
+            )
+        gauge_artist_queries.set_function(lambda: self.matcher.count_artist_queries())
+        gauge_scanned_phrases.set_function(lambda: self.matcher.count_scanned_phrases())
+        gauge_scanned_affixes.set_function(lambda: self.matcher.count_scanned_affixes())
         gauge_sub_blocks.set_function(lambda: sum(blocklist.count_blocks() for blocklist in self.blocklists.values()))
         gauge_wait_pool_size.set_function(lambda: self.wait_pool.size())
         gauge_wait_pool_active_size.set_function(lambda: self.wait_pool.size_active())
@@ -178,48 +244,80 @@ class SubscriptionWatcher:
         gauge_upload_queue_size.set_function(lambda: self.wait_pool.qsize_upload())
         gauge_send_queue_size.set_function(lambda: self.wait_pool.qsize_send())
         gauge_running_data_fetcher_count.set_function(lambda: len([f for f in self.data_fetchers if f.running]))
-        gauge_expected_data_fetcher_count.set(self.config.num_data_fetchers)
         gauge_running_media_downloader_count.set_function(lambda: len([f for f in self.media_downloaders if f.running]))
-        gauge_expected_media_downloader_count.set(self.config.num_media_downloaders)
         gauge_running_media_uploader_count.set_function(lambda: len([f for f in self.media_uploaders if f.running]))
-        gauge_expected_media_uploader_count.set(self.config.num_media_uploaders)
         gauge_running_task_count.set_function(lambda: len([t for t in self.sub_tasks if not t.done()]))
-        gauge_expected_task_count.set(2 + self.config.total_num_task_runners())
+        self._update_expected_task_gauges()
+        gauge_running_matcher_process_count.set_function(lambda: len(self.matcher_pool.workers))
+        gauge_expected_matcher_process_count.set(self.config.num_matcher_processes)
 
     def start_tasks(self) -> None:
         if self.sub_tasks:
             raise RuntimeError("Already running")
         event_loop = asyncio.get_event_loop()
+        # Start the subscription matcher processes
+        if self.config.num_matcher_processes:
+            self.matcher_pool.start(self.subscriptions, self.blocklists)
         # Start the submission ID gatherer
         self.sub_id_gatherer = SubIDGatherer(self)
         sub_id_gatherer_task = event_loop.create_task(self.sub_id_gatherer.run())
         self.sub_tasks.append(sub_id_gatherer_task)
-        # Start the data fetchers
-        for _ in range(self.config.num_data_fetchers):
-            data_fetcher = DataFetcher(self)
-            self.data_fetchers.append(data_fetcher)
-            data_fetcher_task = event_loop.create_task(data_fetcher.run())
-            self.sub_tasks.append(data_fetcher_task)
-        # Start the media downloaders
-        for _ in range(self.config.num_media_downloaders):
-            media_downloader = MediaDownloader(self)
-            self.media_downloaders.append(media_downloader)
-            media_downloader_task = event_loop.create_task(media_downloader.run())
-            self.sub_tasks.append(media_downloader_task)
-        # Start the media uploaders
-        for _ in range(self.config.num_media_uploaders):
-            media_uploader = MediaUploader(self)
-            self.media_uploaders.append(media_uploader)
-            media_uploader_task = event_loop.create_task(media_uploader.run())
-            self.sub_tasks.append(media_uploader_task)
+        # Start the data fetchers, media downloaders, and media uploaders
+        self._scale_pool(self.data_fetchers, DataFetcher, self.config.num_data_fetchers)
+        self._scale_pool(self.media_downloaders, MediaDownloader, self.config.num_media_downloaders)
+        self._scale_pool(self.media_uploaders, MediaUploader, self.config.num_media_uploaders)
         # Start the submission sender
         self.sender = Sender(self)
         task_sender = event_loop.create_task(self.sender.run())
         self.sub_tasks.append(task_sender)
+        # Start the autoscaler, which adjusts the number of workers in each pool
+        if self.config.autoscale_workers:
+            self.autoscaler = WorkerAutoscaler(self)
+            task_autoscaler = event_loop.create_task(self.autoscaler.run())
+            self.sub_tasks.append(task_autoscaler)
+        self._update_expected_task_gauges()
+
+    def scale_data_fetchers(self, count: int) -> None:
+        self.config.num_data_fetchers = count
+        self._scale_pool(self.data_fetchers, DataFetcher, count)
+        self._update_expected_task_gauges()
+
+    def scale_media_downloaders(self, count: int) -> None:
+        self.config.num_media_downloaders = count
+        self._scale_pool(self.media_downloaders, MediaDownloader, count)
+        self._update_expected_task_gauges()
+
+    def scale_media_uploaders(self, count: int) -> None:
+        self.config.num_media_uploaders = count
+        self._scale_pool(self.media_uploaders, MediaUploader, count)
+        self._update_expected_task_gauges()
+
+    def _scale_pool(self, runnables: List[Runnable], runnable_class: Type[Runnable], count: int) -> None:
+        event_loop = asyncio.get_event_loop()
+        while len(runnables) < count:
+            runnable = runnable_class(self)
+            runnables.append(runnable)
+            self.sub_tasks.append(event_loop.create_task(runnable.run()))
+        while len(runnables) > count:
+            # The most recently started worker is stopped, once it has finished or reverted its current item
+            runnables.pop().stop()
+        # Forget tasks of workers which have already stopped, so that they do not build up while scaling
+        self.sub_tasks = [task for task in self.sub_tasks if not task.done()]
+
+    def _update_expected_task_gauges(self) -> None:
+        gauge_expected_data_fetcher_count.set(self.config.num_data_fetchers)
+        gauge_expected_media_downloader_count.set(self.config.num_media_downloaders)
+        gauge_expected_media_uploader_count.set(self.config.num_media_uploaders)
+        gauge_expected_task_count.set(
+            2 + self.config.total_num_task_runners() + (1 if self.config.autoscale_workers else 0)
+        )
 
     def stop_tasks(self) -> None:
         # Ask runnables to stop
         logger.info("Shutting down subscription watcher")
+        if self.autoscaler:
+            logger.debug("Stopping worker autoscaler")
+            self.autoscaler.stop()
         if self.sub_id_gatherer:
             logger.debug("Stopping Sub ID gatherer")
             self.sub_id_gatherer.stop()
@@ -251,6 +349,11 @@ class SubscriptionWatcher:
         self.data_fetchers.clear()
         self.media_downloaders.clear()
         self.media_uploaders.clear()
+        # Keep the runtime statistics of query predicates, so that queries can be ordered well after restarting
+        event_loop.run_until_complete(self.collect_predicate_stats())
+        predicate_stats.save_to_file(self.PREDICATE_STATS_FILENAME)
+        # Stop the subscription matcher processes
+        self.matcher_pool.stop()
         logger.info("Subscription watcher shutdown complete")
 
     def update_latest_observed(self, post_datetime: datetime.datetime) -> None:
@@ -263,20 +366,32 @@ class SubscriptionWatcher:
         await self.save_to_json()
 
     async def add_subscription(self, subscription: Subscription) -> None:
-        self.subscriptions.add(subscription)
+        self._add_subscription(subscription)
         await self.save_to_json()
 
     async def remove_subscription(self, subscription: Subscription) -> None:
-        self.subscriptions.remove(subscription)
+        self._remove_subscription(subscription)
         await self.save_to_json()
 
+    def _add_subscription(self, subscription: Subscription) -> None:
+        if subscription in self.subscriptions:
+            return
+        self.subscriptions.add(subscription)
+        self.matcher.add_subscription(subscription)
+        self.matcher_pool.add_subscription(subscription)
+
+    def _remove_subscription(self, subscription: Subscription) -> None:
+        self.subscriptions.remove(subscription)
+        self.matcher.remove_subscription(subscription)
+        self.matcher_pool.remove_subscription(subscription)
+
     async def pause_subscription(self, subscription: Subscription) -> None:
         if subscription not in self.subscriptions:
             raise KeyError
         matching = [sub for sub in self.subscriptions if sub == subscription][0]
         if matching.paused:
             raise SubscriptionAlreadyPaused()
-        matching.paused = True
+        self._set_paused(matching, True)
         await self.save_to_json()
         return
 
@@ -286,10 +401,15 @@ class SubscriptionWatcher:
         matching = [sub for sub in self.subscriptions if sub == subscription][0]
         if not matching.paused:
             raise SubscriptionAlreadyRunning()
-        matching.paused = False
+        self._set_paused(matching, False)
         await self.save_to_json()
         return
 
+    def _set_paused(self, subscription: Subscription, paused: bool) -> None:
+        subscription.paused = paused
+        self.matcher.set_paused(subscription)
+        self.matcher_pool.set_paused(subscription)
+
     async def pause_destination(self, destination: int) -> None:
         subs = [sub for sub in self.subscriptions if sub.destination == destination]
         if not subs:
@@ -298,7 +418,7 @@ class SubscriptionWatcher:
         if not running_subs:
             raise SubscriptionAlreadyPaused()
         for sub in running_subs:
-            await self.pause_subscription(sub)
+            self._set_paused(sub, True)
         await self.save_to_json()
 
     async def resume_destination(self, destination: int) -> None:
@@ -309,79 +429,154 @@ class SubscriptionWatcher:
         if not running_subs:
             raise SubscriptionAlreadyRunning()
         for sub in running_subs:
-            await self.resume_subscription(sub)
+            self._set_paused(sub, False)
         await self.save_to_json()
 
+    async def pause_unreachable_destination(self, destination: int) -> None:
+        """
+        Pauses every running subscription of a destination which has blocked or deleted the bot
+        """
+        running_subs = [sub for sub in self.subscriptions if sub.destination == destination and not sub.paused]
+        for sub in running_subs:
+            self._set_paused(sub, True)
+        if running_subs:
+            await self.save_to_json()
+
     async def add_to_blocklist(self, destination: int, block_query: str) -> None:
-        # Add to blocklists
+        self._add_to_blocklist(destination, block_query)
+        await self.save_to_json()
+
+    async def remove_from_blocklist(self, destination: int, block_query: str) -> None:
+        self._remove_from_blocklist(destination, block_query)
+        await self.save_to_json()
+
+    def _add_to_blocklist(self, destination: int, block_query: str) -> None:
         if destination in self.blocklists:
+            if block_query in self.blocklists[destination].blocklists:
+                self.matcher.remove_block_query(destination, self.blocklists[destination].blocklists[block_query])
             # This will parse it too, hence validating it
             self.blocklists[destination].add(block_query)
         else:
             self.blocklists[destination] = DestinationBlocklist.from_query(destination, block_query)
-        # Save the json
-        await self.save_to_json()
+        self.matcher.add_block_query(destination, self.blocklists[destination].blocklists[block_query])
+        self.matcher_pool.add_block(destination, block_query)
 
-    async def remove_from_blocklist(self, destination: int, block_query: str) -> None:
-        # Remove query from blocklist
+    def _remove_from_blocklist(self, destination: int, block_query: str) -> None:
+        self.matcher.remove_block_query(destination, self.blocklists[destination].blocklists[block_query])
         self.blocklists[destination].remove(block_query)
-        # Save the json
-        await self.save_to_json()
-
-    @staticmethod
-    def _check_subscriptions_static(
-            subscriptions: set[Subscription],
-            blocklists: dict[int, DestinationBlocklist],
-            full_result: QueryTarget,
-    ) -> list[Subscription]:
-        # Copy subscriptions, to avoid "changed size during iteration" issues
-        subscriptions = subscriptions.copy()
-        # Check which subscriptions match
-        matching_subscriptions = []
-        for subscription in subscriptions:
-            blocklist = blocklists.get(subscription.destination)
-            blocklist_query: Optional[Query] = None
-            if blocklist is not None:
-                blocklist_query = blocklist.as_combined_query()
-            if subscription.matches_result(full_result, blocklist_query):
-                matching_subscriptions.append(subscription)
-        return matching_subscriptions
+        self.matcher_pool.remove_block(destination, block_query)
 
     async def check_subscriptions(
             self,
             query_target: QueryTarget,
             subscriptions: Optional[list[Subscription]] = None,
     ) -> list[Subscription]:
-        if subscriptions is None:
-            subscriptions = self.subscriptions
-        else:
-            subscriptions = list(set(subscriptions).intersection(self.subscriptions))
-        return self._check_subscriptions_static(subscriptions, self.blocklists, query_target)
-        # loop = asyncio.get_running_loop()
-        # return await loop.run_in_executor(
-        #     self.checker_executor,
-        #     self._check_subscriptions_static,
-        #     self.subscriptions,
-        #     self.blocklists,
-        #     query_target,
-        # )
+        subscription_set = None
+        if subscriptions is not None:
+            subscription_set = set(subscriptions).intersection(self.subscriptions)
+        if self.matcher_pool.available():
+            try:
+                return await self.matcher_pool.match(query_target, subscription_set)
+            except MatcherPoolError as e:
+                logger.warning("Subscription matcher pool failed, matching on event loop instead", exc_info=e)
+        return self.matcher.match(query_target, subscription_set)
+
+    async def recheck_subscriptions(
+            self,
+            full_data: FASubmissionFull,
+            subscriptions: list[Subscription],
+            matched_generation: Optional[int],
+    ) -> list[Subscription]:
+        """
+        Checks which of the subscriptions that matched a submission still match it. Only the subscriptions which have
+        changed since the generation they were matched at, or whose destination's blocklist has, are evaluated again.
+        """
+        if matched_generation is None:
+            rechecked_subscriptions.inc(len(subscriptions))
+            return await self.check_subscriptions(full_data.to_query_target(), subscriptions)
+        unchanged = []
+        changed = []
+        for subscription in subscriptions:
+            if self.matcher.changed_since(subscription, matched_generation):
+                changed.append(subscription)
+            else:
+                unchanged.append(subscription)
+        skipped_rechecks.inc(len(unchanged))
+        if not changed:
+            return unchanged
+        rechecked_subscriptions.inc(len(changed))
+        return unchanged + await self.check_subscriptions(full_data.to_query_target(), changed)
+
+    async def check_subscriptions_batch(self, query_targets: list[QueryTarget]) -> list[list[Subscription]]:
+        """
+        Checks a batch of submissions against all subscriptions at once, returning the matching subscriptions for each
+        """
+        if not query_targets:
+            return []
+        if self.matcher_pool.available():
+            try:
+                return await self.matcher_pool.match_batch(query_targets)
+            except MatcherPoolError as e:
+                logger.warning("Subscription matcher pool failed, matching on event loop instead", exc_info=e)
+        return self.matcher.match_batch(query_targets)
+
+    def match_profiling_enabled(self) -> bool:
+        return match_profiler.enabled
+
+    def set_match_profiling(self, enabled: bool) -> None:
+        match_profiler.set_enabled(enabled)
+        self.matcher_pool.set_profiling(enabled)
+
+    def reset_match_profile(self) -> None:
+        match_profiler.reset()
+        self.matcher_pool.reset_profile()
+
+    async def collect_match_profile(self) -> None:
+        """
+        Merges the match profiles gathered by the matcher processes into the one held by this process
+        """
+        self.match_profile_collected = time.monotonic()
+        try:
+            profiles = await self.matcher_pool.take_profiles()
+        except MatcherPoolError as e:
+            logger.warning("Could not collect match profiles from subscription matcher pool", exc_info=e)
+            return
+        for profile in profiles:
+            match_profiler.merge_json(profile)
+
+    async def collect_predicate_stats(self) -> None:
+        """
+        Merges the predicate statistics recorded by the matcher processes into those held by this process
+        """
+        try:
+            worker_stats = await self.matcher_pool.take_predicate_stats()
+        except MatcherPoolError as e:
+            logger.warning("Could not collect predicate statistics from subscription matcher pool", exc_info=e)
+            return
+        for stats in worker_stats:
+            predicate_stats.merge_json(stats)
+
+    async def slowest_queries(self, count: int) -> Tuple[List[ProfileRow], List[ProfileRow]]:
+        """
+        Returns the most expensive subscription queries and blocklists, by cumulative evaluation time
+        """
+        await self.collect_match_profile()
+        return match_profiler.top(KIND_QUERY, count), match_profiler.top(KIND_BLOCKLIST, count)
 
     async def migrate_chat(self, old_chat_id: int, new_chat_id: int) -> None:
         # Migrate blocklist
         if old_chat_id in self.blocklists:
-            for query in self.blocklists[old_chat_id].blocklists.keys():
-                await self.add_to_blocklist(new_chat_id, query)
+            for block_query in list(self.blocklists[old_chat_id].blocklists.keys()):
+                self._add_to_blocklist(new_chat_id, block_query)
+                self._remove_from_blocklist(old_chat_id, block_query)
+            del self.blocklists[old_chat_id]
         # Migrate subscriptions
         for subscription in self.subscriptions.copy():
             if subscription.destination == old_chat_id:
                 # Remove and re-add subscription, as chat id will change the hash
-                self.subscriptions.remove(subscription)
+                self._remove_subscription(subscription)
                 subscription.destination = new_chat_id
-                self.subscriptions.add(subscription)
-        # Remove old blocklist
-        if old_chat_id in self.blocklists:
-            for block_query in self.blocklists[old_chat_id].blocklists.keys():
-                await self.remove_from_blocklist(old_chat_id, block_query)
+                self._add_subscription(subscription)
         # Save
         await self.save_to_json()
 
@@ -399,6 +594,15 @@ class SubscriptionWatcher:
             json_data = json.dumps(data, indent=2)
             await f.write(json_data)
         await aiofiles.os.replace(self.FILENAME_TEMP, self.FILENAME)
+        if predicate_stats.save_due():
+            await self.collect_predicate_stats()
+            predicate_stats.save_to_file(self.PREDICATE_STATS_FILENAME)
+        # Profiles are regularly gathered from the matcher processes, so that the metrics stay up to date
+        if match_profiler.enabled and self.matcher_pool.running and self._match_profile_collect_due():
+            await self.collect_match_profile()
+
+    def _match_profile_collect_due(self) -> bool:
+        return time.monotonic() - self.match_profile_collected >= self.MATCH_PROFILE_COLLECT_INTERVAL
 
     @classmethod
     def load_from_json(
@@ -409,6 +613,8 @@ class SubscriptionWatcher:
         submission_cache: SubmissionCache,
     ) -> "SubscriptionWatcher":
         logger.debug("Loading subscription config from file")
+        # Predicate statistics are loaded first, so that subscription queries are compiled using them
+        predicate_stats.load_from_file(cls.PREDICATE_STATS_FILENAME)
         try:
             # This can be sync, because it's only used in the SubscriptionWatcher __init__() method
             with open(cls.FILENAME, "r") as f:
@@ -443,4 +649,5 @@ class SubscriptionWatcher:
                 new_watcher.blocklists[dest_id] = DestinationBlocklist.from_json(dest_id, value["blocks"])
         logger.debug(f"Loaded {len(subscriptions)} subscriptions")
         new_watcher.subscriptions = subscriptions
+        new_watcher.matcher.rebuild(subscriptions)
         return new_watcher
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import collections
 import dataclasses
+import heapq
+import itertools
 import logging
 from asyncio import Lock, QueueEmpty, Event
-from typing import Optional, Dict, Union
+from typing import Callable, Deque, Optional, Dict, List, Tuple, Union
 
 from telethon.tl.types import TypeInputPeer
 
@@ -23,6 +27,8 @@ class SubmissionCheckState:
     sub_id: SubmissionID
     full_data: Optional[FASubmissionFull] = None
     matching_subscriptions: Optional[list[Subscription]] = None
+    # Generation of the subscription matcher state which the matching subscriptions were found at
+    matched_generation: Optional[int] = None
     media_downloading: bool = False
     dl_file: Optional[tuple[DownloadedFile, SendSettings]] = None
     media_uploading: bool = False
@@ -36,6 +42,7 @@ class SubmissionCheckState:
     def reset(self) -> None:
         self.full_data = None
         self.matching_subscriptions = None
+        self.matched_generation = None
         self.media_downloading = False
         self.dl_file = None
         self.media_uploading = False
@@ -69,6 +76,77 @@ class SubmissionCheckState:
         )
 
 
+class StageQueue:
+    """
+    A min-heap of the submission states which may be ready for one stage of processing, ordered by submission ID. States
+    are pushed whenever a transition might make them ready for the stage, and entries which turn out not to be ready
+    are discarded once they reach the top of the heap, so each handoff costs O(log n).
+    """
+
+    def __init__(self, is_ready: Callable[[SubmissionCheckState], bool]) -> None:
+        self.is_ready = is_ready
+        self._heap: List[Tuple[int, int, SubmissionCheckState]] = []
+        # Breaks ties between entries for the same submission, as states cannot be compared
+        self._counter = itertools.count()
+
+    def push(self, state: SubmissionCheckState) -> None:
+        heapq.heappush(self._heap, (state.key(), next(self._counter), state))
+
+    def peek(self) -> Optional[SubmissionCheckState]:
+        while self._heap:
+            state = self._heap[0][2]
+            if self.is_ready(state):
+                return state
+            heapq.heappop(self._heap)
+        return None
+
+    def pop(self) -> Optional[SubmissionCheckState]:
+        state = self.peek()
+        if state is not None:
+            heapq.heappop(self._heap)
+        return state
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class StageSignal:
+    """
+    Wakes the workers which are waiting for an item to become ready at one stage. Each notification wakes exactly one
+    waiting worker. If no worker is waiting, the next one to wait returns straight away, so that an item which became
+    ready while a worker was checking the queue is not missed.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: Deque[asyncio.Future[None]] = collections.deque()
+        self._notified = False
+
+    def notify(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            # Waiters which have timed out, been stopped, or been cancelled are skipped
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._notified = True
+
+    def add_waiter(self, waiter: asyncio.Future[None]) -> None:
+        if self._notified:
+            self._notified = False
+            waiter.set_result(None)
+            return
+        self._waiters.append(waiter)
+
+    def remove_waiter(self, waiter: asyncio.Future[None]) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def count_waiters(self) -> int:
+        return len([waiter for waiter in self._waiters if not waiter.done()])
+
+
 class WaitPool:
     """
     WaitPool governs the overall progress of the subscription watcher. New IDs are added here, and then populated by the
@@ -81,6 +159,20 @@ class WaitPool:
         self.submission_state: Dict[SubmissionID, SubmissionCheckState] = {}
         self.active_states: Dict[SubmissionID, SubmissionCheckState] = {}
         self.fetch_data_queue: FetchQueue = FetchQueue(fetch_refresh_limit)
+        # Each stage takes the lowest submission ID which is ready for it
+        self._download_queue = StageQueue(
+            lambda state: self.active_states.get(state.sub_id) is state and state.is_ready_for_media_download()
+        )
+        self._upload_queue = StageQueue(
+            lambda state: self.active_states.get(state.sub_id) is state and state.is_ready_for_media_upload()
+        )
+        # The sender has to wait for the lowest submission ID in the pool, whether it is ready or not
+        self._send_queue = StageQueue(lambda state: self.submission_state.get(state.sub_id) is state)
+        # Workers wait on these signals while their stage has nothing ready
+        self.fetch_signal = StageSignal()
+        self.download_signal = StageSignal()
+        self.upload_signal = StageSignal()
+        self.send_signal = StageSignal()
         self._lock = Lock()
         self._media_uploading_event = Event()
         self._cache_qsize_download: Optional[int] = None
@@ -91,7 +183,9 @@ class WaitPool:
         async with self._lock:
             state = SubmissionCheckState(sub_id)
             self.submission_state[sub_id] = state
+            self._send_queue.push(state)
             await self.fetch_data_queue.put_new(sub_id)
+            self.fetch_signal.notify()
 
     async def get_next_for_data_fetch(self) -> SubmissionID:
         return self.fetch_data_queue.get_nowait()
@@ -101,6 +195,7 @@ class WaitPool:
             sub_id: SubmissionID,
             full_data: FASubmissionFull,
             matching_subscriptions: list[Subscription],
+            matched_generation: Optional[int] = None,
     ) -> None:
         # Provide backpressure on data fetcher, to avoid it running ahead of downstream processing
         # But only if that submission is not being actively handled somewhere
@@ -113,8 +208,13 @@ class WaitPool:
                 return
             self.submission_state[sub_id].full_data = full_data
             self.submission_state[sub_id].matching_subscriptions = matching_subscriptions
+            self.submission_state[sub_id].matched_generation = matched_generation
             # When data is fetched, copy to active states
             self.active_states[sub_id] = self.submission_state[sub_id]
+            self._download_queue.push(self.submission_state[sub_id])
+            # A refreshed submission may already have its media downloaded
+            self._upload_queue.push(self.submission_state[sub_id])
+            self.download_signal.notify()
 
     async def revert_data_fetch(self, sub_id: SubmissionID) -> None:
         # This reverts a submission back to before any data was fetched about it, and re-queues it for data fetch
@@ -123,20 +223,21 @@ class WaitPool:
                 new_sub_id = SubmissionCheckState(sub_id)
                 self.submission_state[sub_id] = new_sub_id
                 self.active_states[sub_id] = new_sub_id
+                self._send_queue.push(new_sub_id)
             self.submission_state[sub_id].reset()
             # Don't remove from active states, that would risk a deadlock
             # Re-queue for data fetch refresh
             await self.fetch_data_queue.put_refresh(sub_id)
+            self.fetch_signal.notify()
 
     def states_ready_for_media_download(self) -> list[SubmissionCheckState]:
         return [s for s in self.active_states.values() if s.is_ready_for_media_download()]
 
     async def get_next_for_media_download(self) -> FASubmissionFull:
         async with self._lock:
-            submission_states = self.states_ready_for_media_download()
-            if not submission_states:
+            next_state = self._download_queue.pop()
+            if next_state is None:
                 raise QueueEmpty()
-            next_state = min(submission_states, key=lambda state: state.key())
             next_state.media_downloading = True
             self._media_uploading_event.set()
             self._media_uploading_event.clear()
@@ -148,16 +249,17 @@ class WaitPool:
                 return
             self.submission_state[sub_id].dl_file = downloaded
             self.submission_state[sub_id].media_downloading = False
+            self._upload_queue.push(self.submission_state[sub_id])
+            self.upload_signal.notify()
 
     def states_ready_for_media_upload(self) -> list[SubmissionCheckState]:
         return [s for s in self.active_states.values() if s.is_ready_for_media_upload()]
 
     async def get_next_for_media_upload(self) -> SubmissionCheckState:
         async with self._lock:
-            submission_states = self.states_ready_for_media_upload()
-            if not submission_states:
+            next_state = self._upload_queue.pop()
+            if next_state is None:
                 raise QueueEmpty()
-            next_state = min(submission_states, key=lambda state: state.key())
             next_state.media_uploading = True
             self._media_uploading_event.set()
             self._media_uploading_event.clear()
@@ -171,6 +273,7 @@ class WaitPool:
                 return
             self.submission_state[sub_id].cache_entry = cache_entry
             self.submission_state[sub_id].media_uploading = False
+            self.send_signal.notify()
 
     async def set_uploaded(self, sub_id: SubmissionID, uploaded: UploadedMedia) -> None:
         async with self._lock:
@@ -178,22 +281,24 @@ class WaitPool:
                 return
             self.submission_state[sub_id].uploaded_media = uploaded
             self.submission_state[sub_id].media_uploading = False
+            self.send_signal.notify()
 
     async def remove_state(self, sub_id: SubmissionID) -> None:
         async with self._lock:
             if sub_id not in self.submission_state:
                 raise ValueError("This state cannot be removed because it is not in the wait pool")
             del self.submission_state[sub_id]
+            # The next submission in the pool may be ready to send, now that this one is gone
+            self.send_signal.notify()
 
     def states_ready_to_send(self) -> list[SubmissionCheckState]:
         return [s for s in self.active_states.values() if s.is_ready_to_send()]
 
     async def pop_next_ready_to_send(self) -> Optional[SubmissionCheckState]:
         async with self._lock:
-            submission_states = self.submission_state.values()
-            if not submission_states:
+            next_state = self._send_queue.peek()
+            if next_state is None:
                 return None
-            next_state = min(submission_states, key=lambda state: state.key())
             if not next_state.is_ready_to_send():
                 if self.size() > self.max_ready_for_upload:
                     logger.debug(
@@ -201,6 +306,7 @@ class WaitPool:
                         next_state.sub_id
                     )
                 return None
+            self._send_queue.pop()
             del self.submission_state[next_state.sub_id]
             del self.active_states[next_state.sub_id]
             self._media_uploading_event.set()
@@ -210,8 +316,14 @@ class WaitPool:
     async def return_populated_state(self, state: SubmissionCheckState) -> None:
         async with self._lock:
             self.submission_state[state.sub_id] = state
+            self._send_queue.push(state)
             if state.full_data is not None:
                 self.active_states[state.sub_id] = state
+                self._download_queue.push(state)
+                self._upload_queue.push(state)
+                self.download_signal.notify()
+                self.upload_signal.notify()
+            self.send_signal.notify()
 
     def size(self) -> int:
         return len(self.submission_state)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+from fa_search_bot.subscriptions.query_target import case_folds_simply, punctuation
+
+if TYPE_CHECKING:
+    from typing import Iterable, Optional
+
+_separator_chars = frozenset(punctuation)
+
+
+class WildcardPattern:
+    """
+    A word pattern containing asterisks, where each asterisk stands for one or more characters. Words are matched by
+    greedily finding each literal segment in turn, which takes linear time in the length of the word, whereas the
+    equivalent regex can backtrack badly on long words with patterns like "*a*b*c*".
+    """
+
+    def __init__(self, parts: list[str]) -> None:
+        if len(parts) < 2:
+            raise ValueError("Wildcard pattern needs at least one asterisk")
+        self.head = parts[0]
+        self.tail = parts[-1]
+        self.middle = parts[1:-1]
+        # Every segment must be present, with at least one character for each asterisk
+        self.min_length = sum(len(part) for part in parts) + len(parts) - 1
+
+    @classmethod
+    def from_string(cls, word: str) -> Optional[WildcardPattern]:
+        """
+        Creates a wildcard pattern from a query word, or returns None if the word contains characters which need the
+        regex to match them correctly: whitespace or punctuation, which would let a match span several words, or
+        characters which do not case-fold simply.
+        """
+        if not case_folds_simply(word):
+            return None
+        if any(char.isspace() or (char in _separator_chars and char != "*") for char in word):
+            return None
+        return cls(re.split(r"\*+", word.lower()))
+
+    def matches(self, word: str) -> bool:
+        """
+        Whether the whole of the (lowercase) word matches the pattern
+        """
+        word_len = len(word)
+        if word_len < self.min_length:
+            return False
+        if not word.startswith(self.head) or not word.endswith(self.tail):
+            return False
+        position = len(self.head)
+        # The last asterisk needs at least one character before the tail
+        end = word_len - len(self.tail) - 1
+        for part in self.middle:
+            # Each asterisk needs at least one character before the next segment, and taking the earliest match for
+            # each segment leaves the most room for the rest
+            index = word.find(part, position + 1, end)
+            if index == -1:
+                return False
+            position = index + len(part)
+        return position <= end
+
+    def matches_any(self, words: Iterable[str]) -> bool:
+        return any(self.matches(word) for word in words)
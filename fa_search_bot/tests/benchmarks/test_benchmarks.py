@@ -0,0 +1,62 @@
+from fa_search_bot.benchmarks.corpus import SOURCE_GENERATED, generate_corpus, load_corpus, save_corpus
+from fa_search_bot.benchmarks.generator import SubmissionGenerator, SubscriptionGenerator
+from fa_search_bot.benchmarks.memory import run_memory_benchmark
+from fa_search_bot.benchmarks.runner import MODES, compare_results, run_benchmark
+
+
+def test_subscription_generator__deterministic():
+    first = SubscriptionGenerator(seed=3).generate(200)
+    second = SubscriptionGenerator(seed=3).generate(200)
+
+    assert [sub.query_str for sub in first.subscriptions] == [sub.query_str for sub in second.subscriptions]
+    assert len(set(first.subscriptions)) == 200
+    assert first.count_blocks() == second.count_blocks()
+
+
+def test_subscription_generator__mix_of_queries():
+    query_strs = [sub.query_str for sub in SubscriptionGenerator().generate(1000).subscriptions]
+
+    assert any(query.startswith("artist:") for query in query_strs)
+    assert any('"' in query for query in query_strs)
+    assert any("*" in query for query in query_strs)
+    assert any(" -" in query for query in query_strs)
+    assert any("rating:" in query for query in query_strs)
+    assert any(" except " in query for query in query_strs)
+
+
+def test_corpus__save_and_load(tmp_path):
+    path = tmp_path / "corpus.json"
+    targets = generate_corpus(10, seed=2)
+
+    save_corpus(targets, SOURCE_GENERATED, path)
+    loaded = load_corpus(path)
+
+    assert [target.to_json() for target in loaded] == [target.to_json() for target in targets]
+
+
+def test_checked_in_corpus_loads():
+    assert len(load_corpus()) > 0
+
+
+def test_run_benchmark():
+    subscription_set = SubscriptionGenerator().generate(100)
+    targets = SubmissionGenerator().generate(20)
+
+    result = run_benchmark("test", subscription_set, targets, MODES, batch_size=5, repeat=1)
+
+    assert [mode.mode for mode in result.modes] == MODES
+    assert all(mode.submissions == 20 for mode in result.modes)
+    assert len({mode.matches for mode in result.modes}) == 1
+    assert result.peak_memory_bytes > 0
+    assert len(compare_results({"results": [result.to_json()]}, {"results": [result.to_json()]})) == len(MODES)
+
+
+def test_run_memory_benchmark():
+    subscription_set = SubscriptionGenerator(seed=1).generate(100)
+
+    result = run_memory_benchmark("test", subscription_set, submissions=50, interval=20, batch_size=7)
+
+    assert [sample.submissions for sample in result.samples] == [21, 42, 50]
+    # Checked submissions should not be kept alive once their batch is matched
+    assert all(sample.live_targets == 0 for sample in result.samples)
+    assert result.to_json()["samples"][0]["rss_bytes"] > 0
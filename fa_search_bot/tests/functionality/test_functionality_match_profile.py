@@ -0,0 +1,82 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telethon.events import StopPropagation
+
+from fa_search_bot.functionalities.match_profile import MatchProfileFunctionality
+from fa_search_bot.subscriptions.match_profiler import KIND_BLOCKLIST, KIND_QUERY, ProfileRow
+from fa_search_bot.tests.util.mock_telegram_event import MockTelegramEvent
+
+ADMIN_ID = 1234
+
+
+def _mock_watcher() -> MagicMock:
+    watcher = MagicMock()
+    watcher.slowest_queries = AsyncMock(return_value=([], []))
+    watcher.match_profiling_enabled.return_value = True
+    watcher.matcher.groups = {}
+    watcher.blocklists = {}
+    return watcher
+
+
+def _event(text: str, sender_id: int = ADMIN_ID) -> MockTelegramEvent:
+    event = MockTelegramEvent.with_message(chat_id=ADMIN_ID, text=text)
+    event.sender_id = sender_id
+    return event
+
+
+@pytest.mark.asyncio
+async def test_call__ignores_non_admins():
+    watcher = _mock_watcher()
+    func = MatchProfileFunctionality(watcher, [ADMIN_ID])
+    event = _event("/match_profile on", sender_id=5678)
+
+    await func.call(event)
+
+    event.reply.assert_not_called()
+    watcher.set_match_profiling.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_call__enable_and_disable():
+    watcher = _mock_watcher()
+    func = MatchProfileFunctionality(watcher, [ADMIN_ID])
+
+    with pytest.raises(StopPropagation):
+        await func.call(_event("/match_profile on"))
+    watcher.set_match_profiling.assert_called_with(True)
+    with pytest.raises(StopPropagation):
+        await func.call(_event("/match_profile off"))
+    watcher.set_match_profiling.assert_called_with(False)
+
+
+@pytest.mark.asyncio
+async def test_call__report():
+    watcher = _mock_watcher()
+    watcher.slowest_queries.return_value = (
+        [ProfileRow(KIND_QUERY, "dragon <b>", 20, 4_000_000)],
+        [ProfileRow(KIND_BLOCKLIST, "-100123", 10, 1_000_000)],
+    )
+    func = MatchProfileFunctionality(watcher, [ADMIN_ID])
+    event = _event("/match_profile 5")
+
+    with pytest.raises(StopPropagation):
+        await func.call(event)
+
+    watcher.slowest_queries.assert_called_with(5)
+    reply = event.reply.call_args[0][0]
+    assert "1. <code>dragon &lt;b&gt;</code> (0 subscriptions) 4.0ms total, 200.0µs mean over 20 calls" in reply
+    assert "1. Chat -100123 (0 blocks) 1.0ms total" in reply
+
+
+@pytest.mark.asyncio
+async def test_call__report_empty():
+    watcher = _mock_watcher()
+    func = MatchProfileFunctionality(watcher, [ADMIN_ID])
+    event = _event("/match_profile")
+
+    with pytest.raises(StopPropagation):
+        await func.call(event)
+
+    watcher.slowest_queries.assert_called_with(MatchProfileFunctionality.DEFAULT_COUNT)
+    assert "No submissions have been profiled yet." in event.reply.call_args[0][0]
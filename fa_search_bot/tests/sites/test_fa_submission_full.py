@@ -71,3 +71,29 @@ def test_download_file_ext():
     ext = submission.download_file_ext
 
     assert ext == "jpeg"
+
+
+def test_to_query_target():
+    submission = SubmissionBuilder(
+        title="Red dragon", description="A picture of a dragon!", keywords=["Dragon", "red"], rating=Rating.MATURE
+    ).build_full_submission()
+
+    target = submission.to_query_target()
+
+    assert target.title.words() == ["red", "dragon"]
+    assert target.description.words() == ["a", "picture", "of", "a", "dragon"]
+    assert target.keywords.words() == ["dragon", "red"]
+    assert target.artist.words() == [submission.author.name.lower(), submission.author.profile_name.lower()]
+    assert target.rating == Rating.MATURE
+
+
+def test_to_query_target__tokenised_once():
+    submission = SubmissionBuilder(title="Red dragon", description="A picture of a dragon").build_full_submission()
+
+    first = submission.to_query_target()
+    first_tokens = first.any_field.tokens()
+    second = submission.to_query_target()
+
+    assert second is not first
+    assert second.description.text_tokens() is first.description.text_tokens()
+    assert second.any_field.tokens() is first_tokens
@@ -0,0 +1,76 @@
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.affix_scanner import AffixScanner
+from fa_search_bot.subscriptions.query_parser import parse_query
+from fa_search_bot.subscriptions.query_target import AnyField, DescriptionField, QueryTarget, TitleField
+
+
+def _target(title: str = "", description: str = "") -> QueryTarget:
+    return QueryTarget(SubmissionID("fa", "12345"), [title], [description], [], ["artist"], Rating.GENERAL)
+
+
+def test_scan_words__prefixes_and_suffixes():
+    scanner = AffixScanner()
+    scanner.add_query(parse_query("drag* or *olf or wol*"))
+
+    hits = scanner.scan_words(["dragon", "wolf", "fox"])
+
+    assert hits.prefixes == {"drag", "wol"}
+    assert hits.suffixes == {"olf"}
+
+
+def test_scan_words__excludes_whole_word():
+    scanner = AffixScanner()
+    scanner.add_query(parse_query("drag* *drag"))
+
+    hits = scanner.scan_words(["drag"])
+
+    assert hits.prefixes == set()
+    assert hits.suffixes == set()
+
+
+def test_remove_query__reference_counted():
+    scanner = AffixScanner()
+    scanner.add_query(parse_query("drag*"))
+    scanner.add_query(parse_query("drag* wolf"))
+
+    scanner.remove_query(parse_query("drag*"))
+    assert scanner.scan_words(["dragon"]).prefixes == {"drag"}
+    scanner.remove_query(parse_query("drag* wolf"))
+    assert scanner.scan_words(["dragon"]).prefixes == set()
+    assert scanner.count_affixes() == 0
+
+
+def test_attach__per_field_hits():
+    scanner = AffixScanner()
+    scanner.add_query(parse_query("drag*"))
+    target = _target(title="A dragon", description="Nothing here")
+    scanner.attach(target)
+
+    assert target.affix_hits.for_field(TitleField).prefixes == {"drag"}
+    assert target.affix_hits.for_field(DescriptionField).prefixes == set()
+    assert target.affix_hits.for_field(AnyField).prefixes == {"drag"}
+
+
+def test_attach__query_matching_uses_hits():
+    scanner = AffixScanner()
+    query = parse_query("desc:drag* -*olf")
+    scanner.add_query(query)
+    target = _target(title="wolf", description="dragons")
+    scanner.attach(target)
+
+    assert not query.matches_submission(target)
+    assert target.affix_hits.for_field(AnyField).suffixes == {"olf"}
+    assert target.affix_hits.for_field(DescriptionField).prefixes == {"drag"}
+
+
+def test_attach__refreshes_after_change():
+    scanner = AffixScanner()
+    scanner.add_query(parse_query("drag*"))
+    target = _target(title="A wolf and a dragon")
+    scanner.attach(target)
+    assert target.affix_hits.for_field(TitleField).prefixes == {"drag"}
+
+    scanner.add_query(parse_query("wol*"))
+
+    assert target.affix_hits.for_field(TitleField).prefixes == {"drag", "wol"}
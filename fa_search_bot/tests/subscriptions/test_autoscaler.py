@@ -0,0 +1,121 @@
+import asyncio
+from unittest.mock import Mock, patch
+
+import pytest
+
+from fa_search_bot.config import SubscriptionWatcherConfig
+from fa_search_bot.subscriptions.autoscaler import PoolSample, PoolScaler, WorkerAutoscaler
+from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
+from fa_search_bot.tests.util.mock_export_api import MockExportAPI
+
+
+def _scaler(min_workers: int = 1, max_workers: int = 4, uses_upstream: bool = True) -> PoolScaler:
+    return PoolScaler("test", min_workers, max_workers, 60, uses_upstream)
+
+
+def _sample(
+        workers: int,
+        queue_depth: int,
+        busy_seconds: float,
+        items_processed: int,
+        idle_workers: int = 0,
+        elapsed_seconds: float = 30,
+) -> PoolSample:
+    return PoolSample(workers, idle_workers, queue_depth, busy_seconds, items_processed, elapsed_seconds)
+
+
+def test_decide__scales_up_when_queue_too_slow_to_drain():
+    scaler = _scaler()
+    # Workers are fully busy, taking 2 seconds an item, so 100 items would take 100 seconds to drain
+    sample = _sample(2, 100, 60, 30)
+
+    assert scaler.decide(sample, 1000, False) == 3
+    assert scaler.latency == 2
+    # Scaling up again has to wait for the cooldown
+    assert scaler.decide(sample, 1030, False) == 2
+    assert scaler.decide(sample, 1000 + scaler.SCALE_UP_COOLDOWN, False) == 3
+
+
+def test_decide__does_not_scale_up_idle_workers():
+    scaler = _scaler()
+    # A long queue, but the workers are mostly waiting, so more workers would not help
+    sample = _sample(2, 100, 10, 5)
+
+    assert scaler.decide(sample, 1000, False) == 2
+
+
+def test_decide__does_not_scale_past_max():
+    scaler = _scaler(max_workers=2)
+
+    assert scaler.decide(_sample(2, 100, 60, 30), 1000, False) == 2
+
+
+def test_decide__scales_down_idle_pool():
+    scaler = _scaler()
+    sample = _sample(3, 0, 3, 3, idle_workers=2)
+
+    assert scaler.decide(sample, 1000, False) == 2
+    assert scaler.decide(_sample(2, 0, 2, 2, idle_workers=2), 1030, False) == 2
+    assert scaler.decide(_sample(2, 0, 2, 2, idle_workers=2), 1000 + scaler.SCALE_DOWN_COOLDOWN, False) == 1
+    assert scaler.decide(_sample(1, 0, 1, 1, idle_workers=1), 2000, False) == 1
+
+
+def test_decide__applies_bounds_first():
+    scaler = _scaler(min_workers=2, max_workers=3)
+
+    assert scaler.decide(_sample(5, 0, 0, 0, elapsed_seconds=0), 1000, False) == 3
+    assert scaler.decide(_sample(0, 0, 0, 0, elapsed_seconds=0), 1000, False) == 2
+
+
+def test_decide__throttled_holds_upstream_pool():
+    upstream = _scaler(uses_upstream=True)
+    telegram = _scaler(uses_upstream=False)
+    sample = _sample(2, 100, 60, 30)
+
+    assert upstream.decide(sample, 1000, True) == 2
+    assert telegram.decide(sample, 1000, True) == 3
+    # Cooldowns are longer while throttled
+    assert telegram.decide(sample, 1000 + telegram.SCALE_UP_COOLDOWN, True) == 2
+
+
+@pytest.mark.asyncio
+async def test_check_pools__scales_watcher_pools(mock_client):
+    config = SubscriptionWatcherConfig.from_dict(
+        {"autoscale_workers": True, "num_data_fetchers": 2, "max_media_uploaders": 3}
+    )
+    watcher = SubscriptionWatcher(config, MockExportAPI(), mock_client, Mock())
+    watcher.scale_data_fetchers(2)
+    watcher.scale_media_downloaders(1)
+    watcher.scale_media_uploaders(5)
+    # Let the workers start running
+    await asyncio.sleep(0)
+    autoscaler = WorkerAutoscaler(watcher)
+
+    autoscaler.check_pools()
+
+    assert len(watcher.media_uploaders) == 3
+    assert len(watcher.data_fetchers) == 2
+    assert watcher.config.num_media_uploaders == 3
+    with patch("heartbeat.update_heartbeat"):
+        watcher.scale_data_fetchers(0)
+        watcher.scale_media_downloaders(0)
+        watcher.scale_media_uploaders(0)
+        await asyncio.gather(*watcher.sub_tasks)
+
+
+def test_check_throttled():
+    api = MockExportAPI()
+    watcher = Mock()
+    watcher.api = api
+    watcher.config = SubscriptionWatcherConfig.from_dict({})
+    autoscaler = WorkerAutoscaler(watcher)
+
+    api.request_count = 100
+    api.cloudflare_error_count = 1
+    assert not autoscaler.check_throttled(1000)
+    api.request_count = 200
+    api.cloudflare_error_count = 20
+    assert autoscaler.check_throttled(1030)
+    api.request_count = 300
+    assert autoscaler.check_throttled(1060)
+    assert not autoscaler.check_throttled(1030 + autoscaler.THROTTLE_HOLD)
@@ -0,0 +1,64 @@
+import pytest
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.batch_matcher import TargetBatch, compile_batch_query, iter_bits
+from fa_search_bot.subscriptions.query_parser import compile_query, parse_query
+from fa_search_bot.subscriptions.query_target import QueryTarget
+
+
+def _targets() -> list[QueryTarget]:
+    return [
+        QueryTarget(SubmissionID("fa", "1"), ["A red dragon"], [""], ["dragon", "red"], ["artist"], Rating.GENERAL),
+        QueryTarget(SubmissionID("fa", "2"), ["A blue wolf"], ["Wolves, howling"], ["wolf"], ["fender"], Rating.ADULT),
+        QueryTarget(SubmissionID("fa", "3"), ["Dragon ball"], ["A dragon ball fan art"], [], ["artist"], Rating.MATURE),
+        QueryTarget(SubmissionID("fa", "4"), ["Nothing"], ["No words here"], ["misc"], ["someone"], Rating.GENERAL),
+    ]
+
+
+def test_iter_bits():
+    assert list(iter_bits(0b101001)) == [0, 3, 5]
+    assert list(iter_bits(0)) == []
+
+
+def test_target_batch__word_bits():
+    batch = TargetBatch(_targets())
+
+    assert batch.word_bits(parse_query("dragon").field, "dragon") == 0b0101
+    assert batch.rating_bits(Rating.GENERAL) == 0b1001
+
+
+@pytest.mark.parametrize(
+    "query_str",
+    [
+        "dragon",
+        "title:dragon",
+        "dragon -ball",
+        "dragon or wolf",
+        "rating:general and -red",
+        '"dragon ball"',
+        "drag*",
+        "*olf",
+        "d*g*n",
+        '(dragon or wolf) and -artist:fender',
+        'dragon except "dragon ball"',
+        "-rating:adult -dragon",
+    ],
+)
+def test_compile_batch_query__matches_compiled_query(query_str: str):
+    query = parse_query(query_str)
+    targets = _targets()
+    batch = TargetBatch(targets)
+    matcher = compile_query(query)
+
+    bits = compile_batch_query(query)(batch, batch.all_bits)
+
+    assert [bool(bits & (1 << index)) for index in range(len(targets))] == [matcher(t) for t in targets]
+
+
+def test_compile_batch_query__only_checks_mask():
+    batch = TargetBatch(_targets())
+
+    bits = compile_batch_query(parse_query("dragon"))(batch, 0b0011)
+
+    assert bits == 0b0001
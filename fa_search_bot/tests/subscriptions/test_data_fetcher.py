@@ -0,0 +1,53 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from fa_search_bot.subscriptions.data_fetcher import MatchBatcher
+
+
+@pytest.mark.asyncio
+async def test_match_batcher__batches_targets_fetched_while_matching():
+    batches = []
+    release = asyncio.Event()
+
+    async def check_subscriptions_batch(targets):
+        batches.append(targets)
+        await release.wait()
+        return [[f"sub_{target}"] for target in targets]
+
+    watcher = Mock()
+    watcher.matcher.generation = 3
+    watcher.check_subscriptions_batch = check_subscriptions_batch
+    batcher = MatchBatcher(watcher, 10)
+
+    first = asyncio.create_task(batcher.match("a"))
+    await asyncio.sleep(0)
+    # The first target is matched straight away, without waiting for any others
+    assert batches == [["a"]]
+    later = [asyncio.create_task(batcher.match(target)) for target in ["b", "c"]]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first == (["sub_a"], 3)
+    assert await asyncio.gather(*later) == [(["sub_b"], 3), (["sub_c"], 3)]
+    assert batches == [["a"], ["b", "c"]]
+    assert batcher.waiting == []
+
+
+@pytest.mark.asyncio
+async def test_match_batcher__limits_batch_size():
+    batches = []
+
+    async def check_subscriptions_batch(targets):
+        batches.append(targets)
+        await asyncio.sleep(0)
+        return [[] for _ in targets]
+
+    watcher = Mock()
+    watcher.check_subscriptions_batch = check_subscriptions_batch
+    batcher = MatchBatcher(watcher, 2)
+
+    await asyncio.gather(*[batcher.match(target) for target in ["a", "b", "c", "d"]])
+
+    assert batches == [["a"], ["b", "c"], ["d"]]
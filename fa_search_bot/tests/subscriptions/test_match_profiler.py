@@ -0,0 +1,113 @@
+import pytest
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.match_profiler import KIND_BLOCKLIST, KIND_QUERY, MatchProfiler, match_profiler
+from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+from fa_search_bot.subscriptions.subscription_matcher import SubscriptionMatcher
+
+
+def _target(title: str, description: str = "") -> QueryTarget:
+    return QueryTarget(SubmissionID("fa", "12345"), [title], [description], [], ["artist"], Rating.GENERAL)
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    monkeypatch.setattr(match_profiler, "entries", {KIND_QUERY: {}, KIND_BLOCKLIST: {}})
+    monkeypatch.setattr(match_profiler, "SAMPLE_INTERVAL", 1)
+    match_profiler.set_enabled(True)
+    yield match_profiler
+    match_profiler.set_enabled(False)
+
+
+def test_take_sample__disabled():
+    profiler = MatchProfiler()
+
+    assert not any(profiler.take_sample() for _ in range(profiler.SAMPLE_INTERVAL * 2))
+
+
+def test_take_sample__enabled():
+    profiler = MatchProfiler()
+    profiler.set_enabled(True)
+
+    assert [profiler.take_sample() for _ in range(profiler.SAMPLE_INTERVAL * 2)].count(True) == 2
+
+
+def test_top__most_expensive_first():
+    profiler = MatchProfiler()
+    profiler.record(KIND_QUERY, "cheap", 10)
+    profiler.record(KIND_QUERY, "cheap", 10)
+    profiler.record(KIND_QUERY, "expensive", 500)
+    profiler.record(KIND_QUERY, "middle", 100)
+
+    top = profiler.top(KIND_QUERY, 2)
+
+    assert [row.key for row in top] == ["expensive", "middle"]
+    assert profiler.top(KIND_QUERY, 5)[-1].calls == 2
+    assert profiler.top_cost_seconds(KIND_QUERY, 1) == 500 / 1e9
+    assert profiler.top_cost_seconds(KIND_QUERY, 4) == 0
+
+
+def test_top_cost_seconds__updated_after_changes():
+    profiler = MatchProfiler()
+    profiler.record(KIND_QUERY, "dragon", 100)
+    assert profiler.top_cost_seconds(KIND_QUERY, 1) == 100 / 1e9
+
+    profiler.record(KIND_QUERY, "wolf", 300)
+    assert profiler.top_cost_seconds(KIND_QUERY, 1) == 300 / 1e9
+    profiler.merge_json({KIND_QUERY: {"fox": [1, 500]}})
+    assert profiler.top_cost_seconds(KIND_QUERY, 1) == 500 / 1e9
+    profiler.reset()
+    assert profiler.top_cost_seconds(KIND_QUERY, 1) == 0
+
+
+def test_take_and_merge_json():
+    worker = MatchProfiler()
+    worker.record(KIND_QUERY, "dragon", 100)
+    worker.record(KIND_BLOCKLIST, "-100", 50)
+    main = MatchProfiler()
+    main.record(KIND_QUERY, "dragon", 20)
+
+    main.merge_json(worker.take_json())
+
+    assert worker.to_json() == {KIND_QUERY: {}, KIND_BLOCKLIST: {}}
+    assert main.to_json() == {KIND_QUERY: {"dragon": [2, 120]}, KIND_BLOCKLIST: {"-100": [1, 50]}}
+
+
+def test_match__records_queries_and_blocklists(profiler):
+    blocklists = {12345: DestinationBlocklist.from_query(12345, "wolf")}
+    matcher = SubscriptionMatcher(blocklists)
+    subscriptions = [Subscription("dragon*", 12345), Subscription('"blue dragon"', 54321)]
+    matcher.rebuild(subscriptions)
+
+    assert set(matcher.match(_target("blue dragon", "dragons"))) == set(subscriptions)
+
+    assert profiler.entries[KIND_QUERY]["dragon*"].calls == 1
+    assert profiler.entries[KIND_QUERY]['"blue dragon"'].calls == 1
+    assert list(profiler.entries[KIND_BLOCKLIST].keys()) == ["12345"]
+
+
+def test_match_batch__records_queries_and_blocklists(profiler):
+    blocklists = {12345: DestinationBlocklist.from_query(12345, "wolf")}
+    matcher = SubscriptionMatcher(blocklists)
+    subscriptions = [Subscription("dragon*", 12345), Subscription("fox", 54321)]
+    matcher.rebuild(subscriptions)
+    targets = [_target("blue dragons"), _target("wolf dragons"), _target("fox")]
+
+    results = matcher.match_batch(targets)
+
+    assert [set(result) for result in results] == [{subscriptions[0]}, set(), {subscriptions[1]}]
+    assert profiler.entries[KIND_QUERY]["dragon*"].calls == 3
+    assert profiler.entries[KIND_BLOCKLIST]["12345"].calls == 2
+
+
+def test_match__disabled_records_nothing():
+    matcher = SubscriptionMatcher({})
+    matcher.rebuild([Subscription("dragon*", 12345)])
+    entries_before = match_profiler.to_json()
+
+    for _ in range(match_profiler.SAMPLE_INTERVAL * 2):
+        matcher.match(_target("dragons"))
+
+    assert match_profiler.to_json() == entries_before
@@ -0,0 +1,180 @@
+from unittest.mock import Mock
+
+import pytest
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.match_profiler import KIND_BLOCKLIST, KIND_QUERY, match_profiler
+from fa_search_bot.subscriptions.matcher_pool import (
+    OP_SET_PROFILING,
+    OP_TAKE_PREDICATE_STATS,
+    OP_TAKE_PROFILE,
+    MatcherPool,
+    MatcherPoolError,
+    MatcherWorkerState,
+)
+from fa_search_bot.subscriptions.predicate_stats import predicate_stats
+from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+
+
+def _target_data(title: str) -> dict:
+    target = QueryTarget(SubmissionID("fa", "12345"), [title], [""], [], ["artist"], Rating.GENERAL)
+    return target.to_json()
+
+
+def test_worker_state__match():
+    state = MatcherWorkerState()
+    state.add_subscription("dragon", 12345, False)
+    state.add_subscription("wolf", 12345, False)
+
+    result = state.match(_target_data("A red dragon"), None)
+
+    assert result == [("dragon", 12345)]
+
+
+def test_worker_state__remove_subscription():
+    state = MatcherWorkerState()
+    state.add_subscription("Dragon", 12345, False)
+
+    state.remove_subscription("dragon", 12345)
+
+    assert state.match(_target_data("dragon"), None) == []
+    assert state.matcher.count_distinct_queries() == 0
+
+
+def test_worker_state__paused():
+    state = MatcherWorkerState()
+    state.add_subscription("dragon", 12345, False)
+
+    state.set_paused("dragon", 12345, True)
+    assert state.match(_target_data("dragon"), None) == []
+    state.set_paused("dragon", 12345, False)
+    assert state.match(_target_data("dragon"), None) == [("dragon", 12345)]
+
+
+def test_worker_state__blocklist():
+    state = MatcherWorkerState()
+    state.add_subscription("dragon", 12345, False)
+
+    state.add_block(12345, "red")
+    assert state.match(_target_data("red dragon"), None) == []
+    state.remove_block(12345, "red")
+    assert state.match(_target_data("red dragon"), None) == [("dragon", 12345)]
+
+
+def test_worker_state__restricted_keys():
+    state = MatcherWorkerState()
+    state.add_subscription("dragon", 12345, False)
+    state.add_subscription("dragon", 54321, False)
+
+    result = state.match(_target_data("dragon"), [("dragon", 54321)])
+
+    assert result == [("dragon", 54321)]
+
+
+@pytest.mark.asyncio
+async def test_pool__match_with_deltas():
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("dragon", 54321)
+    blocklists = {54321: DestinationBlocklist.from_query(54321, "red")}
+    pool = MatcherPool(1)
+    pool.start([sub1, sub2], blocklists)
+    try:
+        target = QueryTarget.from_json(_target_data("red dragon"))
+        assert await pool.match(target) == [sub1]
+
+        pool.remove_block(54321, "red")
+        sub3 = Subscription("red", 12345)
+        pool.add_subscription(sub3)
+
+        assert set(await pool.match(target)) == {sub1, sub2, sub3}
+        assert await pool.match(target, {sub3}) == [sub3]
+    finally:
+        pool.stop()
+    assert not pool.running
+
+
+@pytest.mark.asyncio
+async def test_pool__hung_worker_stops_pool():
+    pool = MatcherPool(1)
+    pool.start([Subscription("dragon", 12345)], {})
+    worker = pool.workers[0]
+    result_conn = worker.result_conn
+    # A process which never responds, without closing its end of the pipe
+    worker.result_conn = Mock(poll=Mock(return_value=False))
+    try:
+        with pytest.raises(MatcherPoolError):
+            await pool.match(QueryTarget.from_json(_target_data("dragon")))
+    finally:
+        result_conn.close()
+        pool.stop()
+
+    worker.result_conn.poll.assert_called_once_with(worker.REQUEST_TIMEOUT)
+    worker.result_conn.recv.assert_not_called()
+    assert not pool.running
+
+
+@pytest.mark.asyncio
+async def test_pool__restarts_after_failure():
+    sub1 = Subscription("dragon", 12345)
+    subscriptions = {sub1}
+    blocklists = {12345: DestinationBlocklist.from_query(12345, "red")}
+    pool = MatcherPool(1)
+    pool.start(subscriptions, blocklists)
+    try:
+        pool.workers[0].process.kill()
+        target = QueryTarget.from_json(_target_data("dragon"))
+        with pytest.raises(MatcherPoolError):
+            await pool.match(target)
+        assert not pool.running
+        assert not pool.available()
+        # Changes made while the pool is stopped are replayed once it restarts
+        sub2 = Subscription("dragon", 54321)
+        subscriptions.add(sub2)
+        pool.restart_at = pool.clock()
+
+        assert pool.available()
+        assert set(await pool.match(target)) == {sub1, sub2}
+        assert await pool.match(QueryTarget.from_json(_target_data("red dragon"))) == [sub2]
+        assert pool.running
+        assert pool.failures == 0
+    finally:
+        pool.stop()
+    assert not pool.available()
+
+
+def test_worker_state__match_batch():
+    state = MatcherWorkerState()
+    state.add_subscription("dragon", 12345, False)
+    state.add_subscription("wolf", 12345, False)
+
+    result = state.match_batch([_target_data("A red dragon"), _target_data("A fox"), _target_data("A wolf")])
+
+    assert result == [[("dragon", 12345)], [], [("wolf", 12345)]]
+
+
+def test_worker_state__profiling(monkeypatch):
+    monkeypatch.setattr(match_profiler, "entries", {KIND_QUERY: {}, KIND_BLOCKLIST: {}})
+    monkeypatch.setattr(match_profiler, "SAMPLE_INTERVAL", 1)
+    state = MatcherWorkerState()
+    state.add_subscription("dragon", 12345, False)
+
+    try:
+        state.handle(OP_SET_PROFILING, (True,))
+        state.match(_target_data("A red dragon"), None)
+        profile = state.handle(OP_TAKE_PROFILE, ())
+    finally:
+        state.handle(OP_SET_PROFILING, (False,))
+
+    assert profile[KIND_QUERY]["dragon"][0] == 1
+    assert state.handle(OP_TAKE_PROFILE, ()) == {KIND_QUERY: {}, KIND_BLOCKLIST: {}}
+
+
+def test_worker_state__take_predicate_stats(monkeypatch):
+    monkeypatch.setattr(predicate_stats, "stats", {})
+    state = MatcherWorkerState()
+    predicate_stats.record("dragon", 100, True)
+
+    assert state.handle(OP_TAKE_PREDICATE_STATS, ()) == {"dragon": [1, 1, 100]}
+    assert state.handle(OP_TAKE_PREDICATE_STATS, ()) == {}
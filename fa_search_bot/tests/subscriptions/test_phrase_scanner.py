@@ -0,0 +1,99 @@
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.phrase_scanner import PhraseScanner, case_folds_simply
+from fa_search_bot.subscriptions.query_parser import PhraseQuery, compile_query, parse_query
+from fa_search_bot.subscriptions.query_target import KeywordField, QueryTarget
+
+
+def _query_target(title: str = "", description: str = "", keywords: list[str] = None) -> QueryTarget:
+    return QueryTarget(SubmissionID("fa", "12345"), [title], [description], keywords or [], ["artist"], Rating.GENERAL)
+
+
+def test_scan__finds_phrases():
+    scanner = PhraseScanner()
+    scanner.add_phrase("red dragon")
+    scanner.add_phrase("dragon ball")
+    scanner.add_phrase("blue wolf")
+
+    hits = scanner.scan("A Red Dragon, and a dragon ball.")
+
+    assert hits == {"red dragon", "dragon ball"}
+
+
+def test_scan__respects_word_boundaries():
+    scanner = PhraseScanner()
+    scanner.add_phrase("red dragon")
+
+    assert scanner.scan("hired dragon") == set()
+    assert scanner.scan("red dragons") == set()
+    assert scanner.scan("(red dragon)") == {"red dragon"}
+    assert scanner.scan("red-dragon, red dragon") == {"red dragon"}
+
+
+def test_scan__overlapping_phrases():
+    scanner = PhraseScanner()
+    scanner.add_phrase("dragon")
+    scanner.add_phrase("red dragon")
+    scanner.add_phrase("on")
+
+    assert scanner.scan("red dragon") == {"red dragon", "dragon"}
+
+
+def test_remove_phrase__reference_counted():
+    scanner = PhraseScanner()
+    scanner.add_phrase("red dragon")
+    scanner.add_phrase("Red Dragon")
+
+    scanner.remove_phrase("red dragon")
+    assert scanner.scan("red dragon") == {"red dragon"}
+
+    scanner.remove_phrase("red dragon")
+    assert scanner.scan("red dragon") == set()
+    assert scanner.count_phrases() == 0
+
+
+def test_add_phrase__after_scan():
+    scanner = PhraseScanner()
+    scanner.add_phrase("red dragon")
+    assert scanner.scan("a blue wolf") == set()
+
+    scanner.add_phrase("blue wolf")
+
+    assert scanner.scan("a blue wolf") == {"blue wolf"}
+
+
+def test_case_folds_simply():
+    assert case_folds_simply("Hello there")
+    assert case_folds_simply("Café ❤")
+    assert not case_folds_simply("ſtraße")
+
+
+def test_phrase_query__uses_scanned_hits():
+    scanner = PhraseScanner()
+    query = parse_query('"red dragon" or keyword:"wolf"')
+    scanner.add_query(query)
+    matcher = compile_query(query)
+    target = _query_target(description="There was a red dragon")
+    scanner.attach(target)
+
+    assert target.phrase_hits.for_field(KeywordField).phrases == set()
+    assert query.matches_submission(target)
+    assert matcher(target)
+
+
+def test_phrase_query__falls_back_to_regex_for_unscanned_phrase():
+    scanner = PhraseScanner()
+    target = _query_target(title="Red Dragon")
+    scanner.attach(target)
+
+    assert PhraseQuery("red dragon").matches_submission(target)
+
+
+def test_phrase_query__falls_back_to_regex_for_unusual_case_text():
+    scanner = PhraseScanner()
+    query = PhraseQuery("sea")
+    scanner.add_query(query)
+    target = _query_target(title="ſea")
+    scanner.attach(target)
+
+    assert query.matches_submission(target) == bool(query.phrase_regex.search("ſea"))
@@ -0,0 +1,215 @@
+import time
+
+import pytest
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.predicate_stats import PredicateStat, PredicateStats, predicate_stats
+from fa_search_bot.subscriptions.query_parser import _compile_adaptive, compile_query, parse_query, sampling_matcher
+from fa_search_bot.subscriptions.query_target import QueryTarget
+
+
+def _target(title: str = "", description: str = "") -> QueryTarget:
+    return QueryTarget(SubmissionID("fa", "12345"), [title], [description], [], ["artist"], Rating.GENERAL)
+
+
+@pytest.fixture
+def clean_stats(monkeypatch):
+    monkeypatch.setattr(predicate_stats, "stats", {})
+    monkeypatch.setattr(predicate_stats, "REORDER_INTERVAL", 1)
+    monkeypatch.setattr(predicate_stats, "MIN_CALLS", 1)
+    return predicate_stats
+
+
+def test_order__and_puts_cheap_rejections_first():
+    stats = PredicateStats()
+    for _ in range(20):
+        stats.record("slow_rejecting", 1000, False)
+        stats.record("fast_passing", 10, True)
+        stats.record("fast_rejecting", 10, False)
+
+    assert stats.order(["slow_rejecting", "fast_passing", "fast_rejecting"], True) == [2, 0, 1]
+    assert stats.order(["slow_rejecting", "fast_passing", "fast_rejecting"], False) == [1, 2, 0]
+
+
+def test_order__needs_stats_for_all():
+    stats = PredicateStats()
+    for _ in range(20):
+        stats.record("known", 10, True)
+    stats.record("barely_known", 10, True)
+
+    assert stats.order(["known", "unknown"], True) is None
+    assert stats.order(["known", "barely_known"], True) is None
+
+
+def test_record__decays_old_calls():
+    stats = PredicateStats()
+    for _ in range(PredicateStat.MAX_CALLS):
+        stats.record("dragon", 10, True)
+
+    assert stats.stats["dragon"].calls < PredicateStat.MAX_CALLS
+    assert stats.stats["dragon"].pass_rate == 1
+    assert stats.stats["dragon"].cost_ns == 10
+
+
+def _recording_check(name: str, result: bool, calls: list[str]):
+    def check(sub: QueryTarget) -> bool:
+        calls.append(name)
+        return result
+
+    return check
+
+
+def test_adaptive__reorders_and(clean_stats):
+    calls: list[str] = []
+    matcher = _compile_adaptive(
+        [
+            ("passing", _recording_check("passing", True, calls)),
+            ("rejecting", _recording_check("rejecting", False, calls)),
+        ],
+        True,
+    )
+    target = _target()
+
+    assert matcher(target) is False
+    assert calls == ["passing", "rejecting"]
+    calls.clear()
+    assert sampling_matcher(matcher)(target) is False
+    assert calls == ["passing", "rejecting"]
+    calls.clear()
+
+    assert matcher(target) is False
+    assert calls == ["rejecting"]
+
+
+def test_adaptive__reorders_or(clean_stats):
+    calls: list[str] = []
+    matcher = _compile_adaptive(
+        [
+            ("rejecting", _recording_check("rejecting", False, calls)),
+            ("passing", _recording_check("passing", True, calls)),
+        ],
+        False,
+    )
+    target = _target()
+
+    sampling_matcher(matcher)(target)
+    calls.clear()
+
+    assert matcher(target) is True
+    assert calls == ["passing"]
+
+
+def test_sampling_matcher__records_sub_queries(clean_stats):
+    query = parse_query('dragon* or wolf* or "blue fox"')
+    matcher = compile_query(query)
+    target = _target(title="blue fox")
+
+    for _ in range(3):
+        assert sampling_matcher(matcher)(target) is True
+
+    assert clean_stats.stats[repr(query.sub_queries[0])].calls == 3
+    assert clean_stats.stats[repr(query.sub_queries[0])].pass_rate == 0
+    assert clean_stats.stats[repr(query.sub_queries[2])].pass_rate == 1
+    assert matcher(target) is True
+    assert matcher(_target(title="wolfish")) is True
+    assert matcher(_target(title="nothing")) is False
+
+
+def test_sampling_matcher__through_negation(clean_stats):
+    query = parse_query('-(dragon* and "blue fox")')
+    matcher = compile_query(query)
+
+    assert sampling_matcher(matcher)(_target(title="blue fox")) is True
+    assert sampling_matcher(matcher)(_target(title="dragons blue fox")) is False
+    assert len(clean_stats.stats) == 2
+
+
+def test_sampling_matcher__cheap_checks_not_sampled():
+    matcher = compile_query(parse_query("dragon or wolf or rating:adult"))
+
+    assert sampling_matcher(matcher) is matcher
+
+
+def test_compile__uses_saved_stats(clean_stats):
+    for _ in range(20):
+        clean_stats.record("passing", 100, True)
+        clean_stats.record("rejecting", 100, False)
+    calls: list[str] = []
+
+    matcher = _compile_adaptive(
+        [
+            ("passing", _recording_check("passing", True, calls)),
+            ("rejecting", _recording_check("rejecting", False, calls)),
+        ],
+        True,
+    )
+
+    assert matcher(_target()) is False
+    assert calls == ["rejecting"]
+
+
+def test_save_and_load(tmp_path):
+    filename = str(tmp_path / "predicate_stats.json")
+    stats = PredicateStats()
+    stats.record("dragon", 150, True)
+    stats.record("dragon", 50, False)
+
+    stats.save_to_file(filename)
+    loaded = PredicateStats()
+    loaded.load_from_file(filename)
+
+    assert loaded.to_json() == {"dragon": [2, 1, 200, stats.stats["dragon"].last_recorded]}
+    assert loaded.stats["dragon"].cost_ns == 100
+
+
+def test_load__without_last_recorded():
+    stats = PredicateStats()
+
+    stats.load_json({"dragon": [2, 1, 200]})
+
+    assert stats.stats["dragon"].calls == 2
+    assert stats.stats["dragon"].last_recorded > 0
+
+
+def test_save__drops_unused_predicates(tmp_path):
+    stats = PredicateStats()
+    stats.load_json({"old": [2, 1, 200, 1000], "recent": [2, 1, 200, time.time()]})
+
+    stats.save_to_file(str(tmp_path / "predicate_stats.json"))
+
+    assert list(stats.stats.keys()) == ["recent"]
+
+
+def test_take_new_and_merge():
+    worker_stats = PredicateStats()
+    worker_stats.load_json({"dragon": [20, 10, 2000]})
+    worker_stats.record("dragon", 100, True)
+    worker_stats.record("wolf", 50, False)
+    main_stats = PredicateStats()
+    main_stats.load_json({"dragon": [20, 10, 2000]})
+
+    main_stats.merge_json(worker_stats.take_new_json())
+
+    # Only the calls recorded by the worker are merged, not those it loaded at startup
+    assert main_stats.stats["dragon"].calls == 21
+    assert main_stats.stats["dragon"].passes == 11
+    assert main_stats.stats["wolf"].total_ns == 50
+    assert worker_stats.take_new_json() == {}
+
+
+def test_load__missing_or_invalid(tmp_path):
+    stats = PredicateStats()
+    stats.load_from_file(str(tmp_path / "missing.json"))
+    invalid = tmp_path / "invalid.json"
+    invalid.write_text("not json")
+    stats.load_from_file(str(invalid))
+
+    assert stats.stats == {}
+
+
+def test_take_sample(monkeypatch):
+    stats = PredicateStats()
+    monkeypatch.setattr(stats, "_sample_countdown", 3)
+
+    assert [stats.take_sample() for _ in range(3 + stats.SAMPLE_INTERVAL)].count(True) == 2
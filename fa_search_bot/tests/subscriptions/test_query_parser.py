@@ -1,3 +1,5 @@
+import re
+
 import pytest
 
 from fa_search_bot.subscriptions.query_parser import (
@@ -17,9 +19,13 @@ from fa_search_bot.subscriptions.query_parser import (
     SuffixQuery,
     TitleField,
     WordQuery,
+    compile_query,
     parse_query,
+    query_rating_bounds,
 )
 from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.query_target import QueryTarget
 
 
 def test_parser():
@@ -197,3 +203,107 @@ def test_keyword_exception_invalid():
 
 def test_word_starting_not():
     assert parse_query("notice") == WordQuery("notice")
+
+
+def _query_target(
+        title: str = "",
+        description: str = "",
+        keywords: list[str] = None,
+        artist: str = "artist",
+        rating: Rating = Rating.GENERAL,
+) -> QueryTarget:
+    return QueryTarget(SubmissionID("fa", "12345"), [title], [description], keywords or [], [artist], rating)
+
+
+@pytest.mark.parametrize(
+    "query_str",
+    [
+        "dragon",
+        "dragon wolf",
+        "dragon or wolf",
+        "-dragon",
+        "not (not dragon)",
+        "drag*",
+        "*gon",
+        "d*g*n",
+        '"red dragon"',
+        "rating:general",
+        "rating:general rating:adult",
+        "rating:general or rating:mature or rating:adult",
+        "title:dragon or keyword:wolf",
+        'dragon except "dragon ball"',
+        "(dragon and (red or blue)) or (wolf and -rating:adult)",
+    ]
+)
+def test_compile_query__matches_same_as_query(query_str):
+    query = parse_query(query_str)
+    compiled = compile_query(query)
+    targets = [
+        _query_target(title="Red dragon", description="A dragon flying over some wolves"),
+        _query_target(title="Dragon ball", keywords=["dragon", "anime"], rating=Rating.MATURE),
+        _query_target(title="Blue wolf", description="dragons everywhere", rating=Rating.ADULT),
+        _query_target(title="Nothing to see here", artist="dragon"),
+    ]
+
+    for target in targets:
+        assert compiled(target) == query.matches_submission(target)
+
+
+def test_compile_query__folds_constants():
+    target = _query_target(title="dragon")
+
+    assert compile_query(AndQuery([]))(target) is True
+    assert compile_query(OrQuery([]))(target) is False
+    assert compile_query(parse_query("rating:general rating:adult"))(target) is False
+    assert compile_query(parse_query("rating:general or rating:mature or rating:adult"))(target) is True
+    assert compile_query(NotQuery(AndQuery([])))(target) is False
+
+
+def test_exception_query__every_match_excepted():
+    query = parse_query('dragon except ("red dragon" or "dragon ball")')
+
+    assert not query.matches_submission(_query_target(description="red dragon, dragon ball, red dragon ball"))
+    assert query.matches_submission(_query_target(description="red dragon, blue dragon"))
+
+
+def test_exception_query__overlapping_exceptions():
+    query = parse_query('ball except ("dragon ball" or "ball z" or "dragon ball z")')
+
+    assert not query.matches_submission(_query_target(title="dragon ball z", description="ball z. dragon ball"))
+    assert query.matches_submission(_query_target(title="dragon ball z", description="a ball"))
+
+
+def test_exception_query__exception_in_other_text():
+    query = parse_query('title:dragon except "red dragon"')
+
+    assert query.matches_submission(_query_target(title="dragon", description="red dragon"))
+    assert not query.matches_submission(_query_target(title="red dragon", description="dragon"))
+
+
+def test_exception_query__does_not_recompile_patterns(monkeypatch):
+    query = parse_query('drag* except (dragon or *gon or "red dragon")')
+    target = _query_target(description="red dragon dragging")
+
+    def fail_compile(*args, **kwargs):
+        raise AssertionError("Pattern compiled while matching")
+
+    monkeypatch.setattr(re, "compile", fail_compile)
+
+    assert query.matches_submission(target)
+    assert len(query.word.match_locations(target)) == 2
+
+
+@pytest.mark.parametrize(
+    "query_str, possible, certain",
+    [
+        ("dragon", set(Rating), set()),
+        ("rating:adult", {Rating.ADULT}, {Rating.ADULT}),
+        ("dragon rating:adult", {Rating.ADULT}, set()),
+        ("dragon -rating:general", {Rating.MATURE, Rating.ADULT}, set()),
+        ("rating:general or (dragon and rating:mature)", {Rating.GENERAL, Rating.MATURE}, {Rating.GENERAL}),
+        ("-(dragon or rating:adult)", {Rating.GENERAL, Rating.MATURE}, set()),
+        ("rating:general rating:adult", set(), set()),
+    ]
+)
+def test_query_rating_bounds(query_str, possible, certain):
+    assert query_rating_bounds(parse_query(query_str)) == (frozenset(possible), frozenset(certain))
@@ -0,0 +1,99 @@
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.query_target import (
+    FieldTokens,
+    QueryTarget,
+    TextTokens,
+    TokenCache,
+    punctuation,
+    split_text_to_words,
+)
+
+
+def test_field_tokens__has_word():
+    tokens = FieldTokens(["red", "dragon", "picture"])
+
+    assert tokens.has_word("dragon")
+    assert not tokens.has_word("drag")
+
+
+def test_field_tokens__has_prefix():
+    tokens = FieldTokens(["red", "dragons", "picture"])
+
+    assert tokens.has_prefix("drag")
+    assert tokens.has_prefix("dragon")
+    assert not tokens.has_prefix("dragons")
+    assert not tokens.has_prefix("wolf")
+    assert not tokens.has_prefix("s")
+
+
+def test_field_tokens__has_prefix__skips_exact_word():
+    tokens = FieldTokens(["drag", "dragon"])
+
+    assert tokens.has_prefix("drag")
+    assert not tokens.has_prefix("dragon")
+
+
+def test_field_tokens__has_suffix():
+    tokens = FieldTokens(["red", "dragons", "picture"])
+
+    assert tokens.has_suffix("gons")
+    assert tokens.has_suffix("ure")
+    assert not tokens.has_suffix("dragons")
+    assert not tokens.has_suffix("wolf")
+
+
+def test_query_target__any_field_tokens_combine_fields():
+    target = QueryTarget(
+        SubmissionID("fa", "12345"),
+        ["Red dragon"],
+        ["A picture of a dragon, flying"],
+        ["Scales", "wings"],
+        ["DeerSpangle"],
+        Rating.GENERAL,
+    )
+
+    tokens = target.any_field.tokens()
+
+    assert tokens.has_word("red")
+    assert tokens.has_word("flying")
+    assert tokens.has_word("scales")
+    assert tokens.has_word("deerspangle")
+    assert not target.title.tokens().has_word("flying")
+
+
+def test_text_tokens__from_text():
+    tokens = TextTokens.from_text("Hello, Big-World! (it's me)")
+
+    assert tokens.words == ["hello", "big-world", "it", "s", "me"]
+    assert tokens.offsets == [0, 7, 19, 22, 24]
+
+
+def test_text_tokens__from_whole_text():
+    tokens = TextTokens.from_whole_text("!Red Dragon.", punctuation)
+
+    assert tokens.words == ["red dragon"]
+    assert tokens.offsets == [1]
+
+
+def test_split_text_to_words():
+    assert split_text_to_words(" Red, dragon's_den! ") == ["red", "dragon", "s_den"]
+    assert split_text_to_words("...") == []
+
+
+def test_index_words__splits_keywords():
+    target = QueryTarget(
+        SubmissionID("fa", "12345"), ["A title"], [""], ["red_dragon", "blue wolf"], ["artist"], Rating.GENERAL
+    )
+
+    assert target.keywords.index_words() == {"red_dragon", "blue wolf", "blue", "wolf"}
+    assert target.title.index_words() == {"a", "title"}
+
+
+def test_query_target__shares_token_cache():
+    token_cache = TokenCache()
+    first = QueryTarget(SubmissionID("fa", "12345"), ["A title"], [""], [], ["artist"], Rating.GENERAL, token_cache)
+    second = QueryTarget(SubmissionID("fa", "12345"), ["A title"], [""], [], ["artist"], Rating.GENERAL, token_cache)
+
+    assert second.title.tokens() is first.title.tokens()
+    assert second.any_field.tokens() is first.any_field.tokens()
@@ -0,0 +1,205 @@
+from unittest.mock import Mock
+
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.send_scheduler import PARK_REASON_SEND_FAILURES, SendScheduler, SubmissionSend
+from fa_search_bot.subscriptions.wait_pool import SubmissionCheckState
+
+
+def _submission(num: int) -> SubmissionSend:
+    return SubmissionSend(SubmissionCheckState(SubmissionID("fa", str(num))), Mock())
+
+
+def _drain(scheduler: SendScheduler) -> list:
+    sent = []
+    while (job := scheduler.next_job()) is not None:
+        sent.append((job.destination, job.submission.state.sub_id.submission_id))
+        scheduler.finish_job(job)
+    return sent
+
+
+def test_schedule__ordered_within_destination():
+    scheduler = SendScheduler(10)
+    scheduler.schedule(_submission(1), {100: "a", 200: "a"})
+    scheduler.schedule(_submission(2), {100: "b"})
+    scheduler.schedule(_submission(3), {200: "c", 100: "c"})
+
+    sent = _drain(scheduler)
+
+    assert [sub for dest, sub in sent if dest == 100] == ["1", "2", "3"]
+    assert [sub for dest, sub in sent if dest == 200] == ["1", "3"]
+    assert not scheduler.destination_queues
+
+
+def test_next_job__destination_only_given_to_one_worker():
+    scheduler = SendScheduler(10)
+    scheduler.schedule(_submission(1), {100: "a"})
+    scheduler.schedule(_submission(2), {100: "b", 200: "b"})
+
+    first = scheduler.next_job()
+    second = scheduler.next_job()
+
+    assert (first.destination, second.destination) == (100, 200)
+    assert scheduler.next_job() is None
+    scheduler.finish_job(first)
+    assert scheduler.next_job().submission.state.sub_id.submission_id == "2"
+
+
+def test_finish_job__completes_submissions_in_order():
+    scheduler = SendScheduler(10)
+    sub1, sub2 = _submission(1), _submission(2)
+    scheduler.schedule(sub1, {100: "a"})
+    scheduler.schedule(sub2, {200: "b"})
+    job1 = scheduler.next_job()
+    job2 = scheduler.next_job()
+
+    assert scheduler.finish_job(job2) == []
+    assert scheduler.finish_job(job1) == [sub1, sub2]
+    assert not scheduler.submissions
+
+
+def test_finish_job__retry_keeps_order():
+    scheduler = SendScheduler(10)
+    scheduler.schedule(_submission(1), {100: "a"})
+    scheduler.schedule(_submission(2), {100: "b"})
+    job = scheduler.next_job()
+
+    assert scheduler.finish_job(job, retry=True) == []
+
+    assert _drain(scheduler) == [(100, "1"), (100, "2")]
+
+
+def test_schedule__no_destinations_completes():
+    scheduler = SendScheduler(10)
+    sub = _submission(1)
+
+    assert scheduler.schedule(sub, {}) == [sub]
+
+
+def test_has_capacity():
+    scheduler = SendScheduler(2)
+    scheduler.schedule(_submission(1), {100: "a"})
+    assert scheduler.has_capacity()
+    scheduler.schedule(_submission(2), {100: "b"})
+    assert not scheduler.has_capacity()
+
+    scheduler.finish_job(scheduler.next_job())
+
+    assert scheduler.has_capacity()
+
+
+def test_finish_job__park_destination_until_deadline():
+    scheduler = SendScheduler(10)
+    now = 1000.0
+    scheduler.clock = lambda: now
+    scheduler.schedule(_submission(1), {100: "a", 200: "a"})
+    scheduler.schedule(_submission(2), {100: "b", 200: "b"})
+    job = scheduler.next_job()
+    assert job.destination == 100
+
+    scheduler.finish_job(job, retry=True, park_seconds=30)
+
+    assert scheduler.count_parked_destinations() == 1
+    assert scheduler.seconds_until_unpark() == 30
+    assert _drain(scheduler) == [(200, "1"), (200, "2")]
+    now += 30
+    assert _drain(scheduler) == [(100, "1"), (100, "2")]
+    assert scheduler.count_parked_destinations() == 0
+    assert scheduler.seconds_until_unpark() is None
+    assert not scheduler.submissions
+
+
+def test_finish_job__many_parked_destinations_parks_all_sending():
+    scheduler = SendScheduler(10)
+    now = 1000.0
+    scheduler.clock = lambda: now
+    destinations = list(range(scheduler.GLOBAL_FLOOD_WAIT_DESTINATIONS + 1))
+    scheduler.schedule(_submission(1), {dest: "a" for dest in destinations})
+    for park_seconds in [10, 20, 5]:
+        scheduler.finish_job(scheduler.next_job(), retry=True, park_seconds=park_seconds)
+
+    assert scheduler.global_deadline == now + 5
+    assert scheduler.next_job() is None
+    now += 5
+    assert _drain(scheduler) == [(3, "1"), (2, "1")]
+    now += 15
+    assert _drain(scheduler) == [(0, "1"), (1, "1")]
+
+
+def test_finish_job__failure_parks_do_not_park_all_sending():
+    scheduler = SendScheduler(10)
+    scheduler.clock = lambda: 1000.0
+    destinations = list(range(scheduler.GLOBAL_FLOOD_WAIT_DESTINATIONS + 1))
+    scheduler.schedule(_submission(1), {dest: "a" for dest in destinations})
+    for _ in range(scheduler.GLOBAL_FLOOD_WAIT_DESTINATIONS):
+        scheduler.finish_job(scheduler.next_job(), retry=True, park_seconds=60, park_reason=PARK_REASON_SEND_FAILURES)
+
+    assert scheduler.global_deadline is None
+    assert _drain(scheduler) == [(3, "1")]
+
+
+def test_has_capacity__parked_destination_does_not_hold_up_others():
+    scheduler = SendScheduler(2)
+    now = 1000.0
+    scheduler.clock = lambda: now
+    first = _submission(1)
+    scheduler.schedule(first, {100: "a", 200: "a"})
+    job = scheduler.next_job()
+    assert job.destination == 100
+    scheduler.finish_job(job, retry=True, park_seconds=600)
+
+    sent = _drain(scheduler)
+    completed = []
+    last_num = 3 * scheduler.max_submissions + 1
+    for num in range(2, last_num + 1):
+        assert scheduler.has_capacity()
+        scheduler.schedule(_submission(num), {100: "b", 200: "b"})
+        while (job := scheduler.next_job()) is not None:
+            sent.append((job.destination, job.submission.state.sub_id.submission_id))
+            completed.extend(scheduler.finish_job(job))
+
+    assert [sub for dest, sub in sent if dest == 200] == [str(num) for num in range(1, last_num + 1)]
+    assert not [sub for dest, sub in sent if dest == 100]
+    # Nothing is completed while the parked destination has not been sent to, so no submission is recorded as sent
+    # before all the earlier ones have been
+    assert completed == []
+    assert first.pending == 1
+    now += 600
+    while (job := scheduler.next_job()) is not None:
+        completed.extend(scheduler.finish_job(job))
+    assert [sub.state.sub_id.submission_id for sub in completed] == [str(num) for num in range(1, last_num + 1)]
+    assert not scheduler.submissions
+    assert scheduler.capacity_used == 0
+
+
+def test_has_capacity__parked_backlog_limited():
+    scheduler = SendScheduler(2)
+    scheduler.PARKED_BACKLOG_LIMIT = 3
+    scheduler.clock = lambda: 1000.0
+    scheduler.schedule(_submission(1), {100: "a"})
+    scheduler.finish_job(scheduler.next_job(), retry=True, park_seconds=600)
+
+    # Once the parked destination has a full backlog, further messages to it count towards the limit again
+    for num in range(2, 4):
+        assert scheduler.has_capacity()
+        scheduler.schedule(_submission(num), {100: "b"})
+    assert scheduler.capacity_used == 0
+    scheduler.schedule(_submission(4), {100: "b"})
+    scheduler.schedule(_submission(5), {100: "b"})
+    assert scheduler.capacity_used == 2
+    assert not scheduler.has_capacity()
+
+
+def test_has_capacity__deferred_submissions_limited():
+    scheduler = SendScheduler(2)
+    scheduler.MAX_DEFERRED_SUBMISSIONS = 3
+    scheduler.clock = lambda: 1000.0
+    scheduler.schedule(_submission(1), {100: "a"})
+    scheduler.finish_job(scheduler.next_job(), retry=True, park_seconds=600)
+
+    # Later submissions are sent, but have to wait for the parked one to be completed
+    for num in range(2, 4):
+        assert scheduler.has_capacity()
+        scheduler.schedule(_submission(num), {200: "b"})
+        _drain(scheduler)
+    assert scheduler.capacity_used == 0
+    assert not scheduler.has_capacity()
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+from typing import List
 from unittest import mock
 
 import pytest
-from telethon.errors import UserIsBlockedError, InputUserDeactivatedError
+from telethon.errors import UserIsBlockedError, InputUserDeactivatedError, FloodWaitError, ChatWriteForbiddenError
 
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.send_scheduler import PARK_REASON_SEND_FAILURES, SubmissionSend
+from fa_search_bot.subscriptions.sender import Sender
 from fa_search_bot.subscriptions.subscription import Subscription
 from fa_search_bot.subscriptions.subscription_watcher import SubscriptionWatcher
+from fa_search_bot.subscriptions.wait_pool import SubmissionCheckState
 from fa_search_bot.tests.util.mock_export_api import MockExportAPI
 from fa_search_bot.tests.util.mock_submission_cache import MockSubmissionCache
 from fa_search_bot.tests.util.submission_builder import SubmissionBuilder
@@ -153,3 +159,179 @@ async def test_send_updates__blocked_pauses_other_subs(mock_client):
     assert subscription1.paused
     assert subscription2.paused
     assert not subscription3.paused
+
+
+def _sender(num_send_workers: int) -> Sender:
+    watcher = mock.Mock()
+    watcher.config.num_send_workers = num_send_workers
+    watcher.config.max_sending_submissions = 10
+    watcher.update_latest_id = mock.AsyncMock()
+    return Sender(watcher)
+
+
+def _scheduled(sender: Sender, num: int, destinations: List[int]) -> None:
+    state = SubmissionCheckState(SubmissionID("fa", str(num)), full_data=mock.Mock())
+    sender.scheduler.schedule(SubmissionSend(state, mock.Mock()), {dest: "prefix" for dest in destinations})
+
+
+@pytest.mark.asyncio
+async def test_send_workers__parallel_destinations_in_order():
+    sender = _sender(3)
+    sent = []
+    in_flight = set()
+    max_in_flight = 0
+
+    async def fake_send(sendable, state, chat, prefix):
+        nonlocal max_in_flight
+        assert chat not in in_flight
+        in_flight.add(chat)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.discard(chat)
+        sent.append((chat, state.sub_id.submission_id))
+
+    sender._try_send_subscription_update = fake_send
+    for num in range(1, 6):
+        _scheduled(sender, num, [100, 200, 300])
+    sender.running = True
+    workers = [asyncio.create_task(sender._run_send_worker()) for _ in range(3)]
+    while sender.scheduler.submissions:
+        await asyncio.sleep(0.01)
+    sender.stop()
+    await asyncio.gather(*workers)
+
+    assert max_in_flight == 3
+    for dest in [100, 200, 300]:
+        assert [num for chat, num in sent if chat == dest] == ["1", "2", "3", "4", "5"]
+    latest_ids = [call.args[0].submission_id for call in sender.watcher.update_latest_id.call_args_list]
+    assert latest_ids == ["1", "2", "3", "4", "5"]
+
+
+@pytest.mark.asyncio
+async def test_send_workers__flood_wait_parks_only_that_destination():
+    sender = _sender(1)
+    sent = []
+
+    async def fake_send(sendable, state, chat, prefix):
+        if chat == 100 and not sent:
+            raise FloodWaitError(None, capture=600)
+        sent.append((chat, state.sub_id.submission_id))
+
+    sender._try_send_subscription_update = fake_send
+    for num in range(1, 4):
+        _scheduled(sender, num, [100, 200])
+    sender.running = True
+    worker = asyncio.create_task(sender._run_send_worker())
+    while len(sent) < 3:
+        await asyncio.sleep(0.01)
+    sender.stop()
+    await worker
+
+    assert sent == [(200, "1"), (200, "2"), (200, "3")]
+    assert sender.scheduler.count_parked_destinations() == 1
+    # The parked destination's messages are still queued, and do not hold up other destinations, but the submissions
+    # are not recorded as sent until they have been sent to it too
+    assert sender.scheduler.count_queued_messages() == 3
+    assert sender.scheduler.has_capacity()
+    sender.watcher.update_latest_id.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_send_workers__failed_message_retried_until_sent():
+    sender = _sender(1)
+    sender.SEND_JOB_RETRY_BACKOFF = 0
+    attempts = 0
+    sent = []
+
+    async def fake_send(sendable, state, chat, prefix):
+        nonlocal attempts
+        attempts += 1
+        if attempts <= 5:
+            raise ValueError("Failed to send")
+        sent.append((chat, state.sub_id.submission_id))
+
+    sender._try_send_subscription_update = fake_send
+    _scheduled(sender, 1, [100])
+    _scheduled(sender, 2, [100])
+    sender.running = True
+    worker = asyncio.create_task(sender._run_send_worker())
+    while sender.scheduler.submissions:
+        await asyncio.sleep(0.01)
+    sender.stop()
+    await worker
+
+    assert attempts == 7
+    assert sent == [(100, "1"), (100, "2")]
+    assert [call.args[0].submission_id for call in sender.watcher.update_latest_id.call_args_list] == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_send_updates__scheduled_submission_not_reverted():
+    sender = _sender(1)
+    sender.watcher.recheck_subscriptions = mock.AsyncMock(return_value=[])
+    sender.watcher.update_latest_id.side_effect = ValueError("Failed to save config")
+    sender.watcher.wait_pool.return_populated_state = mock.AsyncMock()
+    state = SubmissionCheckState(SubmissionID("fa", "1"), full_data=mock.Mock())
+    sender.last_state = state
+
+    # With no destinations, the submission is completed as soon as it is scheduled, and the failure is only logged
+    await sender._send_updates(state)
+    await sender.revert_last_attempt()
+
+    sender.watcher.update_latest_id.assert_called_once_with(state.sub_id)
+    sender.watcher.wait_pool.return_populated_state.assert_not_called()
+    assert not sender.scheduler.submissions
+
+
+@pytest.mark.asyncio
+async def test_send_workers__failing_destination_parked_with_backoff():
+    sender = _sender(1)
+    now = 1000.0
+    sender.scheduler.clock = lambda: now
+    attempts = 0
+    sent = []
+
+    async def fake_send(sendable, state, chat, prefix):
+        nonlocal attempts
+        if chat == 100:
+            attempts += 1
+            raise ValueError("Failed to send")
+        sent.append((chat, state.sub_id.submission_id))
+
+    sender._try_send_subscription_update = fake_send
+    for num in range(1, 4):
+        _scheduled(sender, num, [100, 200])
+    sender.running = True
+    worker = asyncio.create_task(sender._run_send_worker())
+    while len(sent) < 3:
+        await asyncio.sleep(0.01)
+
+    # The other destination is not held up, and the failing destination does not hold the scheduler's capacity
+    assert sent == [(200, "1"), (200, "2"), (200, "3")]
+    assert attempts == 1
+    assert sender.scheduler.parked_destinations[100] == (1020.0, 1000.0, PARK_REASON_SEND_FAILURES)
+    assert sender.scheduler.global_deadline is None
+    assert sender.scheduler.has_capacity()
+    # Each failure in a row doubles the backoff
+    now = 1020.0
+    sender.scheduler.work_signal.notify()
+    while attempts < 2:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.01)
+    assert sender.scheduler.parked_destinations[100][0] == 1060.0
+    sender.stop()
+    await worker
+    assert sender.scheduler.count_queued_messages() == 3
+
+
+@pytest.mark.asyncio
+async def test_try_send__permanent_error_pauses_destination():
+    sender = _sender(1)
+    sender.watcher.pause_unreachable_destination = mock.AsyncMock()
+    sender._send_subscription_update = mock.AsyncMock(side_effect=ChatWriteForbiddenError(None))
+    state = SubmissionCheckState(SubmissionID("fa", "1"), full_data=mock.Mock())
+
+    await sender._try_send_subscription_update(mock.Mock(), state, 100, "prefix")
+
+    sender._send_subscription_update.assert_called_once()
+    sender.watcher.pause_unreachable_destination.assert_called_once_with(100)
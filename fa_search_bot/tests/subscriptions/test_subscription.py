@@ -1,6 +1,6 @@
 import datetime
 
-from fa_search_bot.subscriptions.query_parser import AndQuery, NotQuery, RatingQuery, WordQuery
+from fa_search_bot.subscriptions.query_parser import AndQuery, NotQuery, RatingQuery, WordQuery, compile_query
 from fa_search_bot.sites.submission import Rating
 from fa_search_bot.subscriptions.subscription import Subscription
 from fa_search_bot.tests.util.submission_builder import SubmissionBuilder
@@ -32,7 +32,7 @@ def test_matches_result__one_word_in_title_matches():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -46,7 +46,7 @@ def test_matches_result__one_word_in_description_matches():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -60,7 +60,7 @@ def test_matches_result__one_word_in_keywords_matches():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -74,7 +74,7 @@ def test_matches_result__substring_in_title_no_match():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -88,7 +88,7 @@ def test_matches_result__substring_in_description_no_match():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -102,7 +102,7 @@ def test_matches_result__substring_in_keywords_no_match():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -116,7 +116,7 @@ def test_matches_result__one_word_no_match():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -130,7 +130,7 @@ def test_matches_result__two_words_in_title_matches():
         keywords=["example", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -144,7 +144,7 @@ def test_matches_result__two_words_in_description_matches():
         keywords=["example", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -158,7 +158,7 @@ def test_matches_result__two_matching_keywords():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -172,7 +172,7 @@ def test_matches_result__two_words_in_title_and_description_matches():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -186,7 +186,7 @@ def test_matches_result__two_words_in_title_and_keyword_matches():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -200,7 +200,7 @@ def test_matches_result__two_words_one_matches():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -214,7 +214,7 @@ def test_matches_result__case_insensitive_title():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -228,7 +228,7 @@ def test_matches_result__case_insensitive_description():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -242,7 +242,7 @@ def test_matches_result__case_insensitive_keywords():
         keywords=["example", "submission", "KEYWORDS"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -256,7 +256,7 @@ def test_matches_result__case_insensitive_query():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -270,7 +270,7 @@ def test_matches_result__does_not_match_negated_query():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -284,7 +284,7 @@ def test_matches_result__does_not_match_negated_query_exclamation_mark():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -298,7 +298,7 @@ def test_matches_result__does_not_match_negated_query_case_insensitive():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -312,7 +312,7 @@ def test_matches_result__matches_non_applicable_negated_query():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -326,7 +326,7 @@ def test_matches_result__matches_query_with_non_applicable_negated_query():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -340,7 +340,7 @@ def test_matches_result__does_not_match_query_with_applicable_negated_query():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -354,7 +354,7 @@ def test_matches_result__does_not_match_query_with_applicable_negated_query_in_s
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -368,7 +368,7 @@ def test_matches_result__matches_query_with_hyphen():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -382,7 +382,7 @@ def test_matches_result__doesnt_match_blocklisted_tag():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, NotQuery(WordQuery("test")))
+    match = subscription.matches_result(submission.to_query_target(), compile_query(NotQuery(WordQuery("test"))))
 
     assert not match
 
@@ -396,7 +396,7 @@ def test_matches_result__phrase():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -410,7 +410,7 @@ def test_matches_result__keywords_not_phrase():
         keywords=["example", "hello", "world"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -424,7 +424,7 @@ def test_matches_result__keyword_field():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -438,7 +438,7 @@ def test_matches_result__doesnt_match_except_clause():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -452,7 +452,7 @@ def test_matches_result__doesnt_match_except_prefix_clause():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -466,7 +466,7 @@ def test_matches_result__doesnt_match_except_bracket_clause():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -480,7 +480,7 @@ def test_matches_result__except_matches_other_match():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -494,7 +494,7 @@ def test_matches_result__doesnt_match_except_quote():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -508,7 +508,7 @@ def test_matches_result__doesnt_match_except_field():
         keywords=["multitude", "multiple", "multicoloured", "multicolors"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -523,7 +523,7 @@ def test_matches_result__not_when_paused():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -537,7 +537,7 @@ def test_matches_word_in_quotes():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -551,7 +551,7 @@ def test_matches_word_in_tag():
         keywords=["example", "submission", "keywords"],
     ).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -561,7 +561,7 @@ def test_matches_with_rating():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="Deer plays in woods", rating=Rating.GENERAL).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -571,7 +571,7 @@ def test_matches_not_rating():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="Deer 'plays' in woods", rating=Rating.ADULT).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -581,7 +581,7 @@ def test_matches_negative_rating():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="Deer 'plays' in woods", rating=Rating.MATURE).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -591,7 +591,7 @@ def test_matches_not_negative_rating():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="Deer plays in woods", rating=Rating.GENERAL).build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -603,8 +603,8 @@ def test_matches_general_rating():
     subscription2 = Subscription(query2, 12432)
     submission = SubmissionBuilder(title="Deer plays in woods", rating=Rating.GENERAL).build_full_submission()
 
-    match1 = subscription1.matches_result(submission, AndQuery([]))
-    match2 = subscription2.matches_result(submission, AndQuery([]))
+    match1 = subscription1.matches_result(submission.to_query_target(), None)
+    match2 = subscription2.matches_result(submission.to_query_target(), None)
 
     assert match1
     assert match2
@@ -617,8 +617,8 @@ def test_matches_mature_rating():
     subscription2 = Subscription(query2, 12432)
     submission = SubmissionBuilder(title="Deer plays in woods", rating=Rating.MATURE).build_full_submission()
 
-    match1 = subscription1.matches_result(submission, AndQuery([]))
-    match2 = subscription2.matches_result(submission, AndQuery([]))
+    match1 = subscription1.matches_result(submission.to_query_target(), None)
+    match2 = subscription2.matches_result(submission.to_query_target(), None)
 
     assert match1
     assert match2
@@ -631,8 +631,8 @@ def test_matches_explicit_rating():
     subscription2 = Subscription(query2, 12432)
     submission = SubmissionBuilder(title="Deer plays in woods", rating=Rating.ADULT).build_full_submission()
 
-    match1 = subscription1.matches_result(submission, AndQuery([]))
-    match2 = subscription2.matches_result(submission, AndQuery([]))
+    match1 = subscription1.matches_result(submission.to_query_target(), None)
+    match2 = subscription2.matches_result(submission.to_query_target(), None)
 
     assert match1
     assert match2
@@ -647,9 +647,9 @@ def test_matches_result__doesnt_match_blocklisted_rating():
         keywords=["example", "submission", "keywords"],
         rating=Rating.ADULT,
     ).build_full_submission()
-    blocklist = AndQuery([NotQuery(RatingQuery(Rating.ADULT)), NotQuery(RatingQuery(Rating.MATURE))])
+    blocklist = compile_query(AndQuery([NotQuery(RatingQuery(Rating.ADULT)), NotQuery(RatingQuery(Rating.MATURE))]))
 
-    match = subscription.matches_result(submission, blocklist)
+    match = subscription.matches_result(submission.to_query_target(), blocklist)
 
     assert not match
 
@@ -659,7 +659,7 @@ def test_matches_result__prefix_matches():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="deertaur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -669,7 +669,7 @@ def test_matches_result__prefix_matches_case_insensitive():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="Deertaur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -679,7 +679,7 @@ def test_matches_result__prefix_doesnt_match_term():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="deer plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -689,7 +689,7 @@ def test_matches_result__suffix_matches():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="deertaur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -699,7 +699,7 @@ def test_matches_result__suffix_matches_case_insensitive():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="DeerTaur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -709,7 +709,7 @@ def test_matches_result__suffix_doesnt_match_term():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="taur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert not match
 
@@ -719,7 +719,7 @@ def test_matches_result__regex_matches():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="deertaur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -729,7 +729,7 @@ def test_matches_result__regex_matches_case_insensitive():
     subscription = Subscription(query, 12432)
     submission = SubmissionBuilder(title="DeerTaur plays in woods").build_full_submission()
 
-    match = subscription.matches_result(submission, AndQuery([]))
+    match = subscription.matches_result(submission.to_query_target(), None)
 
     assert match
 
@@ -0,0 +1,149 @@
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.query_parser import parse_query
+from fa_search_bot.subscriptions.query_target import AnyField, ArtistField, QueryTarget
+from fa_search_bot.subscriptions.subscription_index import (
+    ArtistIndex,
+    SubscriptionIndex,
+    query_artist_names,
+    query_index_terms,
+)
+
+
+def _target(
+        title: str = "",
+        description: str = "",
+        keywords: list[str] = None,
+        artist: str = "artist",
+        rating: Rating = Rating.GENERAL,
+) -> QueryTarget:
+    return QueryTarget(
+        SubmissionID("fa", "12345"),
+        [title],
+        [description],
+        keywords or [],
+        [artist],
+        rating,
+    )
+
+
+def test_query_index_terms__word():
+    assert query_index_terms(parse_query("Dragon")) == {(AnyField, "dragon")}
+
+
+def test_query_index_terms__field():
+    assert query_index_terms(parse_query("artist:Fender")) == {(ArtistField, "fender")}
+
+
+def test_query_index_terms__and_picks_one_side():
+    assert query_index_terms(parse_query("rating:general dragon")) == {(AnyField, "dragon")}
+
+
+def test_query_index_terms__or_takes_union():
+    assert query_index_terms(parse_query("dragon or wolf")) == {(AnyField, "dragon"), (AnyField, "wolf")}
+
+
+def test_query_index_terms__phrase():
+    assert query_index_terms(parse_query('"red dragons"')) == {(AnyField, "dragons")}
+
+
+def test_query_index_terms__rating():
+    assert query_index_terms(parse_query("rating:adult")) == {Rating.ADULT}
+
+
+def test_query_index_terms__exception_uses_word():
+    assert query_index_terms(parse_query('dragon except "dragon ball"')) == {(AnyField, "dragon")}
+
+
+def test_query_index_terms__unindexable():
+    assert query_index_terms(parse_query("-dragon")) is None
+    assert query_index_terms(parse_query("drag*")) is None
+    assert query_index_terms(parse_query("d*g*n")) is None
+    assert query_index_terms(parse_query("dragon or -wolf")) is None
+
+
+def test_candidates__matching_word():
+    index = SubscriptionIndex()
+    index.add("dragon", parse_query("dragon"))
+    index.add("wolf", parse_query("wolf"))
+
+    candidates = index.candidates(_target(title="A red dragon"))
+
+    assert candidates == {"dragon"}
+
+
+def test_candidates__includes_unindexed():
+    index = SubscriptionIndex()
+    index.add("dragon", parse_query("dragon"))
+    index.add("not_wolf", parse_query("-wolf"))
+
+    candidates = index.candidates(_target(title="A picture of a fox"))
+
+    assert candidates == {"not_wolf"}
+    assert index.count_unindexed() == 1
+
+
+def test_candidates__field_specific():
+    index = SubscriptionIndex()
+    index.add("artist", parse_query("artist:dragon"))
+
+    assert index.candidates(_target(title="dragon")) == set()
+    assert index.candidates(_target(artist="Dragon")) == {"artist"}
+
+
+def test_candidates__phrase_in_keyword():
+    index = SubscriptionIndex()
+    index.add("phrase", parse_query('keyword:"dragon"'))
+
+    assert index.candidates(_target(keywords=["red dragon"])) == {"phrase"}
+
+
+def test_candidates__rating():
+    index = SubscriptionIndex()
+    index.add("adult", parse_query("rating:adult"))
+
+    assert index.candidates(_target(rating=Rating.GENERAL)) == set()
+    assert index.candidates(_target(rating=Rating.ADULT)) == {"adult"}
+
+
+def test_remove():
+    index = SubscriptionIndex()
+    index.add("dragon", parse_query("dragon"))
+    index.add("not_wolf", parse_query("-wolf"))
+
+    index.remove("dragon")
+    index.remove("not_wolf")
+
+    assert index.candidates(_target(title="dragon")) == set()
+    assert len(index) == 0
+
+
+def test_query_artist_names():
+    assert query_artist_names(parse_query("artist:Fender")) == {"fender"}
+    assert query_artist_names(parse_query("artist:fender or artist:Zummeng")) == {"fender", "zummeng"}
+    assert query_artist_names(parse_query("artist:fender -rating:general")) == {"fender"}
+    assert query_artist_names(parse_query("(artist:fender or artist:zummeng) rating:adult")) == {"fender", "zummeng"}
+
+
+def test_query_artist_names__not_only_artist():
+    assert query_artist_names(parse_query("fender")) is None
+    assert query_artist_names(parse_query("artist:fender dragon")) is None
+    assert query_artist_names(parse_query("artist:fender or rating:adult")) is None
+    assert query_artist_names(parse_query("artist:fender artist:zummeng")) is None
+    assert query_artist_names(parse_query("-artist:fender")) is None
+    assert query_artist_names(parse_query("artist:fend*")) is None
+
+
+def test_artist_index():
+    index = ArtistIndex()
+    index.add("fender", frozenset(["fender"]))
+    index.add("both", frozenset(["fender", "zummeng"]))
+
+    assert index.matches(_target(artist="Fender")) == {"fender", "both"}
+    assert index.matches(_target(artist="zummeng")) == {"both"}
+    assert index.matches(_target(artist="fendr")) == set()
+
+    index.remove("both")
+
+    assert index.matches(_target(artist="zummeng")) == set()
+    assert len(index) == 1
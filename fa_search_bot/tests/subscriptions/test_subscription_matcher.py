@@ -0,0 +1,287 @@
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.query_parser import parse_query
+from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.subscription import DestinationBlocklist, Subscription
+from fa_search_bot.subscriptions.subscription_matcher import SubscriptionMatcher, query_key
+
+
+def _target(
+        title: str = "",
+        description: str = "",
+        keywords: list[str] = None,
+        artist: str = "artist",
+        rating: Rating = Rating.GENERAL,
+) -> QueryTarget:
+    return QueryTarget(
+        SubmissionID("fa", "12345"),
+        [title],
+        [description],
+        keywords or [],
+        [artist],
+        rating,
+    )
+
+
+def test_query_key__case_insensitive():
+    assert query_key("Dragon AND wolf") == query_key("dragon and WOLF")
+
+
+def test_add_subscription__shares_group():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("Dragon", 54321)
+    sub3 = Subscription("wolf", 12345)
+
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+    matcher.add_subscription(sub3)
+
+    assert matcher.count_distinct_queries() == 2
+    assert matcher.subscription_groups[sub1] is matcher.subscription_groups[sub2]
+
+
+def test_remove_subscription__removes_empty_group():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("dragon", 54321)
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+
+    matcher.remove_subscription(sub1)
+    assert matcher.count_distinct_queries() == 1
+    matcher.remove_subscription(sub2)
+    assert matcher.count_distinct_queries() == 0
+    assert all(len(rating_index) == 0 for rating_index in matcher.rating_indexes.values())
+
+
+def test_match__all_destinations():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("DRAGON", 54321)
+    sub3 = Subscription("wolf", 12345)
+    for sub in [sub1, sub2, sub3]:
+        matcher.add_subscription(sub)
+
+    result = matcher.match(_target(title="A red dragon"))
+
+    assert set(result) == {sub1, sub2}
+
+
+def test_match__skips_paused():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("dragon", 54321)
+    sub2.paused = True
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+
+    result = matcher.match(_target(title="dragon"))
+
+    assert result == [sub1]
+
+
+def test_set_paused__removes_from_hot_set():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("wolf", 12345)
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+
+    sub1.paused = True
+    matcher.set_paused(sub1)
+
+    assert matcher.count_distinct_queries() == 1
+    assert sub1 not in matcher.subscription_groups
+    assert matcher.match(_target(title="dragon and wolf")) == [sub2]
+    sub1.paused = False
+    matcher.set_paused(sub1)
+    assert set(matcher.match(_target(title="dragon and wolf"))) == {sub1, sub2}
+
+
+def test_remove_subscription__paused():
+    matcher = SubscriptionMatcher({})
+    sub = Subscription("dragon", 12345)
+    sub.paused = True
+    matcher.add_subscription(sub)
+
+    matcher.remove_subscription(sub)
+
+    assert not matcher.paused_subscriptions
+    assert sub not in matcher.subscription_generations
+
+
+def test_generations():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("wolf", 54321)
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+    assert matcher.generation == 2
+    assert matcher.subscription_generations == {sub1: 1, sub2: 2}
+
+    sub1.paused = True
+    matcher.set_paused(sub1)
+    matcher.set_paused(sub1)
+    assert matcher.generation == 3
+    assert matcher.subscription_generations[sub1] == 3
+
+    matcher.add_block_query(54321, parse_query("red"))
+    assert matcher.generation == 4
+    assert matcher.destination_generations == {54321: 4}
+
+    matcher.remove_subscription(sub2)
+    assert matcher.generation == 5
+    assert sub2 not in matcher.subscription_generations
+
+
+def test_changed_since():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("wolf", 54321)
+    sub3 = Subscription("fox", 54321)
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+    matcher.add_subscription(sub3)
+    generation = matcher.generation
+
+    sub1.paused = True
+    matcher.set_paused(sub1)
+    matcher.add_block_query(54321, parse_query("red"))
+
+    assert matcher.changed_since(sub1, generation)
+    assert matcher.changed_since(sub2, generation)
+    assert not matcher.changed_since(sub2, matcher.generation)
+    matcher.remove_subscription(sub3)
+    assert matcher.changed_since(sub3, matcher.generation)
+
+
+def test_changed_since__unchanged():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("wolf", 54321)
+    matcher.add_subscription(sub1)
+    generation = matcher.generation
+
+    matcher.add_subscription(sub2)
+    matcher.add_block_query(54321, parse_query("red"))
+
+    assert not matcher.changed_since(sub1, generation)
+
+
+def test_match__applies_blocklist_per_destination():
+    blocklists = {54321: DestinationBlocklist.from_query(54321, "red")}
+    matcher = SubscriptionMatcher(blocklists)
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("dragon", 54321)
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+
+    result = matcher.match(_target(title="A red dragon"))
+
+    assert result == [sub1]
+
+
+def test_match__restricted_to_given_subscriptions():
+    matcher = SubscriptionMatcher({})
+    sub1 = Subscription("dragon", 12345)
+    sub2 = Subscription("dragon", 54321)
+    matcher.add_subscription(sub1)
+    matcher.add_subscription(sub2)
+
+    result = matcher.match(_target(title="dragon"), {sub2})
+
+    assert result == [sub2]
+
+
+def test_match__blocklist_checked_once_per_destination():
+    blocklist = DestinationBlocklist.from_query(12345, "red")
+    matcher = SubscriptionMatcher({12345: blocklist})
+    subs = [Subscription("dragon", 12345), Subscription("wolf", 12345), Subscription("fox", 12345)]
+    for sub in subs:
+        matcher.add_subscription(sub)
+    calls = []
+    compiled = blocklist.as_rating_query(Rating.GENERAL)
+    blocklist._rating_queries[Rating.GENERAL] = lambda target: calls.append(target) or compiled(target)
+
+    result = matcher.match(_target(title="A dragon, a wolf, and a fox"))
+
+    assert set(result) == set(subs)
+    assert len(calls) == 1
+
+
+def test_match_batch__same_as_match():
+    blocklists = {54321: DestinationBlocklist.from_query(54321, "red")}
+    matcher = SubscriptionMatcher(blocklists)
+    subs = [
+        Subscription("dragon", 12345),
+        Subscription("dragon", 54321),
+        Subscription("wolf or fox", 54321),
+        Subscription("-dragon", 12345),
+    ]
+    for sub in subs:
+        matcher.add_subscription(sub)
+    targets = [
+        _target(title="A red dragon"),
+        _target(title="A dragon"),
+        _target(title="A red fox"),
+        _target(title="A wolf"),
+    ]
+
+    results = matcher.match_batch(targets)
+
+    assert [set(result) for result in results] == [set(matcher.match(target)) for target in targets]
+    assert set(results[1]) == {subs[0], subs[1]}
+
+
+def test_match__only_checks_rating_bucket():
+    matcher = SubscriptionMatcher({})
+    sub_adult = Subscription("dragon rating:adult", 12345)
+    sub_not_general = Subscription("dragon -rating:general", 12345)
+    sub_any = Subscription("dragon", 12345)
+    for sub in [sub_adult, sub_not_general, sub_any]:
+        matcher.add_subscription(sub)
+
+    assert matcher.count_rating_queries(Rating.GENERAL) == 1
+    assert matcher.count_rating_queries(Rating.MATURE) == 2
+    assert matcher.count_rating_queries(Rating.ADULT) == 3
+    assert matcher.match(_target(title="dragon")) == [sub_any]
+    assert set(matcher.match(_target(title="dragon", rating=Rating.ADULT))) == {sub_adult, sub_not_general, sub_any}
+    assert matcher.match(_target(title="dragon"), {sub_adult}) == []
+
+    matcher.remove_subscription(sub_not_general)
+
+    assert matcher.count_rating_queries(Rating.MATURE) == 1
+    assert matcher.count_rating_queries(Rating.ADULT) == 2
+
+
+def test_match__blocklist_skips_other_ratings():
+    blocklist = DestinationBlocklist(12345, {})
+    blocklist.add("rating:adult")
+    blocklist.add("wolf rating:mature")
+    matcher = SubscriptionMatcher({12345: blocklist})
+    sub = Subscription("dragon", 12345)
+    matcher.add_subscription(sub)
+
+    assert matcher.match(_target(title="dragon wolf")) == [sub]
+    assert matcher.match(_target(title="dragon wolf", rating=Rating.MATURE)) == []
+    assert matcher.match(_target(title="dragon", rating=Rating.MATURE)) == [sub]
+    assert matcher.match(_target(title="dragon", rating=Rating.ADULT)) == []
+
+
+def test_match__artist_queries_not_evaluated():
+    matcher = SubscriptionMatcher({})
+    sub = Subscription("artist:Fender or artist:zummeng", 12345)
+    sub_adult = Subscription("artist:fender rating:adult", 12345)
+    matcher.add_subscription(sub)
+    matcher.add_subscription(sub_adult)
+    for group in matcher.groups.values():
+        group.compiled_query = None
+        group.batch_query = None
+
+    assert matcher.count_artist_queries() == 2
+    assert matcher.match(_target(title="dragon", artist="fender")) == [sub]
+    assert set(matcher.match(_target(artist="zummeng", rating=Rating.ADULT))) == {sub}
+    assert set(matcher.match(_target(artist="FENDER", rating=Rating.ADULT))) == {sub, sub_adult}
+    assert matcher.match(_target(artist="fender", rating=Rating.ADULT), {sub_adult}) == [sub_adult]
+    assert matcher.match_batch([_target(artist="fender"), _target(artist="other")]) == [[sub], []]
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from asyncio import QueueEmpty
+from unittest.mock import Mock
+
+import pytest
+
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.runnable import Runnable
+from fa_search_bot.subscriptions.wait_pool import StageSignal, WaitPool
+
+
+class _IdleRunnable(Runnable):
+    async def do_process(self) -> None:
+        pass
+
+    async def revert_last_attempt(self) -> None:
+        pass
+
+
+def _sub_id(num: int) -> SubmissionID:
+    return SubmissionID("fa", str(num))
+
+
+async def _fetched_pool(*nums: int) -> WaitPool:
+    pool = WaitPool()
+    for num in nums:
+        await pool.add_sub_id(_sub_id(num))
+    for num in nums:
+        await pool.set_fetched_data(_sub_id(num), Mock(submission_id=_sub_id(num)), [])
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_get_next_for_media_download__lowest_id_first():
+    pool = await _fetched_pool(30, 100, 9)
+
+    assert (await pool.get_next_for_media_download()).submission_id == _sub_id(9)
+    assert (await pool.get_next_for_media_download()).submission_id == _sub_id(30)
+    assert (await pool.get_next_for_media_download()).submission_id == _sub_id(100)
+    with pytest.raises(QueueEmpty):
+        await pool.get_next_for_media_download()
+
+
+@pytest.mark.asyncio
+async def test_get_next_for_media_upload__only_downloaded():
+    pool = await _fetched_pool(1, 2, 3)
+    await pool.set_downloaded(_sub_id(3), (Mock(), Mock()))
+    await pool.set_downloaded(_sub_id(2), (Mock(), Mock()))
+
+    assert (await pool.get_next_for_media_upload()).sub_id == _sub_id(2)
+    assert (await pool.get_next_for_media_upload()).sub_id == _sub_id(3)
+    with pytest.raises(QueueEmpty):
+        await pool.get_next_for_media_upload()
+
+
+@pytest.mark.asyncio
+async def test_revert_data_fetch__requeues_for_download():
+    pool = await _fetched_pool(1, 2)
+    await pool.get_next_for_media_download()
+
+    await pool.revert_data_fetch(_sub_id(1))
+    assert (await pool.get_next_for_media_download()).submission_id == _sub_id(2)
+    await pool.set_fetched_data(_sub_id(1), Mock(submission_id=_sub_id(1)), [])
+
+    assert (await pool.get_next_for_media_download()).submission_id == _sub_id(1)
+
+
+@pytest.mark.asyncio
+async def test_pop_next_ready_to_send__waits_for_lowest_id():
+    pool = await _fetched_pool(1, 2)
+    await pool.set_uploaded(_sub_id(2), Mock())
+
+    assert await pool.pop_next_ready_to_send() is None
+    await pool.set_uploaded(_sub_id(1), Mock())
+    assert (await pool.pop_next_ready_to_send()).sub_id == _sub_id(1)
+    assert (await pool.pop_next_ready_to_send()).sub_id == _sub_id(2)
+    assert await pool.pop_next_ready_to_send() is None
+    assert pool.size() == 0
+
+
+@pytest.mark.asyncio
+async def test_return_populated_state():
+    pool = await _fetched_pool(5)
+    await pool.set_uploaded(_sub_id(5), Mock())
+    state = await pool.pop_next_ready_to_send()
+
+    await pool.return_populated_state(state)
+
+    assert await pool.pop_next_ready_to_send() is state
+
+
+@pytest.mark.asyncio
+async def test_stage_signal__wakes_one_waiter():
+    signal = StageSignal()
+    loop = asyncio.get_running_loop()
+    waiters = [loop.create_future(), loop.create_future()]
+    for waiter in waiters:
+        signal.add_waiter(waiter)
+
+    signal.notify()
+
+    assert [waiter.done() for waiter in waiters] == [True, False]
+    assert signal.count_waiters() == 1
+
+
+@pytest.mark.asyncio
+async def test_stage_signal__notified_before_waiting():
+    signal = StageSignal()
+    signal.notify()
+    waiter = asyncio.get_running_loop().create_future()
+
+    signal.add_waiter(waiter)
+
+    assert waiter.done()
+    assert signal.count_waiters() == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_while_running__woken_when_ready():
+    pool = WaitPool()
+    runnable = _IdleRunnable(Mock(wait_pool=pool))
+    start = time.monotonic()
+
+    wait = asyncio.create_task(runnable._wait_while_running(10, pool.fetch_signal))
+    await asyncio.sleep(0)
+    await pool.add_sub_id(_sub_id(1))
+    await wait
+
+    assert time.monotonic() - start < 1
+    assert pool.fetch_signal.count_waiters() == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_while_running__woken_by_stop():
+    runnable = _IdleRunnable(Mock())
+    start = time.monotonic()
+
+    wait = asyncio.create_task(runnable._wait_while_running(10))
+    await asyncio.sleep(0)
+    runnable.stop()
+    await wait
+
+    assert time.monotonic() - start < 1
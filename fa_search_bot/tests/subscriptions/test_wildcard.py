@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from fa_search_bot.sites.submission import Rating
+from fa_search_bot.sites.submission_id import SubmissionID
+from fa_search_bot.subscriptions.query_parser import RegexQuery
+from fa_search_bot.subscriptions.query_target import QueryTarget
+from fa_search_bot.subscriptions.wildcard import WildcardPattern
+
+
+@pytest.mark.parametrize(
+    "pattern, word, result",
+    [
+        ("d*g*n", "dragon", True),
+        ("d*g*n", "dgn", False),
+        ("d*g*n", "dogn", False),
+        ("d*g*n", "doggn", True),
+        ("*a*", "cat", True),
+        ("*a*", "at", False),
+        ("*a*", "ca", False),
+        ("a*a", "aa", False),
+        ("a*a", "aba", True),
+        ("**", "x", True),
+        ("*ab*ab*", "xababx", False),
+        ("*ab*ab*", "xabxabx", True),
+        ("f*x", "Fox".lower(), True),
+    ]
+)
+def test_matches(pattern: str, word: str, result: bool):
+    wildcard = WildcardPattern.from_string(pattern)
+
+    assert wildcard.matches(word) is result
+
+
+def test_from_string__lower_cases():
+    assert WildcardPattern.from_string("D*G").matches("dog")
+
+
+def test_from_string__needs_regex():
+    assert WildcardPattern.from_string("a.b*c") is None
+    assert WildcardPattern.from_string("ſ*s") is None
+
+
+def test_regex_query__keyword_with_spaces():
+    query = RegexQuery.from_string_with_asterisks("d*g*n")
+    target = QueryTarget(SubmissionID("fa", "1"), [""], [""], ["red dragon"], ["artist"], Rating.GENERAL)
+
+    assert query.wildcard is not None
+    assert query.matches_submission(target)
+    assert query.compile()(target)
+
+
+def test_regex_query__pathological_input_is_linear():
+    # The regex for this pattern backtracks polynomially on a long word lacking the later segments, taking seconds
+    # for a few hundred characters, whereas the wildcard matcher should take a fraction of a second for much longer
+    query = RegexQuery.from_string_with_asterisks("*a*b*c*d*e*")
+    description = " ".join("a" * 20_000 for _ in range(10))
+    target = QueryTarget(SubmissionID("fa", "1"), [""], [description], [], ["artist"], Rating.GENERAL)
+
+    start = time.perf_counter()
+    result = query.matches_submission(target)
+    duration = time.perf_counter() - start
+
+    assert result is False
+    assert duration < 1
@@ -3,13 +3,14 @@ import logging
 import os
 import sys
 from logging.handlers import TimedRotatingFileHandler
+from typing import Optional
 
 import click
 from prometheus_client import Counter
 
 from fa_search_bot.bot import FASearchBot
 from fa_search_bot.config import Config, DEFAULT_MAX_READY_FOR_UPLOAD, DEFAULT_NUM_DATA_FETCHERS, \
-    DEFAULT_NUM_MEDIA_DOWNLOADERS, DEFAULT_NUM_MEDIA_UPLOADERS, DEFAULT_FETCH_REFRESH_LIMIT
+    DEFAULT_NUM_MEDIA_DOWNLOADERS, DEFAULT_NUM_MEDIA_UPLOADERS, DEFAULT_FETCH_REFRESH_LIMIT, DEFAULT_NUM_MATCHER_PROCESSES
 
 log_entries = Counter(
     "fasearchbot_log_messages_total",
@@ -50,6 +51,7 @@ def setup_logging(log_level: str = "INFO") -> None:
 @click.option("--sub-watcher-media-uploaders", type=int, default=DEFAULT_NUM_MEDIA_UPLOADERS, help="Number of MediaUploader tasks which should spin up in the subscription watcher")
 @click.option("--sub-watcher-max-ready-for-upload", type=int, default=DEFAULT_MAX_READY_FOR_UPLOAD, help="Maximum number of submissions which should have data and media fetched before being uploaded to Telegram, to prevent data being too stale by the time it comes to upload, especially if catching up on backlog")
 @click.option("--fetch-max-data-refresh", type=int, default=DEFAULT_FETCH_REFRESH_LIMIT, help="How many times a submission should get pushed back for data refresh before giving up and declaring the submission media to be broken")
+@click.option("--sub-watcher-matcher-processes", type=int, default=None, help=f"Number of worker processes which should match submissions against subscriptions, or 0 to match on the main event loop. Defaults to the config file's value, or {DEFAULT_NUM_MATCHER_PROCESSES} if not set there")
 def main(
         log_level: str,
         no_subscriptions: bool,
@@ -58,6 +60,7 @@ def main(
         sub_watcher_media_uploaders: int,
         sub_watcher_max_ready_for_upload: int,
         fetch_max_data_refresh: int,
+        sub_watcher_matcher_processes: Optional[int],
 ) -> None:
     setup_logging(log_level)
     # Construct config and ingest flags
@@ -68,6 +71,8 @@ def main(
     config.subscription_watcher.num_media_uploaders = sub_watcher_media_uploaders
     config.subscription_watcher.max_ready_for_upload = sub_watcher_max_ready_for_upload
     config.subscription_watcher.fetch_refresh_limit = fetch_max_data_refresh
+    if sub_watcher_matcher_processes is not None:
+        config.subscription_watcher.num_matcher_processes = sub_watcher_matcher_processes
     # Create and start the bot
     bot = FASearchBot(config)
     loop = asyncio.get_event_loop()